@@ -0,0 +1,167 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Where the time of a request goes, in its ``request_finished`` log.
+
+RequestMetricsMiddleware binds to the structlog context of the request:
+
+- ``db_queries`` and ``db_ms``, the queries of every database, timed by an
+  execute wrapper;
+- ``template_ms``, the rendering of the templates of the ``TEMPLATES``
+  backend below, the queries of lazy querysets included;
+- ``view_ms``, the rest of the view;
+- ``duration_ms``, the whole request under the middleware.
+
+A query shape, the SQL with its ``IN`` lists collapsed, run more than
+``REPEATED_QUERY_THRESHOLD`` times in a request is bound as
+``repeated_queries``, with the project code running it: usually a query in
+a loop, like a list_display column reading a relation of each row.
+
+The duration and the queries are observed in the Prometheus metrics too.
+"""
+import contextvars
+import os
+import re
+import sys
+import time
+from contextlib import ExitStack
+
+import structlog
+from django.conf import settings
+from django.db import connections
+from django.template.backends import django as backend
+
+from .metrics import observe_request, requests_in_progress
+
+REPEATED_QUERY_THRESHOLD = 10
+
+logger = structlog.get_logger(__name__)
+current = contextvars.ContextVar("request_metrics", default=None)
+
+IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+
+
+def query_shape(sql):
+    return IN_LIST.sub("IN (...)", sql)
+
+
+def call_site():
+    """Return the innermost frame of the project code as ``path:line in
+    function``, outside of this module."""
+    root = str(settings.BASE_DIR)
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (
+            filename.startswith(root)
+            and filename != __file__
+            and "site-packages" not in filename
+        ):
+            path = os.path.relpath(filename, root)
+            return f"{path}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.shapes = {}
+        self.sites = {}
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            shape = query_shape(sql)
+            count = self.shapes[shape] = self.shapes.get(shape, 0) + 1
+            if count == REPEATED_QUERY_THRESHOLD + 1:
+                self.sites[shape] = call_site()
+
+    def repeated_queries(self):
+        return [
+            {"sql": shape, "count": self.shapes[shape], "site": site}
+            for shape, site in self.sites.items()
+        ]
+
+
+class Template(backend.Template):
+    def render(self, context=None, request=None):
+        metrics = current.get()
+        if metrics is None:
+            return super().render(context, request)
+        # Only the outermost template, the included ones are part of it
+        metrics.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - start
+
+
+class DjangoTemplates(backend.DjangoTemplates):
+    """The Django template backend, with the rendering timed."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+def milliseconds(seconds):
+    return round(seconds * 1000, 1)
+
+
+class RequestMetricsMiddleware:
+    """Bind the metrics of the request to its log, see the module docstring.
+
+    Last of the MIDDLEWARE: the view time is measured from ``process_view``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        requests_in_progress.inc()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.execute))
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+            requests_in_progress.dec()
+        end = time.perf_counter()
+        observe_request(request, response, end - start, metrics.queries)
+
+        view_start = getattr(request, "_view_start", end)
+        structlog.contextvars.bind_contextvars(
+            db_queries=metrics.queries,
+            db_ms=milliseconds(metrics.db_time),
+            template_ms=milliseconds(metrics.template_time),
+            view_ms=milliseconds(max(end - view_start - metrics.template_time, 0)),
+            duration_ms=milliseconds(end - start),
+        )
+        repeated = metrics.repeated_queries()
+        if repeated:
+            structlog.contextvars.bind_contextvars(repeated_queries=repeated)
+            logger.warning("repeated_queries", queries=repeated)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._view_start = time.perf_counter()
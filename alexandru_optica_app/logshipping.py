@@ -0,0 +1,174 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Shipping of the logs to Loki without blocking the requests.
+
+``emit`` only appends the formatted record to a ring buffer of ``capacity``
+records; when it is full, the oldest record is dropped and counted in
+``dropped``. A background thread sends the buffer in gzip compressed
+batches of at most ``batch_size`` records or ``batch_bytes`` bytes, as soon
+as a batch is full or every ``interval`` seconds. A batch the sink fails to
+take is dropped too, and counted in ``failed``: a slow or missing collector
+costs at most ``capacity`` records of memory per worker.
+
+The buffer and the thread belong to the process that created them: a worker
+forked by the server starts its own on its first record.
+
+The batches go to the Loki push ``url``, or are appended to the gzip file
+``path``, for the tests and the load tests without a collector (see also
+the ``serve_log_sink`` command).
+"""
+import gzip
+import json
+import logging
+import os
+import threading
+import urllib.request
+from collections import deque
+
+
+class HttpSink:
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, payload):
+        request = urllib.request.Request(
+            self.url,
+            data=payload,
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class FileSink:
+    """Append the batches to a file, one JSON per line once decompressed."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, payload):
+        with open(self.path, "ab") as file:
+            file.write(payload)
+
+
+class LokiHandler(logging.Handler):
+    def __init__(
+        self,
+        url=None,
+        path=None,
+        tags=None,
+        capacity=10000,
+        batch_size=500,
+        batch_bytes=1024 * 1024,
+        interval=2.0,
+        level=logging.NOTSET,
+    ):
+        super().__init__(level)
+        if (url is None) == (path is None):
+            raise ValueError("LokiHandler needs either a url or a path.")
+        self.sink = HttpSink(url) if url is not None else FileSink(path)
+        self.tags = tags or {}
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.interval = interval
+        self.dropped = self.failed = self.sent = 0
+        self._pid = None
+
+    def _start(self):
+        """Create the buffer and the flusher of this process."""
+        self._pid = os.getpid()
+        self._buffer = deque(maxlen=self.capacity)
+        self._buffer_bytes = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="log-shipping", daemon=True
+        )
+        self._thread.start()
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        labels = {
+            **self.tags,
+            "severity": record.levelname.lower(),
+            "logger": record.name,
+        }
+        entry = (labels, str(int(record.created * 1e9)), line)
+        # Called with self.lock held, like the flusher taking the records
+        if self._pid != os.getpid():
+            self._start()
+        if len(self._buffer) == self.capacity:
+            self.dropped += 1
+            self._buffer_bytes -= len(self._buffer[0][2])
+        self._buffer.append(entry)
+        self._buffer_bytes += len(line)
+        if (
+            len(self._buffer) >= self.batch_size
+            or self._buffer_bytes >= self.batch_bytes
+        ):
+            self._wake.set()
+
+    def _take_batch(self):
+        batch, size = [], 0
+        with self.lock:
+            while self._buffer and len(batch) < self.batch_size:
+                if batch and size + len(self._buffer[0][2]) > self.batch_bytes:
+                    break
+                entry = self._buffer.popleft()
+                size += len(entry[2])
+                batch.append(entry)
+            self._buffer_bytes -= size
+        return batch
+
+    def _send(self, batch):
+        streams = {}
+        for labels, timestamp, line in batch:
+            key = tuple(sorted(labels.items()))
+            streams.setdefault(key, []).append([timestamp, line])
+        payload = json.dumps(
+            {
+                "streams": [
+                    {"stream": dict(key), "values": values}
+                    for key, values in streams.items()
+                ]
+            }
+        )
+        try:
+            self.sink.send(gzip.compress(f"{payload}\n".encode(), compresslevel=5))
+        except Exception:
+            with self.lock:
+                self.failed += len(batch)
+        else:
+            with self.lock:
+                self.sent += len(batch)
+
+    def flush(self):
+        """Send the buffer of this process."""
+        if self._pid != os.getpid():
+            return
+        while batch := self._take_batch():
+            self._send(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def close(self):
+        if self._pid == os.getpid():
+            self._stop.set()
+            self._wake.set()
+            self._thread.join(self.interval)
+            self.flush()
+        super().close()
@@ -0,0 +1,338 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Prometheus metrics, shared by the worker processes.
+
+Each process writes its values in its own file of ``METRICS_DIR``, mapped in
+memory: an update is a write in the mapping, without a system call nor a
+lock between the processes. ``metrics_view`` sums the files of every process
+at scrape time, and renders them in the Prometheus text format. The counters
+of the processes gone stay in the sums; the gauges only count the processes
+alive, or are computed at scrape time by their ``function``.
+
+The request metrics are observed by
+``alexandru_optica_app.instrumentation.RequestMetricsMiddleware``.
+"""
+import bisect
+import functools
+import hmac
+import json
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+INITIAL_SIZE = 64 * 1024
+HEADER = struct.Struct("i4x")
+KEY_LENGTH = struct.Struct("i")
+VALUE = struct.Struct("d")
+
+REGISTRY = {}
+
+
+def padded_length(key):
+    """Length of ``key`` padded for its value to be aligned on 8 bytes."""
+    return len(key) + (8 - (len(key) + KEY_LENGTH.size) % 8) % 8
+
+
+class MmapedDict:
+    """Float values by key in a file: the used size, then for each value the
+    length of its key, the key padded and the value."""
+
+    def __init__(self, path):
+        self.file = open(path, "a+b")
+        size = os.fstat(self.file.fileno()).st_size
+        if size == 0:
+            self.file.truncate(INITIAL_SIZE)
+            size = INITIAL_SIZE
+        self.capacity = size
+        self.map = mmap.mmap(self.file.fileno(), self.capacity)
+        self.used = HEADER.unpack_from(self.map, 0)[0]
+        if self.used == 0:
+            self.used = HEADER.size
+            HEADER.pack_into(self.map, 0, self.used)
+        self.positions = {
+            key: position for key, _, position in self.entries(self.map, self.used)
+        }
+
+    @staticmethod
+    def entries(data, used):
+        position = HEADER.size
+        while position < used:
+            (length,) = KEY_LENGTH.unpack_from(data, position)
+            position += KEY_LENGTH.size
+            (key,) = struct.unpack_from(f"{length}s", data, position)
+            key = key.decode()
+            position += padded_length(key.encode())
+            (value,) = VALUE.unpack_from(data, position)
+            yield key, value, position
+            position += VALUE.size
+
+    @classmethod
+    def read(cls, path):
+        """Return the ``(key, value)`` of the file, written by any process."""
+        data = Path(path).read_bytes()
+        if len(data) < HEADER.size:
+            return []
+        used = HEADER.unpack_from(data, 0)[0]
+        return [(key, value) for key, value, _ in cls.entries(data, used)]
+
+    def _add_key(self, key):
+        encoded = key.encode()
+        entry = (
+            KEY_LENGTH.pack(len(encoded))
+            + encoded.ljust(padded_length(encoded), b" ")
+            + VALUE.pack(0.0)
+        )
+        while self.used + len(entry) > self.capacity:
+            self.capacity *= 2
+            self.file.truncate(self.capacity)
+            self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), self.capacity)
+        self.map.seek(self.used)
+        self.map.write(entry)
+        self.positions[key] = self.used + len(entry) - VALUE.size
+        # The entry is complete before the readers see it
+        self.used += len(entry)
+        HEADER.pack_into(self.map, 0, self.used)
+
+    def get(self, key):
+        position = self.positions.get(key)
+        return 0.0 if position is None else VALUE.unpack_from(self.map, position)[0]
+
+    def set(self, key, value):
+        if key not in self.positions:
+            self._add_key(key)
+        VALUE.pack_into(self.map, self.positions[key], value)
+
+
+class Store:
+    """The file of the current process, opened again after a fork."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.opened = None
+        self.values = None
+
+    def file(self):
+        state = (os.getpid(), str(settings.METRICS_DIR))
+        if self.opened != state:
+            directory = Path(settings.METRICS_DIR)
+            directory.mkdir(parents=True, exist_ok=True)
+            self.values = MmapedDict(directory / f"{state[0]}.db")
+            self.opened = state
+            # A process of the same pid before this one
+            for key in list(self.values.positions):
+                if json.loads(key)[0] in GAUGES:
+                    self.values.set(key, 0.0)
+        return self.values
+
+    def add(self, key, amount):
+        with self.lock:
+            values = self.file()
+            values.set(key, values.get(key) + amount)
+
+
+store = Store()
+GAUGES = set()
+
+
+@functools.lru_cache(maxsize=4096)
+def _sample_key(name, labels):
+    return json.dumps([name, sorted(labels)])
+
+
+def sample_key(name, labels):
+    return _sample_key(name, tuple(labels.items()))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY[name] = self
+
+    def labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} has the labels {self.labelnames}.")
+        return {name: str(value) for name, value in labels.items()}
+
+    def samples(self, values):
+        """Return the ``(name, labels, value)`` of the merged ``values``."""
+        return [
+            (name, dict(labels), value)
+            for (name, labels), value in sorted(values.items())
+            if name == self.name
+        ]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        store.add(sample_key(self.name, self.labels(labels)), amount)
+
+
+class Gauge(Metric):
+    """Sum of the values of the processes alive, or the value returned by
+    ``function`` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+        GAUGES.add(name)
+
+    def inc(self, amount=1, **labels):
+        store.add(sample_key(self.name, self.labels(labels)), amount)
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self, values):
+        if self.function is not None:
+            return [(self.name, {}, float(self.function()))]
+        return super().samples(values)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = [*sorted(buckets), float("inf")]
+
+    def observe(self, value, **labels):
+        labels = self.labels(labels)
+        bound = self.buckets[bisect.bisect_left(self.buckets, value)]
+        store.add(sample_key(f"{self.name}_bucket", {**labels, "le": str(bound)}), 1)
+        store.add(sample_key(f"{self.name}_sum", labels), value)
+
+    def samples(self, values):
+        series = {}
+        for (name, labels), value in values.items():
+            if name in (f"{self.name}_bucket", f"{self.name}_sum"):
+                labels = dict(labels)
+                bound = labels.pop("le", None)
+                counts = series.setdefault(tuple(sorted(labels.items())), {})
+                counts[bound] = value
+        samples = []
+        for labels, counts in sorted(series.items()):
+            labels = dict(labels)
+            count = 0
+            for bound in self.buckets:
+                count += counts.get(str(bound), 0)
+                le = "+Inf" if bound == float("inf") else str(bound)
+                samples.append((f"{self.name}_bucket", {**labels, "le": le}, count))
+            samples.append((f"{self.name}_sum", labels, counts.get(None, 0)))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    """Sum the values of the files of every process, by sample."""
+    values = {}
+    for path in Path(settings.METRICS_DIR).glob("*.db"):
+        alive = None
+        for key, value in MmapedDict.read(path):
+            name, labels = json.loads(key)
+            if name in GAUGES:
+                if alive is None:
+                    alive = is_alive(int(path.stem))
+                if not alive:
+                    continue
+            sample = (name, tuple(tuple(label) for label in labels))
+            values[sample] = values.get(sample, 0) + value
+    return values
+
+
+def format_value(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def escape(value):
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def exposition():
+    """Return the metrics of every process in the Prometheus text format."""
+    values = collect() if Path(settings.METRICS_DIR).is_dir() else {}
+    lines = []
+    for name, metric in sorted(REGISTRY.items()):
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for sample, labels, value in metric.samples(values):
+            if labels:
+                pairs = ",".join(
+                    f'{label}="{escape(str(v))}"' for label, v in labels.items()
+                )
+                sample = f"{sample}{{{pairs}}}"
+            lines.append(f"{sample} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """The metrics, for the staff users or the ``METRICS_TOKEN`` bearer."""
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get("Authorization", "")
+    allowed = request.user.is_active and request.user.is_staff
+    if token and authorization.startswith("Bearer "):
+        allowed = hmac.compare_digest(authorization.removeprefix("Bearer "), token)
+    if not allowed:
+        return JsonResponse({"error": "Permission denied."}, status=403)
+    return HttpResponse(
+        exposition(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+requests_total = Counter(
+    "http_requests_total", "Requests by URL name and status class.", ["view", "status"]
+)
+request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Duration of the requests by URL name.",
+    ["view"],
+    REQUEST_BUCKETS,
+)
+request_queries = Histogram(
+    "http_request_db_queries",
+    "Database queries of the requests by URL name.",
+    ["view"],
+    QUERY_BUCKETS,
+)
+requests_in_progress = Gauge(
+    "http_requests_in_progress", "Requests being served, by every process."
+)
+
+
+def observe_request(request, response, duration, queries):
+    match = getattr(request, "resolver_match", None)
+    view = match.view_name if match else "(unresolved)"
+    requests_total.inc(view=view, status=f"{response.status_code // 100}xx")
+    request_duration.observe(duration, view=view)
+    request_queries.observe(queries, view=view)
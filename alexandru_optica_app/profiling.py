@@ -0,0 +1,242 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Sampling profiler of the requests, for the slowness seen in production.
+
+ProfilingMiddleware profiles a ``PROFILING_SAMPLE_RATE`` fraction of the
+requests, 0 by default, and every request with an ``X-Profile`` header
+signed by ``debug_token``. While a profiled request runs, one thread per
+process reads the stack of the request thread every ``SAMPLE_INTERVAL``; the
+stacks are added, collapsed, to the profile of the URL name of the request,
+``admin:optica_app_order_changelist`` say.
+
+The profiles are kept in memory, for each process: at most
+``MAX_ENDPOINTS`` URL names of at most ``MAX_STACKS`` stacks, the least
+sampled ones are merged into one ``(other)`` stack. ``profiles_view`` shows
+their top frames to the staff users, ``profiles_export_view`` the collapsed
+stacks read by flamegraph.pl or speedscope.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core import signing
+from django.http import HttpResponse
+from django.template.response import TemplateResponse
+
+SAMPLE_INTERVAL = 0.005
+MAX_ENDPOINTS = 200
+MAX_STACKS = 1000
+TOP_FRAMES = 40
+HEADER = "X-Profile"
+TOKEN_MAX_AGE = 3600
+OTHER = "(other)"
+
+signer = signing.TimestampSigner(salt="alexandru_optica_app.profiling")
+
+
+def debug_token():
+    """Value of the ``X-Profile`` header profiling a request, for an hour."""
+    return signer.sign("profile")
+
+
+def frame_label(frame):
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_qualname}"
+
+
+def collapse(frame, root):
+    """Return the stack from ``root`` to ``frame`` as ``a;b;c``."""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        if frame is root:
+            break
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class Sampler:
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self._pid = None
+
+    def _start(self):
+        """Create the sampling thread of this process."""
+        self._pid = os.getpid()
+        self.active = {}
+        self._busy = threading.Event()
+        threading.Thread(target=self._run, name="profiler", daemon=True).start()
+
+    @contextmanager
+    def profile(self, root):
+        """Sample the stacks of the current thread above the ``root`` frame,
+        yield their counts."""
+        stacks = Counter()
+        thread_id = threading.get_ident()
+        with self.lock:
+            if self._pid != os.getpid():
+                self._start()
+            self.active[thread_id] = (root, stacks)
+            self._busy.set()
+        try:
+            yield stacks
+        finally:
+            with self.lock:
+                del self.active[thread_id]
+                if not self.active:
+                    self._busy.clear()
+
+    def _run(self):
+        while True:
+            self._busy.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, (root, stacks) in self.active.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[collapse(frame, root)] += 1
+
+
+class ProfileStore:
+    def __init__(self, max_endpoints=MAX_ENDPOINTS, max_stacks=MAX_STACKS):
+        self.max_endpoints = max_endpoints
+        self.max_stacks = max_stacks
+        self.lock = threading.Lock()
+        self.profiles = {}
+
+    def add(self, endpoint, stacks):
+        with self.lock:
+            full = len(self.profiles) >= self.max_endpoints
+            if full and endpoint not in self.profiles:
+                endpoint = OTHER
+            profile = self.profiles.setdefault(
+                endpoint, {"requests": 0, "samples": 0, "stacks": Counter()}
+            )
+            profile["requests"] += 1
+            profile["samples"] += sum(stacks.values())
+            profile["stacks"].update(stacks)
+            if len(profile["stacks"]) > self.max_stacks:
+                kept = Counter(dict(profile["stacks"].most_common(self.max_stacks)))
+                kept[OTHER] += profile["stacks"].total() - kept.total()
+                profile["stacks"] = kept
+
+    def endpoints(self):
+        """Return the profiled URL names, the most sampled first."""
+        with self.lock:
+            rows = [
+                {"name": name, **profile, "stacks": len(profile["stacks"])}
+                for name, profile in self.profiles.items()
+            ]
+        for row in rows:
+            row["mean_ms"] = round(
+                1000 * SAMPLE_INTERVAL * row["samples"] / row["requests"]
+            )
+        return sorted(rows, key=lambda row: row["samples"], reverse=True)
+
+    def stacks(self, endpoint=None):
+        """Return the counts of the stacks of ``endpoint``, or of every URL
+        name under its own root frame."""
+        with self.lock:
+            if endpoint is not None:
+                profile = self.profiles.get(endpoint)
+                return Counter(profile["stacks"]) if profile else Counter()
+            return Counter(
+                {
+                    f"{name};{stack}": count
+                    for name, profile in self.profiles.items()
+                    for stack, count in profile["stacks"].items()
+                }
+            )
+
+    def top_frames(self, endpoint, limit=TOP_FRAMES):
+        """Return the frames of the most samples, in their own code
+        (``self``) or below them (``total``), as percents."""
+        stacks = self.stacks(endpoint)
+        samples = stacks.total()
+        if not samples:
+            return []
+        own, total = Counter(), Counter()
+        for stack, count in stacks.items():
+            labels = stack.split(";")
+            own[labels[-1]] += count
+            for label in dict.fromkeys(labels):
+                total[label] += count
+        return [
+            {
+                "frame": label,
+                "total": round(100 * count / samples, 1),
+                "self": round(100 * own[label] / samples, 1),
+            }
+            for label, count in total.most_common(limit)
+        ]
+
+    def clear(self):
+        with self.lock:
+            self.profiles = {}
+
+
+sampler = Sampler()
+store = ProfileStore()
+
+
+class ProfilingMiddleware:
+    """Profile the requests, see the module docstring."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def profiled(self, request):
+        token = request.headers.get(HEADER)
+        if token:
+            try:
+                return signer.unsign(token, max_age=TOKEN_MAX_AGE) == "profile"
+            except signing.BadSignature:
+                return False
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    def __call__(self, request):
+        if not self.profiled(request):
+            return self.get_response(request)
+        with sampler.profile(sys._getframe()) as stacks:
+            response = self.get_response(request)
+        match = request.resolver_match
+        store.add(match.view_name if match else "(unresolved)", stacks)
+        return response
+
+
+@staff_member_required
+def profiles_view(request):
+    endpoint = request.GET.get("endpoint")
+    context = {
+        **admin.site.each_context(request),
+        "title": "Request profiles",
+        "endpoints": store.endpoints(),
+        "endpoint": endpoint,
+        "frames": store.top_frames(endpoint) if endpoint else [],
+        "header": HEADER,
+        "token": debug_token(),
+        "pid": os.getpid(),
+    }
+    return TemplateResponse(request, "alexandru_optica_app/profiles.html", context)
+
+
+@staff_member_required
+def profiles_export_view(request):
+    """Collapsed stacks, one ``a;b;c count`` line per stack."""
+    stacks = store.stacks(request.GET.get("endpoint"))
+    lines = [f"{stack} {count}\n" for stack, count in stacks.most_common()]
+    response = HttpResponse("".join(lines), content_type="text/plain")
+    response["Content-Disposition"] = 'attachment; filename="profiles.folded"'
+    return response
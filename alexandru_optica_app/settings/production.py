@@ -7,3 +7,12 @@ ALLOWED_HOSTS = ["alexandru-optica.alwaysdata.net"]
 STATIC_ROOT = BASE_DIR / "static/"  # noqa
 
 LOGGING["handlers"]["console"]["formatter"] = "struct_json"  # noqa
+
+# WAL, pragmas and BEGIN IMMEDIATE, see alexandru_optica_app.sqlite
+DATABASES["default"].update(  # noqa
+    {
+        "ENGINE": "alexandru_optica_app.sqlite",
+        "CONN_MAX_AGE": 600,
+        "CONN_HEALTH_CHECKS": True,
+    }
+)
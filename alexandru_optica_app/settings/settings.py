@@ -16,7 +16,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
-import multiprocessing
+import os
 from pathlib import Path
 import structlog
 
@@ -60,13 +60,15 @@ MIDDLEWARE = [
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django_structlog.middlewares.RequestMiddleware",
+    "alexandru_optica_app.profiling.ProfilingMiddleware",
+    "alexandru_optica_app.instrumentation.RequestMetricsMiddleware",
 ]
 
 ROOT_URLCONF = "alexandru_optica_app.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "alexandru_optica_app.instrumentation.DjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -135,6 +137,16 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 SESSION_ENGINE = "django.contrib.sessions.backends.signed_cookies"
+LOGIN_URL = "admin:login"
+# Record the queries slower than this in optica_app.SlowQuery, None to disable
+SLOW_QUERY_THRESHOLD_MS = None
+# Fraction of the requests profiled by alexandru_optica_app.profiling
+PROFILING_SAMPLE_RATE = 0
+# Files of the metrics of each process, see alexandru_optica_app.metrics: to
+# empty when the server starts
+METRICS_DIR = os.environ.get("METRICS_DIR", BASE_DIR / "var" / "metrics")
+# Bearer token of the Prometheus scraper
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
 
 
 def extract_from_record(_, __, event_dict):
@@ -195,12 +207,10 @@ LOGGING = {
             "formatter": "struct_legacy",
         },
         "loki": {
-            "queue": multiprocessing.Queue(-1),
-            "class": "logging_loki.LokiQueueHandler",
+            "class": "alexandru_optica_app.logshipping.LokiHandler",
             "formatter": "struct_json",
-            "url": "http://0.0.0.0:3100/loki/api/v1/push",
+            "url": os.environ.get("LOKI_URL", "http://0.0.0.0:3100/loki/api/v1/push"),
             "tags": {"application": "zipextractor"},
-            "version": "1",
         },
     },
     "root": {
@@ -1,3 +1,7 @@
+import tempfile
+
 from .settings import *  # noqa
 
 DEBUG = True
+
+METRICS_DIR = tempfile.mkdtemp(prefix="metrics-")
@@ -0,0 +1,77 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""SQLite backend for the production workers.
+
+Every connection sets the ``PRAGMAS`` when it opens: the database is in WAL
+mode, so the readers never wait for the writer, and ``synchronous=NORMAL``
+only syncs the WAL at checkpoints. ``OPTIONS["pragmas"]`` overrides them.
+
+The transactions start with ``BEGIN IMMEDIATE``, the ``transaction_mode``
+option: a deferred transaction reading before writing fails at once with
+"database is locked" when another worker writes, while an immediate one
+takes the write lock first and waits for it up to the ``timeout`` option.
+When the lock is still held after that, the BEGIN is tried again
+``LOCK_RETRIES`` times, after a random delay.
+
+The ``transaction_mode`` and ``init_command`` options of Django 5.1 replace
+most of this backend.
+"""
+import random
+import time
+
+from django.db import OperationalError
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -20000,  # KiB
+    "mmap_size": 128 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+LOCK_RETRIES = 3
+LOCK_RETRY_DELAY = 0.05
+
+
+def is_locked(error):
+    return "database is locked" in str(error)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = {**PRAGMAS, **kwargs.pop("pragmas", {})}
+        self.transaction_mode = kwargs.pop("transaction_mode", "IMMEDIATE").upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ValueError(f"Invalid transaction_mode: {self.transaction_mode}.")
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def is_usable(self):
+        # For CONN_HEALTH_CHECKS: a file replaced or removed under a
+        # persistent connection
+        try:
+            self.connection.execute("SELECT 1 FROM sqlite_master LIMIT 1")
+        except self.Database.Error:
+            return False
+        return True
+
+    def _start_transaction_under_autocommit(self):
+        for attempt in range(LOCK_RETRIES + 1):
+            try:
+                self.cursor().execute(f"BEGIN {self.transaction_mode}")
+                return
+            except OperationalError as error:
+                if attempt == LOCK_RETRIES or not is_locked(error):
+                    raise
+            time.sleep(random.uniform(0, LOCK_RETRY_DELAY * 2**attempt))
@@ -10,7 +10,17 @@ from django.contrib import admin
 from django.urls import include, path
 from django.urls.resolvers import URLPattern, URLResolver
 
+from alexandru_optica_app.metrics import metrics_view
+from alexandru_optica_app.profiling import profiles_export_view, profiles_view
+
 urlpatterns: list[URLPattern | URLResolver] = [
+    path(route="admin/profiles/", view=profiles_view, name="profiles"),
+    path(
+        route="admin/profiles/export/",
+        view=profiles_export_view,
+        name="profiles_export",
+    ),
+    path(route="metrics", view=metrics_view, name="metrics"),
     path(route="admin/", view=admin.site.urls),
     path(route="", view=include("optica_app.urls")),
 ] + static(prefix=settings.STATIC_URL, document_root=settings.STATIC_ROOT)
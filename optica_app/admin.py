@@ -6,10 +6,27 @@
 # github: https://github.com/boot-sandre/alexandru-optica-app/
 from django import forms
 from django.contrib import admin
+from django.contrib.admin.views.main import ERROR_FLAG, PAGE_VAR
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count
+from django.http import JsonResponse
 from django.template.defaultfilters import truncatechars
-
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+
+from .analytics import prescription_statistics
+from .changelists import KeysetPaginationMixin
+from .exports import (
+    ORDER_HEADER,
+    PAYMENT_HEADER,
+    csv_response,
+    order_rows,
+    payment_rows,
+)
 from .models import (
+    ClientSearchEntry,
     Contact,
+    Customer,
     Frame,
     GlassType,
     Identity,
@@ -18,26 +35,149 @@ from .models import (
     Order,
     PrescriptionDetail,
     Product,
+    SlowQuery,
     Voucher,
+    VoucherBalance,
     VoucherLine,
 )
+from .similarity import similar_prescriptions
+from .slowqueries import explain
+
+
+def export_orders_csv(modeladmin, request, queryset):
+    return csv_response("orders.csv", ORDER_HEADER, order_rows(queryset))
+
+
+export_orders_csv.short_description = "Export selected orders as CSV"
+
+
+def export_payments_csv(modeladmin, request, queryset):
+    return csv_response("payments.csv", PAYMENT_HEADER, payment_rows(queryset))
+
+
+export_payments_csv.short_description = "Export selected payments as CSV"
+
+
+class NumericRangeListFilter(admin.FieldListFilter):
+    """Min/max inputs filtering ``field__gte`` and ``field__lte``, which an
+    index on the field turns into a range scan."""
+
+    template = "admin/optica_app/numeric_range_filter.html"
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg_gte = f"{field_path}__gte"
+        self.lookup_kwarg_lte = f"{field_path}__lte"
+        # The form replaces the query string, so it resubmits the search, the
+        # ordering and the other filters as hidden inputs
+        self.hidden_params = [
+            (key, value)
+            for key, values in request.GET.lists()
+            if key not in (self.lookup_kwarg_gte, self.lookup_kwarg_lte)
+            and key not in (PAGE_VAR, ERROR_FLAG)
+            for value in values
+        ]
+        super().__init__(field, request, params, model, model_admin, field_path)
+        # A bound left blank in the form is no bound at all
+        for key, values in list(self.used_parameters.items()):
+            values = [value for value in values if value != ""]
+            if values:
+                self.used_parameters[key] = values
+            else:
+                del self.used_parameters[key]
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg_gte, self.lookup_kwarg_lte]
+
+    def choices(self, changelist):
+        expected = self.expected_parameters()
+        yield {
+            "selected": not self.used_parameters,
+            "query_string": changelist.get_query_string(remove=expected),
+            "display": "All",
+            "gte_name": self.lookup_kwarg_gte,
+            "lte_name": self.lookup_kwarg_lte,
+            "gte": (self.used_parameters.get(self.lookup_kwarg_gte) or [""])[-1],
+            "lte": (self.used_parameters.get(self.lookup_kwarg_lte) or [""])[-1],
+            "hidden_params": self.hidden_params,
+        }
+
+
+class ClientSearchMixin:
+    """Search through the client search index (ClientSearchEntry) instead of
+    LIKE scans: client name, phone, institution or order code."""
+
+    client_search_path = "order"
+    search_help_text = "Client name, phone number, institution or order number."
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        condition = ClientSearchEntry.objects.matching(
+            search_term, path=self.client_search_path
+        )
+        return queryset.filter(condition), False
+
+
+class OpticianListFilter(admin.RelatedFieldListFilter):
+    """The users taking orders: a short list whatever the number of orders."""
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.title = "optician"
+
+
+ORDER_LIST_FILTERS = (
+    ("order__user", OpticianListFilter),
+    ("order", NumericRangeListFilter),
+    ("order__total_amount", NumericRangeListFilter),
+)
+
+
+class CylinderListFilter(admin.SimpleListFilter):
+    title = "cylinder (distance)"
+    parameter_name = "cylinder"
+
+    def lookups(self, request, model_admin):
+        return (("yes", "Present"), ("no", "None"))
+
+    def queryset(self, request, queryset):
+        if self.value() == "yes":
+            return queryset.with_cylinder()
+        if self.value() == "no":
+            return queryset.exclude(pk__in=queryset.with_cylinder().values("pk"))
+        return queryset
 
 
 @admin.register(PrescriptionDetail)
-class PrescriptionDetailAdmin(admin.ModelAdmin):
+class PrescriptionDetailAdmin(
+    ClientSearchMixin, KeysetPaginationMixin, admin.ModelAdmin
+):
     list_display = (
         "__str__",
         "fare_pupillary_distance",
         "aproape_pupillary_distance",
         "intermediar_pupillary_distance",
     )
-    list_filter = ("order",)
-    search_fields = (
-        "order__id",
-        "fare_od_spheric",
-        "fare_os_spheric",
+    # Not the 18 sphere/cylinder/axis columns
+    list_only = (
+        "order",
+        "fare_pupillary_distance",
+        "aproape_pupillary_distance",
+        "intermediar_pupillary_distance",
+    )
+    list_filter = (
+        *ORDER_LIST_FILTERS,
+        CylinderListFilter,
+        ("fare_od_spheric", NumericRangeListFilter),
+        ("fare_os_spheric", NumericRangeListFilter),
+        ("fare_od_cylindric", NumericRangeListFilter),
+        ("fare_os_cylindric", NumericRangeListFilter),
+        ("fare_pupillary_distance", NumericRangeListFilter),
     )
-    raw_id_fields = ("order",)
+    search_fields = ("order__id",)
+    autocomplete_fields = ("order",)
+    list_select_related = ("order",)
+    date_hierarchy = "order__created_at"
     fieldsets = (
         ("Order Info", {"fields": ("order",)}),
         (
@@ -80,6 +220,55 @@ class PrescriptionDetailAdmin(admin.ModelAdmin):
         ),
     )
 
+    change_list_template = "admin/optica_app/prescriptiondetail/change_list.html"
+    change_form_template = "admin/optica_app/prescriptiondetail/change_form.html"
+
+    def get_urls(self):
+        return [
+            path(
+                "statistics/",
+                self.admin_site.admin_view(self.statistics_view),
+                name="optica_app_prescriptiondetail_statistics",
+            ),
+            path(
+                "<int:object_id>/similar/",
+                self.admin_site.admin_view(self.similar_view),
+                name="optica_app_prescriptiondetail_similar",
+            ),
+        ] + super().get_urls()
+
+    def similar_view(self, request, object_id):
+        prescription = self.get_object(request, object_id)
+        if prescription is None:
+            return self._get_obj_does_not_exist_redirect(
+                request, self.opts, str(object_id)
+            )
+        if not self.has_view_permission(request, prescription):
+            raise PermissionDenied
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.opts,
+            "original": prescription,
+            "title": f"Similar prescriptions to {prescription}",
+            "neighbours": similar_prescriptions(prescription, k=10),
+        }
+        return TemplateResponse(
+            request, "admin/optica_app/prescriptiondetail/similar.html", context
+        )
+
+    def statistics_view(self, request):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.opts,
+            "title": "Prescription statistics",
+            "statistics": prescription_statistics(),
+        }
+        return TemplateResponse(
+            request, "admin/optica_app/prescriptiondetail/statistics.html", context
+        )
+
     def get_changeform_initial_data(self, request):
         last_order = Order.objects.order_by("-id").first()
         if last_order:
@@ -100,11 +289,12 @@ class PrescriptionDetailAdmin(admin.ModelAdmin):
 
 
 @admin.register(Identity)
-class IdentityAdmin(admin.ModelAdmin):
+class IdentityAdmin(ClientSearchMixin, admin.ModelAdmin):
     list_display = ("first_name", "last_name", "order_id")
     search_fields = ("first_name", "last_name", "order__id")
-    list_filter = ("order",)
-    raw_id_fields = ("order",)
+    list_filter = ORDER_LIST_FILTERS
+    autocomplete_fields = ("order",)
+    date_hierarchy = "order__created_at"
 
     def order_id(self, obj):
         return obj.order.id
@@ -130,10 +320,10 @@ class IdentityAdmin(admin.ModelAdmin):
 
 
 @admin.register(Contact)
-class ContactAdmin(admin.ModelAdmin):
+class ContactAdmin(ClientSearchMixin, admin.ModelAdmin):
     list_display = ("phone_number", "order_id")
     search_fields = ("phone_number",)
-    raw_id_fields = ("order",)
+    autocomplete_fields = ("order",)
 
     def get_changeform_initial_data(self, request):
         last_order = Order.objects.order_by("-id").first()
@@ -143,10 +333,10 @@ class ContactAdmin(admin.ModelAdmin):
 
 
 @admin.register(Institution)
-class InstitutionAdmin(admin.ModelAdmin):
+class InstitutionAdmin(ClientSearchMixin, admin.ModelAdmin):
     list_display = ("title", "address_preview")
     search_fields = ("title", "address")
-    raw_id_fields = ("order",)
+    autocomplete_fields = ("order",)
 
     def address_preview(self, obj):
         return truncatechars(obj.address, 50)
@@ -221,20 +411,54 @@ class PrescriptionDetailsInline(admin.StackedInline):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(KeysetPaginationMixin, admin.ModelAdmin):
     list_display = ("__str__", "price")
+    autocomplete_fields = ("order", "frame", "lens")
+
+
+@admin.register(Frame, Lens)
+class TitleAdmin(admin.ModelAdmin):
+    search_fields = ("title",)
+    search_help_text = "Start of the title."
+
+    def get_search_results(self, request, queryset, search_term):
+        # A prefix range over the lowercased title index, not a LIKE scan
+        return queryset.title_prefix(search_term), False
 
 
-admin.site.register(Frame)
 admin.site.register(GlassType)
-admin.site.register(Lens)
 
 
 class ProductInline(admin.TabularInline):
     model = Product
+    autocomplete_fields = ("frame", "lens")
     extra = 1
 
 
+class TotalAmountListFilter(admin.SimpleListFilter):
+    title = "total price"
+    parameter_name = "total_amount"
+    ranges = {
+        "empty": {"total_amount": 0},
+        "lt500": {"total_amount__gt": 0, "total_amount__lt": 500},
+        "500to1000": {"total_amount__gte": 500, "total_amount__lt": 1000},
+        "gte1000": {"total_amount__gte": 1000},
+    }
+
+    def lookups(self, request, model_admin):
+        return (
+            ("empty", "No products"),
+            ("lt500", "Under 500"),
+            ("500to1000", "500 to 1000"),
+            ("gte1000", "1000 and more"),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() in self.ranges:
+            return queryset.filter(**self.ranges[self.value()])
+        return queryset
+
+
 class OrderAdminForm(forms.ModelForm):
     class Meta:
         model = Order
@@ -253,11 +477,19 @@ class OrderAdminForm(forms.ModelForm):
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(ClientSearchMixin, KeysetPaginationMixin, admin.ModelAdmin):
     form = OrderAdminForm
     change_form_template = "admin/optica_app/order/change_form.html"
-    fields = ["user"]
-    list_display = ["__str__", "user", "created_at", "updated_at", "total_price"]
+    fields = ["user", "customer"]
+    autocomplete_fields = ["customer"]
+    list_display = ["__str__", "user", "created_at", "updated_at", "total_amount"]
+    list_filter = [("user", OpticianListFilter), TotalAmountListFilter]
+    list_select_related = ["user"]
+    date_hierarchy = "created_at"
+    keyset_fields = ("-created_at", "-pk")
+    actions = [export_orders_csv]
+    search_fields = ["id"]
+    client_search_path = "pk"
 
     class Meta:
         model = Order
@@ -270,6 +502,40 @@ class OrderAdmin(admin.ModelAdmin):
         ProductInline,
     ]
 
+    def get_urls(self):
+        return [
+            path(
+                "client-search/",
+                self.admin_site.admin_view(self.client_search_view),
+                name="optica_app_order_client_search",
+            ),
+        ] + super().get_urls()
+
+    def client_search_view(self, request):
+        """JSON top matches of the client search, the most recent first."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        order_ids = ClientSearchEntry.objects.search(request.GET.get("q", ""))
+        orders = Order.objects.select_related(
+            "identities", "contacts", "institutions"
+        ).in_bulk(order_ids)
+        results = []
+        for order in (orders[pk] for pk in order_ids if pk in orders):
+            identity = getattr(order, "identities", None)
+            contact = getattr(order, "contacts", None)
+            institution = getattr(order, "institutions", None)
+            results.append(
+                {
+                    "id": order.pk,
+                    "order": str(order),
+                    "name": str(identity) if identity else "",
+                    "phone_number": contact.phone_number if contact else "",
+                    "institution": institution.title if institution else "",
+                    "url": reverse("admin:optica_app_order_change", args=[order.pk]),
+                }
+            )
+        return JsonResponse({"results": results})
+
     def get_readonly_fields(self, request, obj=None):
         readonly_fields = super(OrderAdmin, self).get_readonly_fields(request, obj)
         if obj:  # cela signifie que nous sommes en mode édition
@@ -277,7 +543,43 @@ class OrderAdmin(admin.ModelAdmin):
         return readonly_fields
 
 
-admin.site.register(VoucherLine)
+class CustomerOrderInline(admin.TabularInline):
+    model = Order
+    fields = ["created_at", "user", "total_amount"]
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    show_change_link = True
+    ordering = ["-created_at"]
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Customer)
+class CustomerAdmin(admin.ModelAdmin):
+    list_display = ["__str__", "phone_number", "order_count", "created_at"]
+    search_fields = ["last_name", "first_name", "phone_number"]
+    inlines = [CustomerOrderInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(order_count=Count("orders"))
+
+    @admin.display(description="Orders", ordering="order_count")
+    def order_count(self, obj):
+        return obj.order_count
+
+
+@admin.register(VoucherLine)
+class VoucherLineAdmin(KeysetPaginationMixin, admin.ModelAdmin):
+    list_display = ["__str__", "voucher", "amount", "payment_date"]
+    list_select_related = ["voucher"]
+    date_hierarchy = "payment_date"
+    actions = [export_payments_csv]
+
+    def get_queryset(self, request):
+        # The voucher label lists its orders
+        return super().get_queryset(request).prefetch_related("voucher__orders")
 
 
 class VoucherLineInline(admin.TabularInline):
@@ -333,6 +635,28 @@ class VoucherAdmin(admin.ModelAdmin):
         "rest_amount",
     ]
 
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return queryset.with_balances().prefetch_related("orders")
+
+    def orders_total_price(self, obj):
+        return obj.orders_total_price()
+
+    orders_total_price.admin_order_field = "orders_total"
+    orders_total_price.short_description = "Orders total price"
+
+    def voucher_lines_total_amount(self, obj):
+        return obj.voucher_lines_total_amount()
+
+    voucher_lines_total_amount.admin_order_field = "lines_total"
+    voucher_lines_total_amount.short_description = "Amount payed"
+
+    def rest_amount(self, obj):
+        return obj.rest_amount()
+
+    rest_amount.admin_order_field = "rest_total"
+    rest_amount.short_description = "Rest to pay"
+
     def get_readonly_fields(self, request, obj=None):
         readonly_fields = super(VoucherAdmin, self).get_readonly_fields(request, obj)
         if obj:
@@ -342,3 +666,105 @@ class VoucherAdmin(admin.ModelAdmin):
                 "rest_amount",
             )
         return readonly_fields
+
+
+class OutstandingListFilter(admin.SimpleListFilter):
+    title = "balance"
+    parameter_name = "outstanding"
+
+    def lookups(self, request, model_admin):
+        return (("yes", "Still owes money"), ("no", "Settled"))
+
+    def queryset(self, request, queryset):
+        if self.value() == "yes":
+            return queryset.outstanding()
+        if self.value() == "no":
+            return queryset.filter(rest_amount__lte=0)
+        return queryset
+
+
+@admin.register(VoucherBalance)
+class VoucherBalanceAdmin(admin.ModelAdmin):
+    change_list_template = "admin/optica_app/voucherbalance/change_list.html"
+    list_display = [
+        "voucher",
+        "orders_total",
+        "paid_total",
+        "rest_amount",
+        "last_payment_date",
+    ]
+    list_filter = [OutstandingListFilter]
+    list_select_related = ["voucher"]
+    ordering = ["-rest_amount"]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("voucher__orders")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {
+            "total_receivables": VoucherBalance.objects.total_receivables(),
+            "aging": VoucherBalance.objects.aging(),
+            **(extra_context or {}),
+        }
+        return super().changelist_view(request, extra_context=extra_context)
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = [
+        "sql_preview",
+        "calls",
+        "total_ms",
+        "mean_ms",
+        "max_ms",
+        "full_scans",
+        "suggested_indexes",
+        "last_seen",
+    ]
+    ordering = ["-total_time"]
+    search_fields = ["sql"]
+    actions = ["explain_queries"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="SQL")
+    def sql_preview(self, obj):
+        return truncatechars(obj.sql, 120)
+
+    @admin.display(description="Total (ms)", ordering="total_time")
+    def total_ms(self, obj):
+        return round(obj.total_time)
+
+    @admin.display(description="Mean (ms)")
+    def mean_ms(self, obj):
+        return round(obj.mean_time(), 1)
+
+    @admin.display(description="Max (ms)", ordering="max_time")
+    def max_ms(self, obj):
+        return round(obj.max_time, 1)
+
+    def has_explain_permission(self, request):
+        """Explaining writes the plans: for the superusers, or the staff
+        given the permission."""
+        return request.user.is_superuser or request.user.has_perm(
+            "optica_app.explain_slowquery"
+        )
+
+    @admin.action(description="Explain selected queries", permissions=["explain"])
+    def explain_queries(self, request, queryset):
+        for slow_query in queryset:
+            explain(slow_query)
+        self.message_user(request, f"{len(queryset)} queries explained.")
@@ -0,0 +1,151 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Population statistics over the prescriptions, computed with NumPy.
+
+The 21 prescription columns are read with ``values_list`` by keyset chunks,
+cast to floats in SQL so no Decimal is ever built, into one ``(rows, 21)``
+array where a missing value is NaN. Every metric is then a vectorized
+operation over a column of that array.
+"""
+import numpy as np
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from .models import PrescriptionDetail
+
+DISTANCES = ("fare", "aproape", "intermediar")
+EYES = ("od", "os")
+COLUMNS = [
+    f"{distance}_{eye}_{measure}"
+    for distance in DISTANCES
+    for eye in EYES
+    for measure in ("spheric", "cylindric", "axis")
+] + [f"{distance}_pupillary_distance" for distance in DISTANCES]
+COLUMN_INDEX = {name: index for index, name in enumerate(COLUMNS)}
+
+# Diopter steps of the lenses, and spherical equivalent thresholds
+DIOPTER_BIN = 0.25
+MYOPIA_MAX_SE = -0.5
+HYPEROPIA_MIN_SE = 0.5
+ANISOMETROPIA_MIN_DIFF = 1.0
+SUMMARY_KEYS = ("count", "mean", "std", "min", "p25", "median", "p75", "max")
+
+
+def load_columns(queryset, columns, chunk_size=10000):
+    """Return ``(pks, data)``: the primary keys and a float array of
+    ``columns`` for the rows of ``queryset``."""
+    casts = [Cast(name, FloatField()) for name in columns]
+    chunks = []
+    last_pk = 0
+    while True:
+        rows = list(
+            queryset.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", *casts)[:chunk_size]
+        )
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+        chunks.append(np.array(rows, dtype=np.float64))
+    if not chunks:
+        return np.empty(0, dtype=np.int64), np.empty((0, len(columns)))
+    data = np.concatenate(chunks)
+    return data[:, 0].astype(np.int64), data[:, 1:]
+
+
+def load_prescriptions(queryset=None, chunk_size=10000):
+    """Return the prescription columns of ``queryset`` as a float array."""
+    queryset = PrescriptionDetail.objects.all() if queryset is None else queryset
+    return load_columns(queryset, COLUMNS, chunk_size=chunk_size)[1]
+
+
+def column(data, name):
+    return data[:, COLUMN_INDEX[name]]
+
+
+def summarize(values):
+    values = values[~np.isnan(values)]
+    if not values.size:
+        return dict.fromkeys(SUMMARY_KEYS, None) | {"count": 0}
+    p25, median, p75 = np.percentile(values, [25, 50, 75])
+    return {
+        "count": int(values.size),
+        "mean": round(float(values.mean()), 3),
+        "std": round(float(values.std()), 3),
+        "min": float(values.min()),
+        "p25": float(p25),
+        "median": float(median),
+        "p75": float(p75),
+        "max": float(values.max()),
+    }
+
+
+def histogram(values, start, stop, step):
+    """Counts per ``[low, high)`` bin, only the non empty bins."""
+    values = values[~np.isnan(values)]
+    edges = np.linspace(start, stop, int(round((stop - start) / step)) + 1)
+    counts, _ = np.histogram(values, bins=edges)
+    return [
+        {"from": float(low), "to": float(high), "count": int(count)}
+        for low, high, count in zip(edges[:-1], edges[1:], counts)
+        if count
+    ]
+
+
+def rate(mask, valid):
+    total = int(valid.sum())
+    return {
+        "count": int((mask & valid).sum()),
+        "total": total,
+        "rate": round(float((mask & valid).sum()) / total, 4) if total else None,
+    }
+
+
+def spherical_equivalent(data, distance, eye):
+    return (
+        column(data, f"{distance}_{eye}_spheric")
+        + column(data, f"{distance}_{eye}_cylindric") / 2
+    )
+
+
+def compute_statistics(data):
+    """Compute the statistics of an array from ``load_prescriptions()``."""
+    statistics = {"prescriptions": int(data.shape[0]), "distances": {}}
+    for distance in DISTANCES:
+        eyes = {}
+        equivalents = {}
+        for eye in EYES:
+            sphere = column(data, f"{distance}_{eye}_spheric")
+            cylinder = column(data, f"{distance}_{eye}_cylindric")
+            se = equivalents[eye] = spherical_equivalent(data, distance, eye)
+            valid = ~np.isnan(se)
+            eyes[eye] = {
+                "sphere": summarize(sphere),
+                "cylinder": summarize(cylinder),
+                "spherical_equivalent": summarize(se),
+                "sphere_histogram": histogram(sphere, -20, 20, DIOPTER_BIN),
+                "cylinder_histogram": histogram(cylinder, -20, 20, DIOPTER_BIN),
+                "spherical_equivalent_histogram": histogram(se, -20, 20, DIOPTER_BIN),
+                "myopia": rate(se <= MYOPIA_MAX_SE, valid),
+                "hyperopia": rate(se >= HYPEROPIA_MIN_SE, valid),
+                "astigmatism": rate(cylinder != 0, ~np.isnan(cylinder)),
+            }
+        difference = np.abs(equivalents["od"] - equivalents["os"])
+        pd = column(data, f"{distance}_pupillary_distance")
+        statistics["distances"][distance] = {
+            "eyes": eyes,
+            "anisometropia": rate(
+                difference >= ANISOMETROPIA_MIN_DIFF, ~np.isnan(difference)
+            ),
+            "pupillary_distance": summarize(pd),
+            "pupillary_distance_histogram": histogram(pd, 50, 70, 1),
+        }
+    return statistics
+
+
+def prescription_statistics(queryset=None, chunk_size=10000):
+    return compute_statistics(load_prescriptions(queryset, chunk_size=chunk_size))
@@ -0,0 +1,297 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Read-only JSON API for the reporting tools.
+
+The order and voucher lists are read by cursor on ``(updated_at, id)``,
+oldest change first: ``next`` is the URL of the rows after the last one of
+the page, an index range scan at any depth. ``?fields=id,total_amount``
+selects the columns returned, ``?limit=`` the page size.
+
+Every response carries an ETag, and a Last-Modified from the ``updated_at``
+of its rows; a client sending them back with ``If-None-Match`` or
+``If-Modified-Since`` gets a 304 without a body when nothing changed.
+
+The API is for staff users, logged in through the admin, but for the sync
+endpoints of the opticians' devices (see ``sync``), open to every user.
+"""
+import hashlib
+import json
+import zlib
+from functools import partial, wraps
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, urlencode
+from django.views.decorators.gzip import gzip_page
+
+from . import sync
+from .catalog import catalog
+from .changelists import decode_cursor, encode_cursor, keyset_after
+from .models import CacheVersion, Frame, GlassType, Lens, Order, Voucher, VoucherBalance
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+CURSOR_FIELDS = ("updated_at", "pk")
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400, errors=None):
+        super().__init__(message)
+        self.status = status
+        self.errors = errors
+
+
+class Resource:
+    """A list of rows read with ``values()``, one query per page.
+
+    ``fields`` maps the names of the API to the lookups of ``model``.
+    """
+
+    model = None
+    fields = {}
+
+    def get_queryset(self):
+        return self.model.objects.all()
+
+    def get_fields(self, request):
+        names = request.GET.get("fields")
+        if not names:
+            return list(self.fields)
+        names = [name.strip() for name in names.split(",") if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ApiError(f"Unknown fields: {', '.join(unknown)}.")
+        return names
+
+    def rows(self, queryset, names):
+        """Return the rows of ``queryset`` as dicts of the ``names`` fields,
+        with their cursor values under ``_cursor``."""
+        lookups = [self.fields[name] for name in names]
+        rows = []
+        for *values, updated_at, pk in queryset.values_list(*lookups, *CURSOR_FIELDS):
+            row = dict(zip(names, values))
+            row["_cursor"] = (updated_at, pk)
+            rows.append(row)
+        return rows
+
+
+class OrderResource(Resource):
+    model = Order
+    fields = {
+        "id": "pk",
+        "user": "user_id",
+        "customer": "customer_id",
+        "created_at": "created_at",
+        "updated_at": "updated_at",
+        "total_amount": "total_amount",
+        "first_name": "identities__first_name",
+        "last_name": "identities__last_name",
+        "phone_number": "contacts__phone_number",
+        "institution": "institutions__title",
+    }
+
+
+class VoucherResource(Resource):
+    """Vouchers with their balance, dated by the balance row, which is
+    rewritten on every change of the voucher, its orders or its lines."""
+
+    model = VoucherBalance
+    fields = {
+        "id": "voucher_id",
+        "payment_method": "voucher__payment_method",
+        "orders": None,
+        "orders_total": "orders_total",
+        "paid_total": "paid_total",
+        "rest_amount": "rest_amount",
+        "last_payment_date": "last_payment_date",
+        "updated_at": "updated_at",
+    }
+
+    def rows(self, queryset, names):
+        with_orders = "orders" in names
+        names = [name for name in names if name != "orders"]
+        rows = super().rows(queryset, names)
+        if with_orders:
+            # One query for the orders of the whole page
+            orders = {row["_cursor"][1]: [] for row in rows}
+            links = Voucher.orders.through.objects.filter(voucher__in=orders)
+            for voucher_id, order_id in links.order_by("order").values_list(
+                "voucher_id", "order_id"
+            ):
+                orders[voucher_id].append(order_id)
+            for row in rows:
+                row["orders"] = orders[row["_cursor"][1]]
+        return rows
+
+
+def api_view(view=None, *, methods=("GET", "HEAD"), staff_only=True):
+    """Answer the ``methods`` requests of logged in users, staff users only
+    by default, errors as JSON."""
+    if view is None:
+        return partial(api_view, methods=methods, staff_only=staff_only)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in methods:
+            response = JsonResponse({"error": "Method not allowed."}, status=405)
+            response["Allow"] = ", ".join(methods)
+            return response
+        if not request.user.is_authenticated:
+            return JsonResponse({"error": "Authentication required."}, status=401)
+        if staff_only and not request.user.is_staff:
+            return JsonResponse({"error": "Permission denied."}, status=403)
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as error:
+            data = {"error": str(error)}
+            if error.errors:
+                data["errors"] = error.errors
+            return JsonResponse(data, status=error.status)
+
+    return wrapper
+
+
+def conditional_response(request, etag_parts, last_modified, data):
+    """Return a 304 when the client has this version already, the JSON of
+    ``data`` otherwise, with its validators."""
+    digest = hashlib.sha1(repr(etag_parts).encode()).hexdigest()
+    etag = f'"{digest}"'
+    timestamp = last_modified.timestamp() if last_modified else None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp and int(timestamp)
+    )
+    if response is None:
+        response = JsonResponse(data)
+    response["ETag"] = etag
+    if timestamp:
+        response["Last-Modified"] = http_date(timestamp)
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def page_limit(request, default, maximum):
+    try:
+        limit = int(request.GET.get("limit", default))
+    except ValueError:
+        raise ApiError("Invalid limit.")
+    return min(max(limit, 1), maximum)
+
+
+def list_view(resource):
+    @api_view
+    def view(request):
+        names = resource.get_fields(request)
+        limit = page_limit(request, PAGE_SIZE, MAX_PAGE_SIZE)
+        queryset = resource.get_queryset().order_by(*CURSOR_FIELDS)
+        cursor = request.GET.get("cursor")
+        if cursor:
+            opts = queryset.model._meta
+            try:
+                values = decode_cursor(opts, CURSOR_FIELDS, cursor)
+            except ValueError as error:
+                raise ApiError(str(error))
+            queryset = queryset.filter(keyset_after(opts, CURSOR_FIELDS, values))
+
+        rows = resource.rows(queryset[: limit + 1], names)
+        next_url = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            params = request.GET.copy()
+            params["cursor"] = encode_cursor(list(rows[-1]["_cursor"]))
+            next_url = request.build_absolute_uri(f"?{urlencode(params, doseq=True)}")
+        keys = [row.pop("_cursor") for row in rows]
+        return conditional_response(
+            request,
+            (names, cursor, limit, keys),
+            max((updated_at for updated_at, _ in keys), default=None),
+            {"results": rows, "next": next_url},
+        )
+
+    return view
+
+
+order_list_view = list_view(OrderResource())
+voucher_list_view = list_view(VoucherResource())
+
+
+@api_view
+def order_detail_view(request, pk):
+    resource = OrderResource()
+    names = resource.get_fields(request)
+    rows = resource.rows(Order.objects.filter(pk=pk), names)
+    if not rows:
+        raise ApiError("Not found.", status=404)
+    row = rows[0]
+    updated_at, _ = row.pop("_cursor")
+    return conditional_response(request, (names, pk, updated_at), updated_at, row)
+
+
+@api_view
+def catalog_view(request):
+    """The frames, glass types and lenses, from the catalog cache."""
+    version = CacheVersion.objects.current("catalog")
+    labels = {
+        name: [{"id": obj.pk, "title": str(obj)} for obj in catalog.objects(model)]
+        for name, model in (
+            ("frames", Frame),
+            ("glass_types", GlassType),
+            ("lenses", Lens),
+        )
+    }
+    return conditional_response(request, ("catalog", version), None, labels)
+
+
+@gzip_page
+@api_view(staff_only=False)
+def sync_pull_view(request):
+    limit = page_limit(request, sync.PULL_SIZE, sync.PULL_SIZE)
+    try:
+        changes = sync.pull(request.user, request.GET.get("cursor"), limit)
+    except ValueError as error:
+        raise ApiError(str(error))
+    return JsonResponse(changes)
+
+
+def read_json_body(request):
+    """Return the JSON body of ``request``, gzip compressed or not."""
+    body = request.body
+    if request.headers.get("Content-Encoding") == "gzip":
+        # Bounded like the uncompressed bodies
+        limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(body, limit)
+        except zlib.error:
+            raise ApiError("Invalid gzip body.")
+        if decompressor.unconsumed_tail:
+            raise ApiError("Request body too large.", status=413)
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise ApiError("Invalid JSON body.")
+
+
+@gzip_page
+@api_view(methods=("POST",), staff_only=False)
+def sync_push_view(request):
+    payload = read_json_body(request)
+    records = payload.get("orders") if isinstance(payload, dict) else None
+    if not isinstance(records, list):
+        raise ApiError('Expected {"orders": [...]}.')
+    try:
+        results = sync.push(records, request.user)
+    except ValidationError as error:
+        if hasattr(error, "error_dict"):
+            raise ApiError("Invalid orders.", errors=error.message_dict)
+        raise ApiError(" ".join(error.messages))
+    except IntegrityError:
+        # The same orders pushed concurrently: the next push answers them
+        raise ApiError("Conflicting push, send it again.", status=409)
+    return JsonResponse({"orders": results})
@@ -0,0 +1,17 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+from django.apps import AppConfig
+
+
+class OpticaAppConfig(AppConfig):
+    name = "optica_app"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .slowqueries import install
+
+        install()
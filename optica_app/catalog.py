@@ -0,0 +1,133 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""In-process cache of the catalog: frames, glass types and lenses.
+
+These tables are small and rarely written, while every product label and
+product form needs them. Each process keeps them in memory, tagged with the
+version of the ``catalog`` CacheVersion row. Saving or deleting a catalog
+object bumps that version (see ``signals``); the other processes notice it
+at their next check, at most every ``check_interval`` seconds, or at once
+when asked for a primary key they do not know.
+"""
+import threading
+import time
+
+from django import forms
+from django.apps import apps
+from django.core.exceptions import ValidationError
+
+CATALOG_MODELS = ("optica_app.Frame", "optica_app.GlassType", "optica_app.Lens")
+VERSION_KEY = "catalog"
+
+
+class CatalogCache:
+    def __init__(self, check_interval=2.0):
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._objects = None
+            self._version = None
+            self._checked_at = 0.0
+
+    def _shared_version(self):
+        return apps.get_model("optica_app.CacheVersion").objects.current(VERSION_KEY)
+
+    def _load(self):
+        """Return ``{model: {pk: instance}}``, reloading when out of date."""
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._objects is not None
+                and now - self._checked_at < self.check_interval
+            ):
+                return self._objects
+            version = self._shared_version()
+            if self._objects is None or version != self._version:
+                self._objects = {}
+                for label in CATALOG_MODELS:
+                    model = apps.get_model(label)
+                    self._objects[model] = model.objects.in_bulk()
+                self._version = version
+            self._checked_at = now
+            return self._objects
+
+    def objects(self, model):
+        """Return the instances of ``model`` ordered by primary key."""
+        objects = self._load()[model]
+        return [objects[pk] for pk in sorted(objects)]
+
+    def get(self, model, pk):
+        """Return the instance of ``model`` with ``pk``, or None."""
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            return None
+        instance = self._load()[model].get(pk)
+        if instance is None:
+            with self._lock:
+                # Maybe created by another process since the last check
+                self._checked_at = 0.0
+            instance = self._load()[model].get(pk)
+        return instance
+
+    def label(self, model, pk):
+        instance = self.get(model, pk)
+        return str(instance) if instance is not None else ""
+
+    def invalidate(self):
+        """Bump the shared version and drop the objects of this process."""
+        apps.get_model("optica_app.CacheVersion").objects.bump(VERSION_KEY)
+        self.clear()
+
+
+catalog = CatalogCache()
+
+
+class CatalogChoiceIterator(forms.models.ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in catalog.objects(self.queryset.model):
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(catalog.objects(self.queryset.model)) + (
+            1 if self.field.empty_label is not None else 0
+        )
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(
+            catalog.objects(self.queryset.model)
+        )
+
+
+class CatalogChoiceField(forms.ModelChoiceField):
+    """ModelChoiceField over a catalog model, served from the catalog cache.
+
+    The queryset is only used for its model: a restricted queryset is not
+    honoured.
+    """
+
+    iterator = CatalogChoiceIterator
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        model = self.queryset.model
+        if isinstance(value, model):
+            value = value.pk
+        instance = catalog.get(model, value)
+        if instance is None:
+            raise ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
+        return instance
@@ -0,0 +1,222 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Admin changelists for the large tables.
+
+While a changelist keeps its default ordering, its pages are read by keyset:
+the next page is the rows after the last row shown, passed as ``?cursor=``,
+which the index on the ordering columns turns into a range scan at any
+depth, where an OFFSET reads and drops every row before the page. Sorting by
+a column falls back to numbered pages.
+
+Counts stop at ``count_limit`` rows; past it an unfiltered list shows the
+row count kept in the database statistics. ``list_only`` restricts the
+columns loaded for the rows of the list.
+"""
+import base64
+import json
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Q
+from django.utils.functional import cached_property
+
+CURSOR_VAR = "cursor"
+
+
+def estimated_count(model, using="default"):
+    """Return the row count of the table from the database statistics, or
+    None when there are none (SQLite before ``ANALYZE``)."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [connection.ops.quote_name(table)],
+            )
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == "sqlite":
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                "AND name = 'sqlite_stat1'"
+            )
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [table])
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator counting exactly up to ``count_limit`` rows only.
+
+    Past the limit, ``count`` is the table statistics estimate for an
+    unfiltered list (``count_is_estimate``), or the limit itself
+    (``count_is_lower_bound``).
+    """
+
+    count_limit = 10000
+    count_is_estimate = False
+    count_is_lower_bound = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.count_limit:
+                self.count_is_estimate = True
+                return estimate
+        count = queryset.order_by()[: self.count_limit + 1].count()
+        if count > self.count_limit:
+            self.count_is_lower_bound = True
+            return self.count_limit
+        return count
+
+
+def keyset_ordering(fields):
+    """Turn ``("-created_at", "-pk")`` into order_by() expressions, NULLs
+    last."""
+    return [
+        F(name[1:]).desc(nulls_last=True)
+        if name.startswith("-")
+        else F(name).asc(nulls_last=True)
+        for name in fields
+    ]
+
+
+def keyset_after(opts, fields, values):
+    """Return the Q of the rows after ``values`` in the ``fields`` order."""
+    condition = None
+    for name, value in reversed(list(zip(fields, values))):
+        field_name = name.lstrip("-")
+        field = opts.pk if field_name == "pk" else opts.get_field(field_name)
+        if value is None:
+            # NULLs come last: only the next NULL rows by the following keys
+            after = Q(pk__in=[])
+            equal = Q(**{f"{field_name}__isnull": True})
+        else:
+            lookup = "lt" if name.startswith("-") else "gt"
+            after = Q(**{f"{field_name}__{lookup}": value})
+            if field.null:
+                after |= Q(**{f"{field_name}__isnull": True})
+            equal = Q(**{field_name: value})
+        condition = after if condition is None else after | (equal & condition)
+    return condition
+
+
+def encode_cursor(values):
+    data = json.dumps(values, default=str).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def load_cursor(cursor):
+    """Return the JSON value of ``cursor``; raise ValueError when invalid."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (TypeError, ValueError) as error:
+        raise ValueError("Invalid cursor.") from error
+
+
+def decode_cursor(opts, fields, cursor):
+    """Return the key values of ``cursor``; raise ValueError when invalid."""
+    values = load_cursor(cursor)
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise ValueError("Invalid cursor.")
+    cleaned = []
+    for name, value in zip(fields, values):
+        field_name = name.lstrip("-")
+        field = opts.pk if field_name == "pk" else opts.get_field(field_name)
+        if value is None:
+            cleaned.append(None)
+            continue
+        try:
+            value = field.to_python(value)
+            # Out of the range of the database integers, say
+            field.run_validators(value)
+        except (ValidationError, TypeError, ValueError, OverflowError) as error:
+            raise ValueError("Invalid cursor.") from error
+        cleaned.append(value)
+    return cleaned
+
+
+class KeysetChangeList(ChangeList):
+    """ChangeList paginated by keyset on ``model_admin.keyset_fields``."""
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(CURSOR_VAR, None)
+        return params
+
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        if self.model_admin.list_only:
+            queryset = queryset.only(*self.model_admin.list_only)
+        return queryset
+
+    def get_results(self, request):
+        # A cursor belongs to this page only: never carry it into the links
+        self.params.pop(CURSOR_VAR, None)
+        self.filter_params.pop(CURSOR_VAR, None)
+        self.cursor = request.GET.get(CURSOR_VAR)
+        self.next_page_url = None
+        self.keyset = not (
+            ORDER_VAR in self.params or self.show_all or self.list_editable
+        )
+        if not self.keyset:
+            return super().get_results(request)
+
+        fields = self.model_admin.keyset_fields
+        queryset = self.queryset
+        if self.cursor:
+            try:
+                values = decode_cursor(self.opts, fields, self.cursor)
+            except ValueError:
+                raise IncorrectLookupParameters
+            queryset = queryset.filter(keyset_after(self.opts, fields, values))
+        rows = list(queryset[: self.list_per_page + 1])
+        if len(rows) > self.list_per_page:
+            rows = rows[: self.list_per_page]
+            last = rows[-1]
+            cursor = encode_cursor([getattr(last, name.lstrip("-")) for name in fields])
+            self.next_page_url = self.get_query_string({CURSOR_VAR: cursor})
+
+        self.paginator = self.model_admin.get_paginator(
+            request, self.queryset, self.list_per_page
+        )
+        self.result_count = self.paginator.count
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = bool(self.cursor or self.next_page_url)
+        self.page_num = 1
+
+
+class KeysetPaginationMixin:
+    """ModelAdmin mixin for the large tables, see the module docstring.
+
+    ``keyset_fields`` is the default ordering; it must end with a unique
+    field and be covered by an index.
+    """
+
+    keyset_fields = ("-pk",)
+    list_only = None
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_ordering(self, request):
+        return keyset_ordering(self.keyset_fields)
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
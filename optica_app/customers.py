@@ -0,0 +1,174 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Link the orders of a same client to one Customer.
+
+Each order gives blocking keys (CustomerKey): its phone number in national
+form and its client name, folded and with the words sorted so "Țugui Ștefan"
+and "stefan tugui" agree. An order is only compared with the customers
+found through its keys, a few indexed lookups, never with every customer:
+
+- a customer with the same phone number is the same client; when several
+  customers share it, they are merged;
+- otherwise a single customer with the same name is the same client, unless
+  both have a phone number (two different numbers are two clients);
+- otherwise the order gets a new customer.
+
+``link_order`` runs on every identity or contact save (see ``signals``) and
+drops the keys no order of the customer gives any more, an edited name or
+phone number say. ``link_orders`` goes over the orders without a customer,
+by chunks, for the existing tables: interrupted, it resumes where it
+stopped.
+"""
+from django.db import transaction
+from django.db.models.functions import Now
+
+from .models import Customer, CustomerKey, Order
+from .search import phone_digits, words
+
+
+def customer_keys(first_name, last_name, phone_number):
+    """Return the ``(kind, value)`` blocking keys of a client."""
+    keys = []
+    phone = phone_digits(phone_number)
+    if len(phone) >= 9:
+        keys.append((CustomerKey.PHONE, phone))
+    name = sorted(words(f"{first_name or ''} {last_name or ''}"))
+    if len(name) >= 2:
+        keys.append((CustomerKey.NAME, " ".join(name)))
+    return keys
+
+
+def merge_customers(target, others):
+    """Move the orders and keys of the ``others`` customer ids to ``target``
+    and delete them."""
+    others = set(others) - {target.pk}
+    if not others:
+        return
+    target_keys = set(target.keys.values_list("kind", "value"))
+    for key in CustomerKey.objects.filter(customer__in=others):
+        if (key.kind, key.value) in target_keys:
+            key.delete()
+        else:
+            target_keys.add((key.kind, key.value))
+    CustomerKey.objects.filter(customer__in=others).update(customer=target)
+    Order.objects.filter(customer__in=others).update(customer=target, updated_at=Now())
+    Customer.objects.filter(pk__in=others).delete()
+
+
+def prune_keys(customer_id):
+    """Delete the keys of a customer that none of its orders gives."""
+    rows = Order.objects.filter(customer=customer_id).values_list(
+        "identities__first_name",
+        "identities__last_name",
+        "contacts__phone_number",
+    )
+    current = {key for row in rows for key in customer_keys(*row)}
+    stale = [
+        pk
+        for pk, kind, value in CustomerKey.objects.filter(
+            customer=customer_id
+        ).values_list("pk", "kind", "value")
+        if (kind, value) not in current
+    ]
+    if stale:
+        CustomerKey.objects.filter(pk__in=stale).delete()
+
+
+def _owners(kind, value):
+    return set(
+        CustomerKey.objects.filter(kind=kind, value=value).values_list(
+            "customer", flat=True
+        )
+    )
+
+
+def link_order(order_id):
+    """Link an order to its customer; return the customer, or None while the
+    order has no identity nor contact."""
+    row = (
+        Order.objects.filter(pk=order_id)
+        .values_list(
+            "customer",
+            "identities__first_name",
+            "identities__last_name",
+            "contacts__phone_number",
+        )
+        .first()
+    )
+    if row is None:
+        return None
+    customer_id, first_name, last_name, phone_number = row
+    keys = dict(customer_keys(first_name, last_name, phone_number))
+    if not keys:
+        if customer_id is not None:
+            prune_keys(customer_id)
+        return None
+    with transaction.atomic():
+        candidates = set()
+        if CustomerKey.PHONE in keys:
+            candidates = _owners(CustomerKey.PHONE, keys[CustomerKey.PHONE])
+        if not candidates and CustomerKey.NAME in keys:
+            namesakes = _owners(CustomerKey.NAME, keys[CustomerKey.NAME])
+            if CustomerKey.PHONE in keys:
+                # A namesake with a phone number has another number
+                namesakes -= set(
+                    CustomerKey.objects.filter(
+                        customer__in=namesakes, kind=CustomerKey.PHONE
+                    ).values_list("customer", flat=True)
+                )
+            if len(namesakes) == 1:
+                candidates = namesakes
+        if candidates:
+            customer = Customer.objects.get(pk=min(candidates))
+            merge_customers(customer, candidates)
+        else:
+            customer = Customer.objects.create(
+                first_name=first_name or "",
+                last_name=last_name or "",
+                phone_number=phone_number or "",
+            )
+        CustomerKey.objects.bulk_create(
+            [
+                CustomerKey(customer=customer, kind=kind, value=value)
+                for kind, value in keys.items()
+            ],
+            ignore_conflicts=True,
+        )
+        if customer_id != customer.pk:
+            Order.objects.filter(pk=order_id).update(
+                customer=customer, updated_at=Now()
+            )
+            # The order was linked on partial data, e.g. its name before its
+            # phone number was saved
+            if customer_id is not None:
+                Customer.objects.filter(pk=customer_id, orders__isnull=True).delete()
+                prune_keys(customer_id)
+        if customer_id is not None:
+            # Only an order linked before can have given keys it no longer has
+            prune_keys(customer.pk)
+    return customer
+
+
+def link_orders(chunk_size=1000, progress=None):
+    """Link the orders without a customer, oldest first; return the number
+    of orders linked. ``progress`` is called with the running count and the
+    last order id after each chunk."""
+    linked = 0
+    last_pk = 0
+    while True:
+        pks = list(
+            Order.objects.filter(pk__gt=last_pk, customer__isnull=True)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:chunk_size]
+        )
+        if not pks:
+            return linked
+        with transaction.atomic():
+            linked += sum(link_order(pk) is not None for pk in pks)
+        last_pk = pks[-1]
+        if progress is not None:
+            progress(linked, last_pk)
@@ -0,0 +1,99 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Landing page of an optician: the orders of the day, the unpaid vouchers
+and the recent clients.
+
+The page is cached per optician as a template fragment, keyed by a version
+read in one query of index lookups: the last change of the optician's
+orders (``updated_at`` moves with every write of an order, its children or
+its total), the last payment (``VoucherBalance.updated_at``) and the last
+deleted order. The sections are only queried when the fragment is rendered.
+"""
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.db import models
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import Customer, Order, OrderTombstone, Voucher, VoucherBalance
+
+DASHBOARD_TIMEOUT = 600
+DASHBOARD_SIZE = 10
+
+
+class Dashboard:
+    def __init__(self, user, today=None):
+        self.user = user
+        self.today = today or timezone.localdate()
+
+    @cached_property
+    def version(self):
+        """Key of the cached fragment, changed by every write shown."""
+        latest = {
+            "orders": Order.objects.filter(user=self.user)
+            .order_by("-updated_at")
+            .values("updated_at")[:1],
+            "payments": VoucherBalance.objects.order_by("-updated_at").values(
+                "updated_at"
+            )[:1],
+            "deletions": OrderTombstone.objects.order_by("-deleted_at").values(
+                "deleted_at"
+            )[:1],
+        }
+        row = (
+            get_user_model()
+            .objects.filter(pk=self.user.pk)
+            .values_list(*(models.Subquery(query) for query in latest.values()))
+            .get()
+        )
+        return "|".join([self.today.isoformat(), *(str(value) for value in row)])
+
+    @cached_property
+    def today_orders(self):
+        start = timezone.make_aware(
+            datetime.datetime.combine(self.today, datetime.time.min)
+        )
+        return list(
+            Order.objects.filter(
+                user=self.user,
+                created_at__gte=start,
+                created_at__lt=start + datetime.timedelta(days=1),
+            )
+            .select_related("identities")
+            .with_payments()
+            .order_by("-created_at")
+        )
+
+    @cached_property
+    def _unpaid(self):
+        return VoucherBalance.objects.outstanding().filter(
+            voucher__in=Voucher.objects.filter(orders__user=self.user)
+        )
+
+    @cached_property
+    def unpaid_vouchers(self):
+        return list(
+            self._unpaid.select_related("voucher").order_by("-rest_amount", "pk")[
+                :DASHBOARD_SIZE
+            ]
+        )
+
+    @cached_property
+    def unpaid_total(self):
+        return self._unpaid.total_receivables()
+
+    @cached_property
+    def recent_clients(self):
+        return list(
+            Customer.objects.filter(orders__user=self.user)
+            .annotate(
+                last_order_at=models.Max("orders__created_at"),
+                order_count=models.Count("orders"),
+            )
+            .order_by("-last_order_at", "-pk")[:DASHBOARD_SIZE]
+        )
@@ -0,0 +1,127 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Streaming CSV exports of orders and voucher payments.
+
+Rows are produced from ``QuerySet.iterator(chunk_size=...)`` with the related
+objects joined or prefetched per chunk, so memory stays flat whatever the
+number of rows, and the CSV is generated while it is being sent.
+"""
+import csv
+
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Product
+
+CHUNK_SIZE = 2000
+
+ORDER_HEADER = [
+    "order",
+    "created_at",
+    "optician",
+    "first_name",
+    "last_name",
+    "phone_number",
+    "institution",
+    "products",
+    "total",
+    "paid",
+    "rest",
+]
+PAYMENT_HEADER = [
+    "payment_date",
+    "amount",
+    "payment_ref",
+    "payment_method",
+    "voucher",
+    "orders",
+]
+
+
+# Cells starting with these run as formulas in the spreadsheets
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def text_cell(value):
+    """Return the free text ``value`` quoted so a spreadsheet shows it as
+    text: ``'=1+1``."""
+    value = value or ""
+    return f"'{value}" if value.startswith(FORMULA_PREFIXES) else value
+
+
+class Echo:
+    """File-like object handing back what csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+def order_rows(queryset, chunk_size=CHUNK_SIZE):
+    queryset = (
+        queryset.with_payments()
+        .select_related("user", "identities", "contacts", "institutions")
+        .prefetch_related(
+            # Product labels come from the catalog cache
+            Prefetch("products", queryset=Product.objects.order_by("pk"))
+        )
+        .order_by("pk")
+    )
+    for order in queryset.iterator(chunk_size=chunk_size):
+        identity = getattr(order, "identities", None)
+        contact = getattr(order, "contacts", None)
+        institution = getattr(order, "institutions", None)
+        yield [
+            str(order),
+            order.created_at and timezone.localtime(order.created_at).isoformat(),
+            text_cell(order.user.get_username()),
+            text_cell(identity.first_name if identity else ""),
+            text_cell(identity.last_name if identity else ""),
+            text_cell(contact.phone_number if contact else ""),
+            text_cell(institution.title if institution else ""),
+            text_cell(
+                "; ".join(
+                    f"{product}: {product.price}" for product in order.products.all()
+                )
+            ),
+            order.total_amount,
+            order.paid,
+            order.rest,
+        ]
+
+
+def payment_rows(queryset, chunk_size=CHUNK_SIZE):
+    queryset = (
+        queryset.select_related("voucher")
+        .prefetch_related("voucher__orders")
+        .order_by("payment_date", "pk")
+    )
+    for line in queryset.iterator(chunk_size=chunk_size):
+        yield [
+            line.payment_date.isoformat(),
+            line.amount,
+            text_cell(line.payment_ref),
+            line.voucher.get_payment_method_display(),
+            line.voucher_id,
+            " ".join(str(order) for order in line.voucher.orders.all()),
+        ]
+
+
+def iter_csv(header, rows):
+    """Yield CSV encoded lines, starting with a BOM so Excel reads UTF-8."""
+    writer = csv.writer(Echo())
+    yield "\ufeff" + writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def csv_response(filename, header, rows):
+    response = StreamingHttpResponse(
+        iter_csv(header, rows), content_type="text/csv; charset=utf-8"
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
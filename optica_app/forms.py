@@ -1,31 +1,80 @@
 from django import forms
+from django.forms import modelform_factory
+from django.urls import reverse
 from .models import Identity, Contact, Institution, Order, PrescriptionDetail, Product, Frame, GlassType, Lens, Voucher, VoucherLine
 
 
+class AutocompleteSelect(forms.Select):
+    """Select searched through the optica_app:autocomplete endpoint.
+
+    Only the selected option is rendered, so the page weight does not grow
+    with the number of frames, lenses or orders.
+    """
+
+    class Media:
+        css = {"all": ("admin/css/vendor/select2/select2.min.css",)}
+        js = (
+            "admin/js/vendor/jquery/jquery.min.js",
+            "admin/js/vendor/select2/select2.full.min.js",
+            "optica_app/js/autocomplete.js",
+        )
+
+    def __init__(self, source, attrs=None):
+        super().__init__(attrs)
+        self.source = source
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context["widget"]["attrs"]["data-autocomplete-url"] = reverse(
+            "optica_app:autocomplete", args=[self.source]
+        )
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        # str.isdigit() accepts "²", which the primary keys do not
+        selected = [pk for pk in value if str(pk).isascii() and str(pk).isdecimal()]
+        options = [self.create_option(name, "", "", not selected, 0)]
+        if selected:
+            for index, obj in enumerate(
+                self.choices.queryset.filter(pk__in=selected), start=1
+            ):
+                options.append(self.create_option(name, obj.pk, str(obj), True, index))
+        return [(None, options, 0)]
+
+
 class IdentityForm(forms.ModelForm):
     class Meta:
         model = Identity
         fields = '__all__'
+        widgets = {"order": AutocompleteSelect("order")}
 
 class ContactForm(forms.ModelForm):
     class Meta:
         model = Contact
         fields = '__all__'
+        widgets = {"order": AutocompleteSelect("order")}
 
 class InstitutionForm(forms.ModelForm):
     class Meta:
         model = Institution
         fields = '__all__'
+        widgets = {"order": AutocompleteSelect("order")}
 
 class PrescriptionDetailForm(forms.ModelForm):
     class Meta:
         model = PrescriptionDetail
         fields = '__all__'
+        widgets = {"order": AutocompleteSelect("order")}
 
 class ProductForm(forms.ModelForm):
     class Meta:
         model = Product
         fields = '__all__'
+        widgets = {
+            "order": AutocompleteSelect("order"),
+            "frame": AutocompleteSelect("frame"),
+            "lens": AutocompleteSelect("lens"),
+        }
 
 class FrameForm(forms.ModelForm):
     class Meta:
@@ -58,6 +107,27 @@ class OrderForm(forms.ModelForm):
         fields = '__all__'
 
 class TunnelForm(forms.ModelForm):
+    """Order part of the tunnel form, the children have their own forms."""
+
     class Meta:
         model = Order
-        fields = '__all__'
\ No newline at end of file
+        fields = ["user"]
+
+
+def child_form(form_class):
+    """``form_class`` without its order field, for the forms creating the
+    order along with its children."""
+    return modelform_factory(form_class._meta.model, form=form_class, exclude=["order"])
+
+
+TUNNEL_FORMS = {
+    "identity": child_form(IdentityForm),
+    "contact": child_form(ContactForm),
+    "institution": child_form(InstitutionForm),
+    "prescription": child_form(PrescriptionDetailForm),
+    "product": child_form(ProductForm),
+}
+
+ProductFormSet = forms.formset_factory(
+    TUNNEL_FORMS["product"], extra=2, min_num=1, validate_min=True
+)
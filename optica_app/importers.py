@@ -0,0 +1,198 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Streaming import of full historical orders.
+
+Records are read lazily from a JSONL or CSV file, validated with the model
+field validators (no ``full_clean()``, so no query per row) and written by
+chunks, each chunk in its own transaction with one ``bulk_create`` per table
+(see ``orders``).
+
+A JSONL line holds one order::
+
+    {"user": "alex", "created_at": "2023-05-02T10:00:00+00:00",
+     "identity": {"first_name": "Ana", "last_name": "Pop"},
+     "contact": {"phone_number": "+40722000000"},
+     "institution": {"title": "...", "address": "..."},
+     "prescription": {"fare_od_spheric": "-1.25", ...},
+     "products": [{"price": "450.00", "frame": 1, "glass_type": 2, "lens": 3}]}
+
+A CSV row holds one product line; consecutive rows sharing an ``order_ref``
+belong to the same order and the order columns are read from its first row.
+A row without ``order_ref`` is an order of its own. See
+``CSV_ORDER_COLUMNS`` and ``CSV_PRODUCT_COLUMNS``; the header must hold at
+least ``CSV_REQUIRED_COLUMNS``.
+"""
+import csv
+import json
+import time
+from dataclasses import dataclass
+from itertools import groupby
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import PrescriptionDetail
+from .orders import catalog_keys, parse_order, write_orders
+
+PRESCRIPTION_FIELDS = [
+    f.name
+    for f in PrescriptionDetail._meta.concrete_fields
+    if not f.primary_key and not f.is_relation
+]
+CSV_ORDER_COLUMNS = [
+    "order_ref",
+    "user",
+    "created_at",
+    "first_name",
+    "last_name",
+    "phone_number",
+    "institution_title",
+    "institution_address",
+    *PRESCRIPTION_FIELDS,
+]
+CSV_PRODUCT_COLUMNS = ["price", "frame", "glass_type", "lens"]
+CSV_REQUIRED_COLUMNS = ["order_ref", *CSV_PRODUCT_COLUMNS]
+
+
+def read_jsonl(stream):
+    """Yield ``(line number, record)`` for each non blank line.
+
+    Lines that are not valid JSON are yielded as is, to be rejected.
+    """
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError:
+            yield line_no, line
+
+
+def read_csv(stream):
+    """Yield ``(line number, record)`` for each order of a CSV stream.
+
+    Raise a ValidationError when columns of ``CSV_REQUIRED_COLUMNS`` are
+    missing from the header.
+    """
+    reader = csv.DictReader(stream)
+    missing = [
+        column
+        for column in CSV_REQUIRED_COLUMNS
+        if column not in (reader.fieldnames or [])
+    ]
+    if missing:
+        raise ValidationError({"header": [f"Missing columns: {', '.join(missing)}."]})
+    rows = (
+        (line_no, {key: value or None for key, value in row.items()})
+        for line_no, row in enumerate(reader, start=2)
+    )
+
+    def order_key(item):
+        line_no, row = item
+        return row["order_ref"] or (line_no,)
+
+    for _, group in groupby(rows, key=order_key):
+        group = list(group)
+        line_no, first = group[0]
+        yield line_no, {
+            "user": first.get("user"),
+            "created_at": first.get("created_at"),
+            "identity": {
+                "first_name": first.get("first_name"),
+                "last_name": first.get("last_name"),
+            },
+            "contact": {"phone_number": first.get("phone_number")},
+            "institution": {
+                "title": first.get("institution_title"),
+                "address": first.get("institution_address"),
+            },
+            "prescription": {name: first.get(name) for name in PRESCRIPTION_FIELDS},
+            "products": [
+                {column: row[column] for column in CSV_PRODUCT_COLUMNS}
+                for _, row in group
+                if row.get("price") is not None
+            ],
+        }
+
+
+READERS = {"jsonl": read_jsonl, "csv": read_csv}
+
+
+@dataclass
+class ImportReport:
+    records: int = 0
+    orders: int = 0
+    products: int = 0
+    rejected: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        return self.records / self.elapsed if self.elapsed else 0.0
+
+
+def import_orders(records, chunk_size=500, rejects=None, progress=None):
+    """Import ``(line number, record)`` pairs, e.g. from ``read_jsonl()``.
+
+    Rejected records are written as JSON lines to the ``rejects`` stream when
+    given. ``progress`` is called with the running ImportReport after each
+    chunk.
+    """
+    User = get_user_model()
+    catalog = catalog_keys()
+    users = {}
+    report = ImportReport()
+    started = time.monotonic()
+
+    def reject(line_no, record, errors):
+        report.rejected += 1
+        if rejects is not None:
+            rejects.write(
+                json.dumps(
+                    {"line": line_no, "errors": errors, "record": record},
+                    default=str,
+                )
+                + "\n"
+            )
+
+    def flush(chunk):
+        missing = {parsed.username for parsed in chunk} - users.keys()
+        if missing:
+            users.update(
+                User.objects.filter(
+                    **{f"{User.USERNAME_FIELD}__in": missing}
+                ).values_list(User.USERNAME_FIELD, "pk")
+            )
+        valid = []
+        for parsed in chunk:
+            parsed.user_id = users.get(parsed.username)
+            if parsed.user_id is None:
+                reject(parsed.line_no, parsed.record, {"user": ["Unknown user."]})
+            else:
+                valid.append(parsed)
+        if valid:
+            with transaction.atomic():
+                orders = write_orders(valid)
+            report.orders += len(orders)
+            report.products += sum(len(parsed.products) for parsed in valid)
+        report.elapsed = time.monotonic() - started
+        if progress is not None:
+            progress(report)
+
+    chunk = []
+    for line_no, record in records:
+        report.records += 1
+        try:
+            chunk.append(parse_order(line_no, record, catalog))
+        except ValidationError as error:
+            reject(line_no, record, error.message_dict)
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    flush(chunk)
+    return report
@@ -0,0 +1,96 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connections, transaction
+
+PROFILES = {
+    "default": {"ENGINE": "django.db.backends.sqlite3"},
+    "production": {"ENGINE": "alexandru_optica_app.sqlite"},
+}
+
+
+def write(alias, writer):
+    """One write transaction reading before writing, like a form save."""
+    with transaction.atomic(using=alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM benchmark WHERE writer = %s", [writer])
+            cursor.execute(
+                "INSERT INTO benchmark (writer, payload) VALUES (%s, %s)",
+                [writer, "x" * 200],
+            )
+
+
+def run(alias, writers, seconds):
+    """Return ``(committed, failed)`` transactions of ``writers`` threads
+    writing for ``seconds``."""
+    counts = [[0, 0] for _ in range(writers)]
+    start = threading.Barrier(writers)
+
+    def loop(writer):
+        start.wait()
+        deadline = time.monotonic() + seconds
+        try:
+            while time.monotonic() < deadline:
+                try:
+                    write(alias, writer)
+                    counts[writer][0] += 1
+                except DatabaseError:
+                    counts[writer][1] += 1
+        finally:
+            connections[alias].close()
+
+    threads = [threading.Thread(target=loop, args=[i]) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return tuple(map(sum, zip(*counts)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the write throughput of the default and production SQLite "
+        "profiles with concurrent writers, on temporary databases."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--writers", type=int, nargs="+", default=[1, 4, 16], metavar="N"
+        )
+        parser.add_argument("--seconds", type=float, default=3)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'profile':<12}{'writers':>8}{'commits/s':>12}{'failed':>8}"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for name, profile in PROFILES.items():
+                alias = f"benchmark_{name}"
+                connections.settings[alias] = connections.configure_settings(
+                    {"default": {}, alias: {**profile, "NAME": Path(directory, name)}}
+                )[alias]
+                with connections[alias].cursor() as cursor:
+                    cursor.execute(
+                        "CREATE TABLE benchmark (id INTEGER PRIMARY KEY, "
+                        "writer INTEGER, payload TEXT)"
+                    )
+                    cursor.execute(
+                        "CREATE INDEX benchmark_writer ON benchmark (writer)"
+                    )
+                connections[alias].close()
+                for writers in options["writers"]:
+                    committed, failed = run(alias, writers, options["seconds"])
+                    self.stdout.write(
+                        f"{name:<12}{writers:>8}"
+                        f"{committed / options['seconds']:>12.0f}{failed:>8}"
+                    )
+                del connections.settings[alias]
@@ -0,0 +1,32 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+from django.core.management.base import BaseCommand
+
+from optica_app.models import SlowQuery
+from optica_app.slowqueries import EXPLAIN_TOP, explain
+
+
+class Command(BaseCommand):
+    help = (
+        "Explain the slow queries of the most total time, print their full "
+        "scans and suggested indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=EXPLAIN_TOP)
+
+    def handle(self, *args, **options):
+        for slow_query in SlowQuery.objects.order_by("-total_time")[: options["top"]]:
+            explain(slow_query)
+            self.stdout.write(
+                f"{slow_query.total_time:10.0f} ms {slow_query.calls:8} calls  "
+                f"{slow_query.sql[:100]}"
+            )
+            for table in slow_query.full_scans:
+                self.stdout.write(f"    full scan of {table}")
+            for index in slow_query.suggested_indexes:
+                self.stdout.write(f"    suggested index: {index}")
@@ -0,0 +1,60 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import datetime
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from optica_app.exports import (
+    CHUNK_SIZE,
+    ORDER_HEADER,
+    PAYMENT_HEADER,
+    iter_csv,
+    order_rows,
+    payment_rows,
+)
+from optica_app.models import Order, VoucherLine
+
+
+class Command(BaseCommand):
+    help = "Export orders or voucher payments as CSV, streamed row by row."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=["orders", "payments"])
+        parser.add_argument(
+            "--since",
+            type=datetime.date.fromisoformat,
+            help="First day included (YYYY-MM-DD).",
+        )
+        parser.add_argument(
+            "--until",
+            type=datetime.date.fromisoformat,
+            help="Last day included (YYYY-MM-DD).",
+        )
+        parser.add_argument(
+            "--output", type=Path, help="Output file (default: stdout)."
+        )
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options["kind"] == "orders":
+            queryset, date_field = Order.objects.all(), "created_at__date"
+            header, rows = ORDER_HEADER, order_rows
+        else:
+            queryset, date_field = VoucherLine.objects.all(), "payment_date"
+            header, rows = PAYMENT_HEADER, payment_rows
+        if options["since"]:
+            queryset = queryset.filter(**{f"{date_field}__gte": options["since"]})
+        if options["until"]:
+            queryset = queryset.filter(**{f"{date_field}__lte": options["until"]})
+        lines = iter_csv(header, rows(queryset, chunk_size=options["chunk_size"]))
+        if options["output"] is None:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        with options["output"].open("w", newline="", encoding="utf-8") as output:
+            output.writelines(lines)
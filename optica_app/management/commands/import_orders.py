@@ -0,0 +1,81 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import contextlib
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from optica_app.importers import READERS, import_orders
+
+
+class Command(BaseCommand):
+    help = "Import full orders from a JSONL or CSV file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path)
+        parser.add_argument(
+            "--format",
+            choices=sorted(READERS),
+            help="File format (default: guessed from the file extension).",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Number of orders inserted per transaction (default: 500).",
+        )
+        parser.add_argument(
+            "--rejects",
+            type=Path,
+            help="Write rejected records to this JSONL file "
+            "(default: <path>.rejects.jsonl).",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or path.suffix.lstrip(".").lower()
+        if file_format not in READERS:
+            raise CommandError(f"Unknown format {file_format!r}, use --format.")
+        rejects_path = options["rejects"] or path.with_name(
+            f"{path.name}.rejects.jsonl"
+        )
+
+        def progress(report):
+            if options["verbosity"] > 1:
+                self.stdout.write(
+                    f"{report.records} records, {report.orders} orders, "
+                    f"{report.rejected} rejected ({report.rate:.0f} rows/s)"
+                )
+
+        with contextlib.ExitStack() as stack:
+            source = stack.enter_context(path.open(newline="", encoding="utf-8"))
+            rejects = stack.enter_context(rejects_path.open("w", encoding="utf-8"))
+            try:
+                report = import_orders(
+                    READERS[file_format](source),
+                    chunk_size=options["chunk_size"],
+                    rejects=rejects,
+                    progress=progress,
+                )
+            except ValidationError as error:
+                raise CommandError(" ".join(error.messages))
+        if not report.rejected:
+            rejects_path.unlink()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {report.orders} orders ({report.products} products) "
+                f"from {report.records} records in {report.elapsed:.1f}s "
+                f"({report.rate:.0f} rows/s)."
+            )
+        )
+        if report.rejected:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{report.rejected} records rejected, see {rejects_path}."
+                )
+            )
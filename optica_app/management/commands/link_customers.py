@@ -0,0 +1,37 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+from django.core.management.base import BaseCommand
+
+from optica_app.customers import link_orders
+from optica_app.models import Customer, Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Link the orders without a customer to their customer, merging "
+        "duplicates. Safe to interrupt and run again."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of orders linked per transaction (default: 1000).",
+        )
+
+    def handle(self, *args, **options):
+        def progress(linked, last_pk):
+            if options["verbosity"] > 1:
+                self.stdout.write(f"Linked {linked} orders, up to {Order(pk=last_pk)}")
+
+        linked = link_orders(chunk_size=options["chunk_size"], progress=progress)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Linked {linked} orders, {Customer.objects.count()} customers."
+            )
+        )
@@ -0,0 +1,31 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import json
+
+from django.core.management.base import BaseCommand
+
+from optica_app.analytics import prescription_statistics
+from optica_app.models import PrescriptionDetail
+
+
+class Command(BaseCommand):
+    help = "Print population statistics over all prescriptions as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            help="Only prescriptions of orders created from this date (YYYY-MM-DD).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=10000)
+        parser.add_argument("--indent", type=int, default=2)
+
+    def handle(self, *args, **options):
+        queryset = PrescriptionDetail.objects.all()
+        if options["since"]:
+            queryset = queryset.filter(order__created_at__date__gte=options["since"])
+        statistics = prescription_statistics(queryset, chunk_size=options["chunk_size"])
+        self.stdout.write(json.dumps(statistics, indent=options["indent"] or None))
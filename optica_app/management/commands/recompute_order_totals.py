@@ -0,0 +1,46 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from optica_app.models import Order
+
+
+class Command(BaseCommand):
+    help = "Repair drift between Order.total_amount and the sum of its products."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of orders recomputed per transaction (default: 1000).",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_pk = 0
+        seen = repaired = 0
+        while True:
+            pks = list(
+                Order.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+            with transaction.atomic():
+                repaired += (
+                    Order.objects.filter(pk__in=pks).drifted().recompute_total_amount()
+                )
+            last_pk = pks[-1]
+            seen += len(pks)
+            if options["verbosity"] > 1:
+                self.stdout.write(f"Checked {seen} orders, up to {Order(pk=last_pk)}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Checked {seen} orders, repaired {repaired} totals.")
+        )
@@ -0,0 +1,76 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a stand-in of the Loki push endpoint, to load test the log "
+        "shipping without a collector: point LOKI_URL to "
+        "http://HOST:PORT/loki/api/v1/push."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=3100)
+        parser.add_argument(
+            "--delay",
+            type=float,
+            default=0,
+            help="Seconds to wait before answering a push, as a slow collector.",
+        )
+        parser.add_argument("--output", help="Append the received lines to a file.")
+
+    def handle(self, *args, **options):
+        lock = threading.Lock()
+        counts = {"batches": 0, "lines": 0, "bytes": 0}
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    if self.headers.get("Content-Encoding") == "gzip":
+                        body = gzip.decompress(body)
+                    streams = json.loads(body)["streams"]
+                except (OSError, ValueError, KeyError):
+                    self.send_error(400)
+                    return
+                time.sleep(options["delay"])
+                lines = [line for stream in streams for _, line in stream["values"]]
+                with lock:
+                    counts["batches"] += 1
+                    counts["lines"] += len(lines)
+                    counts["bytes"] += len(body)
+                    if options["output"]:
+                        with open(options["output"], "a") as file:
+                            file.writelines(f"{line}\n" for line in lines)
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((options["host"], options["port"]), Handler)
+        self.stdout.write(f"Listening on http://{options['host']}:{options['port']}/")
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            while True:
+                time.sleep(5)
+                with lock:
+                    self.stdout.write(
+                        "{batches} batches, {lines} lines, {bytes} bytes".format(
+                            **counts
+                        )
+                    )
+        except KeyboardInterrupt:
+            server.shutdown()
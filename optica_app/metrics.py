@@ -0,0 +1,38 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Business metrics of the shop, see ``alexandru_optica_app.metrics``.
+
+The counters are incremented when their transaction commits.
+"""
+from django.db import transaction
+
+from alexandru_optica_app.metrics import Counter, Gauge
+
+from .models import VoucherBalance
+
+orders_created = Counter("optica_orders_created_total", "Orders created.")
+payments = Counter("optica_payments_total", "Payments recorded on vouchers.")
+payments_amount = Counter(
+    "optica_payments_amount_total", "Amount of the payments recorded on vouchers."
+)
+receivables = Gauge(
+    "optica_receivables",
+    "Rest to pay of the vouchers still owing money.",
+    function=lambda: VoucherBalance.objects.total_receivables(),
+)
+
+
+def order_created(count=1):
+    transaction.on_commit(lambda: orders_created.inc(count))
+
+
+def payment_recorded(amount):
+    def inc():
+        payments.inc()
+        payments_amount.inc(float(amount))
+
+    transaction.on_commit(inc)
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:23
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_total_amount(apps, schema_editor):
+    Order = apps.get_model("optica_app", "Order")
+    Product = apps.get_model("optica_app", "Product")
+    products_sum = (
+        Product.objects.filter(order=models.OuterRef("pk"))
+        .order_by()
+        .values("order")
+        .annotate(total=models.Sum("price"))
+        .values("total")
+    )
+    Order.objects.using(schema_editor.connection.alias).update(
+        total_amount=Coalesce(
+            models.Subquery(products_sum),
+            models.Value(Decimal("0.00")),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("optica_app", "0003_alter_voucherline_voucher"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="product",
+            options={"base_manager_name": "objects"},
+        ),
+        migrations.AddField(
+            model_name="order",
+            name="total_amount",
+            field=models.DecimalField(
+                db_index=True,
+                decimal_places=2,
+                default=Decimal("0.00"),
+                editable=False,
+                max_digits=12,
+                verbose_name="Total price",
+            ),
+        ),
+        migrations.RunPython(backfill_total_amount, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:26
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def backfill_voucher_balances(apps, schema_editor):
+    Voucher = apps.get_model("optica_app", "Voucher")
+    VoucherBalance = apps.get_model("optica_app", "VoucherBalance")
+    db_alias = schema_editor.connection.alias
+    balances = []
+    for voucher in Voucher.objects.using(db_alias).iterator():
+        orders_total = voucher.orders.aggregate(models.Sum("total_amount"))[
+            "total_amount__sum"
+        ] or Decimal("0.00")
+        lines = voucher.voucher_lines.aggregate(
+            paid=models.Sum("amount"), last=models.Max("payment_date")
+        )
+        paid_total = lines["paid"] or Decimal("0.00")
+        balances.append(
+            VoucherBalance(
+                voucher=voucher,
+                orders_total=orders_total,
+                paid_total=paid_total,
+                rest_amount=orders_total - paid_total,
+                last_payment_date=lines["last"],
+            )
+        )
+    VoucherBalance.objects.using(db_alias).bulk_create(balances, batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("optica_app", "0004_order_total_amount"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="VoucherBalance",
+            fields=[
+                (
+                    "voucher",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="balance",
+                        serialize=False,
+                        to="optica_app.voucher",
+                    ),
+                ),
+                (
+                    "orders_total",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=12
+                    ),
+                ),
+                (
+                    "paid_total",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=12
+                    ),
+                ),
+                (
+                    "rest_amount",
+                    models.DecimalField(
+                        db_index=True,
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=12,
+                    ),
+                ),
+                ("last_payment_date", models.DateField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Voucher balance",
+                "verbose_name_plural": "Voucher balances",
+            },
+        ),
+        migrations.AlterModelOptions(
+            name="voucherline",
+            options={"base_manager_name": "objects"},
+        ),
+        migrations.RunPython(backfill_voucher_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("optica_app", "0005_voucherbalance"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="prescriptiondetail",
+            index=models.Index(
+                fields=["fare_od_spheric"], name="prescr_fare_od_sph_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prescriptiondetail",
+            index=models.Index(
+                fields=["fare_os_spheric"], name="prescr_fare_os_sph_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prescriptiondetail",
+            index=models.Index(
+                fields=["fare_od_cylindric"], name="prescr_fare_od_cyl_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prescriptiondetail",
+            index=models.Index(
+                fields=["fare_os_cylindric"], name="prescr_fare_os_cyl_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="prescriptiondetail",
+            index=models.Index(
+                fields=["fare_pupillary_distance"], name="prescr_fare_pd_idx"
+            ),
+        ),
+    ]
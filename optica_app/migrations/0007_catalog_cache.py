@@ -0,0 +1,51 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:40
+
+import django.db.models.deletion
+import optica_app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("optica_app", "0006_prescriptiondetail_range_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CacheVersion",
+            fields=[
+                (
+                    "key",
+                    models.CharField(max_length=100, primary_key=True, serialize=False),
+                ),
+                ("version", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="product",
+            name="frame",
+            field=optica_app.models.CatalogForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="product_set",
+                to="optica_app.frame",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="product",
+            name="glass_type",
+            field=optica_app.models.CatalogForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="product_set",
+                to="optica_app.glasstype",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="product",
+            name="lens",
+            field=optica_app.models.CatalogForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="product_set",
+                to="optica_app.lens",
+            ),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:41
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("optica_app", "0007_catalog_cache"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="frame",
+            index=models.Index(
+                django.db.models.functions.text.Lower("title"),
+                name="frame_title_lower_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="lens",
+            index=models.Index(
+                django.db.models.functions.text.Lower("title"),
+                name="lens_title_lower_idx",
+            ),
+        ),
+    ]
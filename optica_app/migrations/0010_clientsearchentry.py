@@ -0,0 +1,85 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from optica_app.search import DROP_FTS_SQL, FTS_SQL, fold, phone_digits
+
+
+def backfill_client_search(apps, schema_editor):
+    Order = apps.get_model("optica_app", "Order")
+    ClientSearchEntry = apps.get_model("optica_app", "ClientSearchEntry")
+    db_alias = schema_editor.connection.alias
+    rows = (
+        Order.objects.using(db_alias)
+        .order_by("pk")
+        .values_list(
+            "pk",
+            "identities__first_name",
+            "identities__last_name",
+            "contacts__phone_number",
+            "institutions__title",
+            "institutions__address",
+        )
+    )
+    entries = []
+    for pk, first_name, last_name, phone_number, title, address in rows.iterator(
+        chunk_size=2000
+    ):
+        entries.append(
+            ClientSearchEntry(
+                order_id=pk,
+                name=fold(f"{first_name or ''} {last_name or ''}").strip(),
+                phone=phone_digits(phone_number),
+                institution=fold(f"{title or ''} {address or ''}").strip(),
+            )
+        )
+        if len(entries) == 2000:
+            ClientSearchEntry.objects.using(db_alias).bulk_create(entries)
+            entries = []
+    ClientSearchEntry.objects.using(db_alias).bulk_create(entries)
+
+
+def create_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in FTS_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in DROP_FTS_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("optica_app", "0009_order_date_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ClientSearchEntry",
+            fields=[
+                (
+                    "order",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="search_entry",
+                        serialize=False,
+                        to="optica_app.order",
+                    ),
+                ),
+                ("name", models.CharField(blank=True, max_length=201)),
+                ("phone", models.CharField(blank=True, max_length=20)),
+                ("institution", models.TextField(blank=True)),
+            ],
+            options={
+                "verbose_name": "Client search entry",
+                "verbose_name_plural": "Client search entries",
+            },
+        ),
+        migrations.RunPython(backfill_client_search, migrations.RunPython.noop),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
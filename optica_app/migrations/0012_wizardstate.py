@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("optica_app", "0011_customer"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WizardState",
+            fields=[
+                (
+                    "token",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("data", models.JSONField()),
+                ("updated_at", models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("optica_app", "0012_wizardstate"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(fields=["updated_at", "id"], name="order_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="voucherbalance",
+            index=models.Index(
+                fields=["updated_at", "voucher"], name="voucherbalance_updated_idx"
+            ),
+        ),
+    ]
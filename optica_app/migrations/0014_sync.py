@@ -0,0 +1,58 @@
+# Generated by Django 5.0.4 on 2026-10-18 07:10
+
+import uuid
+
+from django.db import migrations, models
+
+
+def fill_order_uuids(apps, schema_editor):
+    Order = apps.get_model("optica_app", "Order")
+    db_alias = schema_editor.connection.alias
+    orders = []
+    for pk in Order.objects.using(db_alias).values_list("pk", flat=True).iterator():
+        orders.append(Order(pk=pk, uuid=uuid.uuid4()))
+        if len(orders) == 2000:
+            Order.objects.using(db_alias).bulk_update(orders, ["uuid"])
+            orders = []
+    Order.objects.using(db_alias).bulk_update(orders, ["uuid"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("optica_app", "0013_api_cursor_indexes"),
+    ]
+
+    operations = [
+        # Filled before the unique constraint: a callable default is only
+        # evaluated once for the existing rows
+        migrations.AddField(
+            model_name="order",
+            name="uuid",
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_order_uuids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="order",
+            name="uuid",
+            field=models.UUIDField(
+                default=uuid.uuid4, editable=False, null=True, unique=True
+            ),
+        ),
+        migrations.CreateModel(
+            name="OrderTombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("order_id", models.PositiveBigIntegerField()),
+                ("uuid", models.UUIDField(null=True)),
+                ("deleted_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.4 on 2026-10-18 07:16
+
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("optica_app", "0015_dashboard_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlowQuery",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fingerprint", models.CharField(max_length=40, unique=True)),
+                ("database", models.CharField(default="default", max_length=100)),
+                ("sql", models.TextField()),
+                ("sample_sql", models.TextField()),
+                (
+                    "sample_params",
+                    models.JSONField(
+                        default=list,
+                        encoder=django.core.serializers.json.DjangoJSONEncoder,
+                    ),
+                ),
+                ("calls", models.PositiveBigIntegerField(default=0)),
+                ("total_time", models.FloatField(default=0)),
+                ("max_time", models.FloatField(default=0)),
+                ("first_seen", models.DateTimeField(auto_now_add=True)),
+                ("last_seen", models.DateTimeField(default=django.utils.timezone.now)),
+                ("plan", models.TextField(blank=True)),
+                ("full_scans", models.JSONField(default=list)),
+                ("suggested_indexes", models.JSONField(default=list)),
+                ("explained_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name_plural": "slow queries",
+            },
+        ),
+    ]
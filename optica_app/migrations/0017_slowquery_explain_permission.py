@@ -0,0 +1,19 @@
+# Generated by Django 5.0.4 on 2026-10-18 07:44
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("optica_app", "0016_slowquery"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="slowquery",
+            options={
+                "permissions": [("explain_slowquery", "Can explain slow queries")],
+                "verbose_name_plural": "slow queries",
+            },
+        ),
+    ]
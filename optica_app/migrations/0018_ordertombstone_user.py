@@ -0,0 +1,21 @@
+# Generated by Django 5.0.4 on 2026-10-18 08:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("optica_app", "0017_slowquery_explain_permission"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ordertombstone",
+            name="user_id",
+            field=models.PositiveBigIntegerField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name="ordertombstone",
+            index=models.Index(fields=["user_id", "id"], name="tombstone_user_idx"),
+        ),
+    ]
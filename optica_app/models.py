@@ -4,29 +4,306 @@
 # Copyright © Simon ANDRÉ <simon@emencia.com>
 # project: AlexandruOpticaApp
 # github: https://github.com/boot-sandre/alexandru-optica-app/
+import datetime
+import uuid
 from decimal import Decimal
 
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MaxValueValidator, MinValueValidator, RegexValidator
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce, Greatest, Least, Lower, Now
+from django.utils import timezone
+
+from . import search
+from .catalog import CatalogChoiceField, catalog
+
+
+class CatalogForeignKey(models.ForeignKey):
+    """ForeignKey to a catalog model, validated and offered from the catalog
+    cache instead of the database."""
+
+    def validate(self, value, model_instance):
+        models.Field.validate(self, value, model_instance)
+        if value is not None and catalog.get(self.remote_field.model, value) is None:
+            raise ValidationError(
+                self.error_messages["invalid"],
+                code="invalid",
+                params={
+                    "model": self.remote_field.model._meta.verbose_name,
+                    "pk": value,
+                    "field": self.remote_field.field_name,
+                    "value": value,
+                },
+            )
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{"form_class": CatalogChoiceField, **kwargs})
+
+
+class ParentAggregateQuerySet(models.QuerySet):
+    """QuerySet for child rows summed into a stored aggregate on their parent.
+
+    Bulk and queryset writes bypass Model.save() and Model.delete(), so they
+    refresh the parents themselves, in the same transaction as the write.
+    """
+
+    def _refresh_parents(self, parent_ids):
+        parent_ids = {parent_id for parent_id in parent_ids if parent_id is not None}
+        if parent_ids:
+            self.model.refresh_parent_aggregates(parent_ids, using=self.db)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        parent_attname = self.model._meta.get_field(self.model.aggregate_parent).attname
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            self._refresh_parents(getattr(obj, parent_attname) for obj in objs)
+        return objs
+
+    def update(self, **kwargs):
+        parent_field = self.model._meta.get_field(self.model.aggregate_parent)
+        parent_names = {parent_field.name, parent_field.attname}
+        tracked = parent_names.union(self.model.aggregate_fields)
+        if not tracked.intersection(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            rows = list(self.values_list("pk", parent_field.attname))
+            updated = super().update(**kwargs)
+            parent_ids = {parent_id for _, parent_id in rows}
+            if parent_names.intersection(kwargs):
+                parent_ids.update(
+                    self.model._base_manager.using(self.db)
+                    .filter(pk__in=[pk for pk, _ in rows])
+                    .values_list(parent_field.attname, flat=True)
+                )
+            self._refresh_parents(parent_ids)
+        return updated
+
+    update.alters_data = True
+
+    def delete(self):
+        parent_attname = self.model._meta.get_field(self.model.aggregate_parent).attname
+        with transaction.atomic(using=self.db, savepoint=False):
+            parent_ids = set(self.values_list(parent_attname, flat=True))
+            deleted = super().delete()
+            self._refresh_parents(parent_ids)
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+class ParentAggregateModel(models.Model):
+    """Child model whose parent stores an aggregate of its rows.
+
+    Subclasses name the parent foreign key in ``aggregate_parent``, the
+    summed fields in ``aggregate_fields`` and implement
+    ``refresh_parent_aggregates``. Their manager must be built from
+    ParentAggregateQuerySet and be the base manager, so reverse related
+    managers (``parent.children.add/set``) go through it too.
+    """
+
+    aggregate_parent = None
+    aggregate_fields = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def refresh_parent_aggregates(cls, parent_ids, using=None):
+        raise NotImplementedError
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_parent_id = instance._parent_id()
+        return instance
+
+    def _parent_id(self):
+        parent_field = self._meta.get_field(self.aggregate_parent)
+        return self.__dict__.get(parent_field.attname)
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+            type(self)._base_manager.using(using)._refresh_parents(
+                {self._parent_id(), getattr(self, "_loaded_parent_id", None)}
+            )
+        self._loaded_parent_id = self._parent_id()
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            deleted = super().delete(using=using, keep_parents=keep_parents)
+            type(self)._base_manager.using(using)._refresh_parents(
+                {self._parent_id(), getattr(self, "_loaded_parent_id", None)}
+            )
+        return deleted
+
+
+class OrderQuerySet(models.QuerySet):
+    @staticmethod
+    def _products_total():
+        products_sum = (
+            Product.objects.filter(order=models.OuterRef("pk"))
+            .order_by()
+            .values("order")
+            .annotate(total=models.Sum("price"))
+            .values("total")
+        )
+        return Coalesce(
+            models.Subquery(products_sum),
+            models.Value(Decimal("0.00")),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        )
+
+    def drifted(self):
+        """Orders whose stored total no longer matches their products."""
+        return self.alias(products_total=self._products_total()).exclude(
+            total_amount=models.F("products_total")
+        )
+
+    def recompute_total_amount(self) -> int:
+        """Rewrite the stored total of every order in the queryset from its
+        products, in a single UPDATE statement, then refresh the receivables
+        of the vouchers paying for them."""
+        voucher_ids = set(
+            Voucher.orders.through.objects.using(self.db)
+            .filter(order__in=self.values("pk"))
+            .values_list("voucher_id", flat=True)
+        )
+        updated = self.update(total_amount=self._products_total(), updated_at=Now())
+        VoucherBalance.objects.using(self.db).refresh(voucher_ids)
+        return updated
+
+    def with_payments(self):
+        """Annotate ``paid`` and ``rest`` on each order.
+
+        A voucher's payments are allocated to its orders oldest first (by
+        primary key), the same way VoucherBalanceQuerySet.aging() does.
+        """
+        amount_field = models.DecimalField(max_digits=12, decimal_places=2)
+        zero = models.Value(Decimal("0.00"))
+        through = Voucher.orders.through
+        earlier_orders = (
+            through.objects.filter(
+                voucher=models.OuterRef("voucher"), order__lt=models.OuterRef("order")
+            )
+            .order_by()
+            .values("voucher")
+            .annotate(total=models.Sum("order__total_amount"))
+            .values("total")
+        )
+        allocated = (
+            through.objects.filter(order=models.OuterRef("pk"))
+            .annotate(
+                share=Greatest(
+                    Least(
+                        Coalesce(
+                            "voucher__balance__paid_total",
+                            zero,
+                            output_field=amount_field,
+                        )
+                        - Coalesce(
+                            models.Subquery(earlier_orders),
+                            zero,
+                            output_field=amount_field,
+                        ),
+                        models.F("order__total_amount"),
+                    ),
+                    zero,
+                    output_field=amount_field,
+                )
+            )
+            .order_by()
+            .values("order")
+            .annotate(total=models.Sum("share"))
+            .values("total")
+        )
+        return self.annotate(
+            paid=Coalesce(models.Subquery(allocated), zero, output_field=amount_field),
+            rest=models.ExpressionWrapper(
+                models.F("total_amount") - models.F("paid"), output_field=amount_field
+            ),
+        )
 
 
 class Order(models.Model):
     user = models.ForeignKey(
         get_user_model(), on_delete=models.CASCADE, related_name="orders"
     )
+    # Linked by optica_app.customers from the identity and contact
+    customer = models.ForeignKey(
+        "Customer",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="orders",
+    )
+    # Generated by the device creating the order, see optica_app.sync
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True, null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True, null=True, editable=False)
     updated_at = models.DateTimeField(auto_now=True, editable=False)
+    # Denormalized sum of products.price, kept exact by Product writes
+    total_amount = models.DecimalField(
+        "Total price",
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal("0.00"),
+        db_index=True,
+        editable=False,
+    )
+
+    objects = OrderQuerySet.as_manager()
 
     def total_price(self) -> Decimal:
-        return Decimal(
-            self.products.aggregate(models.Sum("price"))["price__sum"]
-            or Decimal("0.00")
-        )
+        return self.total_amount
+
+    def save(self, *args, **kwargs):
+        # total_amount is only written by OrderQuerySet.recompute_total_amount,
+        # a stale instance must not put back the total it was loaded with
+        if (
+            not self._state.adding
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+        ):
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name != "total_amount"
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def parse_code(value):
+        """Return the primary key from an ``ODR_000123`` code or a plain
+        number, None when ``value`` is neither."""
+        value = value.strip().upper().removeprefix("ODR_").removeprefix("ODR")
+        # isdigit() accepts "²", which int() does not
+        if not (value.isascii() and value.isdecimal()):
+            return None
+        pk = int(value)
+        # Out of the range of the database integers
+        return pk if pk < 2**63 else None
 
     class Meta:
         verbose_name = "Order"
         verbose_name_plural = "Orders"
+        indexes = [
+            # Date hierarchy and optician filters of the order related admins
+            models.Index(fields=["created_at"], name="order_created_idx"),
+            models.Index(fields=["user", "created_at"], name="order_user_created_idx"),
+            # Cursor of the API
+            models.Index(fields=["updated_at", "id"], name="order_updated_idx"),
+            # Version of the dashboards
+            models.Index(fields=["user", "updated_at"], name="order_user_updated_idx"),
+        ]
 
     def __str__(self):
         return f"ODR_{self.pk:06}"
@@ -81,6 +358,29 @@ class Institution(models.Model):
         return self.title
 
 
+class PrescriptionDetailQuerySet(models.QuerySet):
+    def in_range(self, field, low=None, high=None):
+        """Filter ``low <= field <= high``, either bound being optional."""
+        if low is not None:
+            self = self.filter(**{f"{field}__gte": low})
+        if high is not None:
+            self = self.filter(**{f"{field}__lte": high})
+        return self
+
+    def with_cylinder(self, distance="fare"):
+        """Prescriptions with a non zero cylinder on either eye.
+
+        Written as ranges rather than ``!= 0`` so the cylinder indexes apply.
+        """
+        condition = models.Q()
+        for eye in ("od", "os"):
+            field = f"{distance}_{eye}_cylindric"
+            condition |= models.Q(**{f"{field}__lt": 0}) | models.Q(
+                **{f"{field}__gt": 0}
+            )
+        return self.filter(condition)
+
+
 class PrescriptionDetail(models.Model):
     order = models.OneToOneField(
         Order, on_delete=models.CASCADE, related_name="prescriptions"
@@ -246,36 +546,88 @@ class PrescriptionDetail(models.Model):
         validators=pd_range_validator,
     )
 
+    objects = PrescriptionDetailQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Prescription Detail"
         verbose_name_plural = "Prescription Details"
+        # Range filters of the admin and of PrescriptionDetailQuerySet
+        indexes = [
+            models.Index(fields=["fare_od_spheric"], name="prescr_fare_od_sph_idx"),
+            models.Index(fields=["fare_os_spheric"], name="prescr_fare_os_sph_idx"),
+            models.Index(fields=["fare_od_cylindric"], name="prescr_fare_od_cyl_idx"),
+            models.Index(fields=["fare_os_cylindric"], name="prescr_fare_os_cyl_idx"),
+            models.Index(fields=["fare_pupillary_distance"], name="prescr_fare_pd_idx"),
+        ]
 
     def __str__(self):
         return f"Prescription for Order {self.order.pk}"
 
 
-class Product(models.Model):
+class Product(ParentAggregateModel):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="products")
     price = models.DecimalField(
         max_digits=10, decimal_places=2, validators=[MinValueValidator(0.00)]
     )
-    frame = models.ForeignKey(
+    frame = CatalogForeignKey(
         "Frame", on_delete=models.PROTECT, related_name="product_set"
     )
-    glass_type = models.ForeignKey(
+    glass_type = CatalogForeignKey(
         "GlassType", on_delete=models.PROTECT, related_name="product_set"
     )
-    lens = models.ForeignKey(
+    lens = CatalogForeignKey(
         "Lens", on_delete=models.PROTECT, related_name="product_set"
     )
 
+    aggregate_parent = "order"
+    aggregate_fields = ("price",)
+
+    objects = ParentAggregateQuerySet.as_manager()
+
+    class Meta:
+        base_manager_name = "objects"
+
+    @classmethod
+    def refresh_parent_aggregates(cls, parent_ids, using=None):
+        Order.objects.using(using).filter(pk__in=parent_ids).recompute_total_amount()
+
     def __str__(self):
-        return f"{self.frame} - {self.glass_type} - {self.lens}"
+        # Labels come from the catalog cache: no query per product
+        return " - ".join(
+            catalog.label(model, pk)
+            for model, pk in (
+                (Frame, self.frame_id),
+                (GlassType, self.glass_type_id),
+                (Lens, self.lens_id),
+            )
+        )
+
+
+class TitleQuerySet(models.QuerySet):
+    def title_prefix(self, term):
+        """Rows whose title starts with ``term``, case insensitive, ordered by
+        title.
+
+        Written as a range over ``Lower("title")`` rather than ``istartswith``
+        so the database walks the ``*_title_lower_idx`` index.
+        """
+        queryset = self.alias(title_lower=Lower("title")).order_by("title_lower", "pk")
+        term = term.strip().lower()
+        if not term:
+            return queryset
+        return queryset.filter(
+            title_lower__gte=term, title_lower__lt=term + "\U0010ffff"
+        )
 
 
 class Frame(models.Model):
     title = models.CharField(max_length=200)
 
+    objects = TitleQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(Lower("title"), name="frame_title_lower_idx")]
+
     def __str__(self):
         return self.title
 
@@ -317,10 +669,52 @@ class GlassType(models.Model):
 class Lens(models.Model):
     title = models.TextField()
 
+    objects = TitleQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(Lower("title"), name="lens_title_lower_idx")]
+
     def __str__(self):
         return self.title
 
 
+class VoucherQuerySet(models.QuerySet):
+    def with_balances(self):
+        """Annotate orders_total, lines_total and rest_total.
+
+        Each sum is a correlated subquery so the orders and voucher lines joins
+        never multiply each other, and the whole page is one SELECT.
+        """
+        amount_field = models.DecimalField(max_digits=12, decimal_places=2)
+        orders_sum = (
+            Voucher.orders.through.objects.filter(voucher=models.OuterRef("pk"))
+            .order_by()
+            .values("voucher")
+            .annotate(total=models.Sum("order__total_amount"))
+            .values("total")
+        )
+        lines_sum = (
+            VoucherLine.objects.filter(voucher=models.OuterRef("pk"))
+            .order_by()
+            .values("voucher")
+            .annotate(total=models.Sum("amount"))
+            .values("total")
+        )
+        zero = models.Value(Decimal("0.00"))
+        return self.annotate(
+            orders_total=Coalesce(
+                models.Subquery(orders_sum), zero, output_field=amount_field
+            ),
+            lines_total=Coalesce(
+                models.Subquery(lines_sum), zero, output_field=amount_field
+            ),
+            rest_total=models.ExpressionWrapper(
+                models.F("orders_total") - models.F("lines_total"),
+                output_field=amount_field,
+            ),
+        )
+
+
 class Voucher(models.Model):
     PAYMENT_CHOICES = [
         ("CASH", "Cash"),
@@ -330,28 +724,38 @@ class Voucher(models.Model):
     orders = models.ManyToManyField(Order, related_name="vouchers")
     payment_method = models.TextField("Payment Method", choices=PAYMENT_CHOICES)
 
+    objects = VoucherQuerySet.as_manager()
+
     def __str__(self):
         orders_display = [str(ord) for ord in self.orders.all()]
         # vouchers_display = [str(vou) for vou in self.voucher_lines.all()]
         return f"{orders_display}"
 
+    # The balance methods below reuse the values annotated by
+    # VoucherQuerySet.with_balances() when the instance was loaded from it.
     def orders_total_price(self) -> Decimal:
+        if hasattr(self, "orders_total"):
+            return self.orders_total
         return Decimal(
-            self.orders.aggregate(models.Sum("products__price"))["products__price__sum"]
+            self.orders.aggregate(models.Sum("total_amount"))["total_amount__sum"]
             or Decimal("0.00")
         )
 
     def voucher_lines_total_amount(self) -> Decimal:
+        if hasattr(self, "lines_total"):
+            return self.lines_total
         return Decimal(
             self.voucher_lines.aggregate(models.Sum("amount"))["amount__sum"]
             or Decimal("0.00")
         )
 
     def rest_amount(self) -> Decimal:
+        if hasattr(self, "rest_total"):
+            return self.rest_total
         return Decimal(self.orders_total_price() - self.voucher_lines_total_amount())
 
 
-class VoucherLine(models.Model):
+class VoucherLine(ParentAggregateModel):
     voucher = models.ForeignKey(
         Voucher, on_delete=models.PROTECT, related_name="voucher_lines"
     )
@@ -359,8 +763,443 @@ class VoucherLine(models.Model):
     payment_date = models.DateField()
     payment_ref = models.CharField(max_length=250, blank=True, null=True)
 
+    aggregate_parent = "voucher"
+    aggregate_fields = ("amount", "payment_date")
+
+    objects = ParentAggregateQuerySet.as_manager()
+
+    class Meta:
+        base_manager_name = "objects"
+
+    @classmethod
+    def refresh_parent_aggregates(cls, parent_ids, using=None):
+        VoucherBalance.objects.using(using).refresh(parent_ids)
+
     def __str__(self):
         ref_display = f"ref: { self.payment_ref } // " if self.payment_ref else ""
         date_display = f"date: { self.payment_date } // "
         amount_display = f"amount: { self.amount }"
         return f"{ref_display}{date_display}{amount_display}"
+
+
+AGING_BUCKETS = ("0-30", "31-60", "61-90", "90+")
+
+
+class VoucherBalanceQuerySet(models.QuerySet):
+    def refresh(self, voucher_ids):
+        """Recompute the ledger rows of the given vouchers (upsert)."""
+        voucher_ids = set(voucher_ids)
+        if not voucher_ids:
+            return
+        last_payment = (
+            VoucherLine.objects.filter(voucher=models.OuterRef("pk"))
+            .order_by("-payment_date")
+            .values("payment_date")[:1]
+        )
+        vouchers = (
+            Voucher.objects.using(self.db)
+            .filter(pk__in=voucher_ids)
+            .with_balances()
+            .annotate(last_payment_date=models.Subquery(last_payment))
+            .values_list(
+                "pk", "orders_total", "lines_total", "rest_total", "last_payment_date"
+            )
+        )
+        self.bulk_create(
+            [
+                VoucherBalance(
+                    voucher_id=pk,
+                    orders_total=orders_total,
+                    paid_total=paid_total,
+                    rest_amount=rest_amount,
+                    last_payment_date=last_payment_date,
+                )
+                for pk, orders_total, paid_total, rest_amount, last_payment_date in (
+                    vouchers
+                )
+            ],
+            update_conflicts=True,
+            unique_fields=["voucher"],
+            update_fields=[
+                "orders_total",
+                "paid_total",
+                "rest_amount",
+                "last_payment_date",
+                "updated_at",
+            ],
+        )
+
+    def outstanding(self):
+        """Vouchers that still owe money."""
+        return self.filter(rest_amount__gt=0)
+
+    def total_receivables(self) -> Decimal:
+        return self.outstanding().aggregate(total=models.Sum("rest_amount"))[
+            "total"
+        ] or Decimal("0.00")
+
+    def aging(self, as_of=None) -> dict:
+        """Split the receivables by age, as of the given date (today).
+
+        Payments dated up to ``as_of`` are allocated to each voucher's orders
+        oldest first; what is left of each order is aged from its
+        ``created_at``. Computed in one aggregate query over the
+        voucher/order links.
+        """
+        as_of = as_of or timezone.localdate()
+        amount_field = models.DecimalField(max_digits=12, decimal_places=2)
+        zero = models.Value(Decimal("0.00"))
+        through = Voucher.orders.through
+        # Total of the voucher's orders up to this one (FIFO by order pk)
+        cumulative = (
+            through.objects.filter(
+                voucher=models.OuterRef("voucher"),
+                order__lte=models.OuterRef("order"),
+            )
+            .order_by()
+            .values("voucher")
+            .annotate(total=models.Sum("order__total_amount"))
+            .values("total")
+        )
+        paid = (
+            VoucherLine.objects.filter(
+                voucher=models.OuterRef("voucher"), payment_date__lte=as_of
+            )
+            .order_by()
+            .values("voucher")
+            .annotate(total=models.Sum("amount"))
+            .values("total")
+        )
+        unpaid = Greatest(
+            Least(
+                Coalesce(models.Subquery(cumulative), zero, output_field=amount_field)
+                - Coalesce(models.Subquery(paid), zero, output_field=amount_field),
+                models.F("order__total_amount"),
+            ),
+            zero,
+            output_field=amount_field,
+        )
+        end_of_day = timezone.make_aware(
+            datetime.datetime.combine(
+                as_of + datetime.timedelta(days=1), datetime.time.min
+            )
+        )
+
+        def age_at_least(days):
+            return models.Q(order__created_at__lt=end_of_day - datetime.timedelta(days))
+
+        def younger_than(days):
+            # The negation alone matches the orders without a date too
+            return models.Q(order__created_at__isnull=False) & ~age_at_least(days)
+
+        buckets = {
+            "0-30": younger_than(31),
+            "31-60": age_at_least(31) & younger_than(61),
+            "61-90": age_at_least(61) & younger_than(91),
+            "90+": age_at_least(91) | models.Q(order__created_at__isnull=True),
+        }
+        rows = (
+            through.objects.using(self.db)
+            .filter(
+                models.Q(order__created_at__lt=end_of_day)
+                | models.Q(order__created_at__isnull=True)
+            )
+            .aggregate(
+                **{
+                    bucket: Coalesce(
+                        models.Sum(unpaid, filter=condition),
+                        zero,
+                        output_field=amount_field,
+                    )
+                    for bucket, condition in buckets.items()
+                }
+            )
+        )
+        return {bucket: rows[bucket] for bucket in AGING_BUCKETS}
+
+
+class VoucherBalance(models.Model):
+    """Receivables ledger, one row per voucher, refreshed on every write to
+    its orders, products, and voucher lines."""
+
+    voucher = models.OneToOneField(
+        Voucher, on_delete=models.CASCADE, primary_key=True, related_name="balance"
+    )
+    orders_total = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00")
+    )
+    paid_total = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00")
+    )
+    rest_amount = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00"), db_index=True
+    )
+    last_payment_date = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = VoucherBalanceQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Voucher balance"
+        verbose_name_plural = "Voucher balances"
+        indexes = [
+            models.Index(
+                fields=["updated_at", "voucher"], name="voucherbalance_updated_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.voucher_id}: {self.rest_amount}"
+
+
+class CacheVersionQuerySet(models.QuerySet):
+    def current(self, key):
+        return self.filter(key=key).values_list("version", flat=True).first() or 0
+
+    def bump(self, key):
+        """Increment the version of ``key``, in the current transaction."""
+        if not self.filter(key=key).update(version=models.F("version") + 1):
+            self.get_or_create(key=key, defaults={"version": 1})
+
+
+class CacheVersion(models.Model):
+    """Version counter shared by the processes holding an in-memory cache."""
+
+    key = models.CharField(max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    objects = CacheVersionQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.key}: {self.version}"
+
+
+class ClientSearchEntryQuerySet(models.QuerySet):
+    def refresh(self, order_ids):
+        """Rebuild the entries of ``order_ids`` from their identity, contact
+        and institution, in one upsert."""
+        rows = (
+            Order.objects.using(self.db)
+            .filter(pk__in=order_ids)
+            .values_list(
+                "pk",
+                "identities__first_name",
+                "identities__last_name",
+                "contacts__phone_number",
+                "institutions__title",
+                "institutions__address",
+            )
+        )
+        entries = [
+            ClientSearchEntry(
+                order_id=pk,
+                name=search.fold(f"{first_name or ''} {last_name or ''}").strip(),
+                phone=search.phone_digits(phone_number),
+                institution=search.fold(f"{title or ''} {address or ''}").strip(),
+            )
+            for pk, first_name, last_name, phone_number, title, address in rows
+        ]
+        self.bulk_create(
+            entries,
+            update_conflicts=True,
+            unique_fields=["order"],
+            update_fields=["name", "phone", "institution"],
+        )
+
+    def _like_search(self, term):
+        # Without FTS5: a scan of the folded columns
+        if search.is_phone_query(term):
+            return self.filter(phone__startswith=search.phone_digits(term))
+        queryset = self
+        for word in search.words(term):
+            queryset = queryset.filter(
+                models.Q(name__startswith=word)
+                | models.Q(name__contains=f" {word}")
+                | models.Q(institution__startswith=word)
+                | models.Q(institution__contains=f" {word}")
+            )
+        return queryset
+
+    def search(self, term, limit=20):
+        """Return the order ids matching ``term``, the most recent first.
+
+        An order code (``ODR_000123``) matches its order. Otherwise every
+        word of ``term`` must start a word of the name, phone or institution.
+        """
+        order_ids = []
+        order_id = Order.parse_code(term)
+        if order_id and Order.objects.using(self.db).filter(pk=order_id).exists():
+            order_ids.append(order_id)
+        expression = search.match_expression(term)
+        if expression is None:
+            return order_ids
+        connection = connections[self.db]
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT rowid FROM {search.FTS_TABLE} "
+                    f"WHERE {search.FTS_TABLE} MATCH %s ORDER BY rowid DESC LIMIT %s",
+                    [expression, limit],
+                )
+                found = [row[0] for row in cursor.fetchall()]
+        else:
+            found = self._like_search(term).order_by("-order_id")
+            found = list(found.values_list("order_id", flat=True)[:limit])
+        return (order_ids + [pk for pk in found if pk not in order_ids])[:limit]
+
+    def matching(self, term, path="pk"):
+        """Return a Q of the rows whose order at ``path`` matches ``term``,
+        as ``search`` matches them but without a limit, for the filters of
+        the admin searches."""
+        condition = models.Q(pk__in=[])
+        order_id = Order.parse_code(term)
+        if order_id:
+            condition |= models.Q(**{path: order_id})
+        expression = search.match_expression(term)
+        if expression is None:
+            return condition
+        if connections[self.db].vendor == "sqlite":
+            found = RawSQL(
+                f"SELECT rowid FROM {search.FTS_TABLE} "
+                f"WHERE {search.FTS_TABLE} MATCH %s",
+                [expression],
+            )
+        else:
+            found = self._like_search(term).values("order_id")
+        return condition | models.Q(**{f"{path}__in": found})
+
+
+class ClientSearchEntry(models.Model):
+    """Folded client name, phone and institution of an order, indexed for
+    the client search (see ``optica_app.search``). Refreshed on every write
+    to the identity, contact or institution of the order."""
+
+    order = models.OneToOneField(
+        Order, on_delete=models.CASCADE, primary_key=True, related_name="search_entry"
+    )
+    name = models.CharField(max_length=201, blank=True)
+    phone = models.CharField(max_length=20, blank=True)
+    institution = models.TextField(blank=True)
+
+    objects = ClientSearchEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Client search entry"
+        verbose_name_plural = "Client search entries"
+
+    def __str__(self):
+        return f"{self.order_id}: {self.name}"
+
+
+class Customer(models.Model):
+    """A client across orders, see ``optica_app.customers``."""
+
+    first_name = models.CharField(max_length=100, blank=True)
+    last_name = models.CharField(max_length=100, blank=True)
+    phone_number = models.CharField(max_length=17, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Customer"
+        verbose_name_plural = "Customers"
+
+    def __str__(self):
+        return f"{self.first_name} {self.last_name}".strip() or f"#{self.pk}"
+
+
+class CustomerKey(models.Model):
+    """Blocking key of a customer: the normalized phone numbers and folded
+    names seen on its orders. New orders are only compared with the
+    customers sharing one of their keys."""
+
+    PHONE = "phone"
+    NAME = "name"
+    KIND_CHOICES = [(PHONE, "Phone"), (NAME, "Name")]
+
+    customer = models.ForeignKey(
+        Customer, on_delete=models.CASCADE, related_name="keys"
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    value = models.CharField(max_length=201)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["customer", "kind", "value"], name="customer_key_unique"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["kind", "value"], name="customer_key_lookup_idx")
+        ]
+
+    def __str__(self):
+        return f"{self.kind}: {self.value}"
+
+
+WIZARD_STATE_MAX_AGE = datetime.timedelta(days=1)
+
+
+class WizardStateQuerySet(models.QuerySet):
+    def expired(self, max_age=WIZARD_STATE_MAX_AGE):
+        return self.filter(updated_at__lt=timezone.now() - max_age)
+
+
+class WizardState(models.Model):
+    """Data of a form wizard in progress, see ``optica_app.wizards``."""
+
+    token = models.CharField(max_length=64, primary_key=True)
+    data = models.JSONField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = WizardStateQuerySet.as_manager()
+
+    def __str__(self):
+        return self.token
+
+
+class OrderTombstone(models.Model):
+    """Deleted order, for the devices syncing with ``optica_app.sync``."""
+
+    order_id = models.PositiveBigIntegerField()
+    uuid = models.UUIDField(null=True)
+    # The optician of the order, whose devices pull the deletion
+    user_id = models.PositiveBigIntegerField(null=True)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user_id", "id"], name="tombstone_user_idx"),
+        ]
+
+    def __str__(self):
+        return f"ODR_{self.order_id:06}"
+
+
+class SlowQuery(models.Model):
+    """Queries of one fingerprint slower than the threshold, see
+    ``optica_app.slowqueries``; the times are in milliseconds."""
+
+    fingerprint = models.CharField(max_length=40, unique=True)
+    database = models.CharField(max_length=100, default="default")
+    sql = models.TextField()
+    sample_sql = models.TextField()
+    sample_params = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    calls = models.PositiveBigIntegerField(default=0)
+    total_time = models.FloatField(default=0)
+    max_time = models.FloatField(default=0)
+    first_seen = models.DateTimeField(auto_now_add=True)
+    last_seen = models.DateTimeField(default=timezone.now)
+    plan = models.TextField(blank=True)
+    full_scans = models.JSONField(default=list)
+    suggested_indexes = models.JSONField(default=list)
+    explained_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "slow queries"
+        permissions = [("explain_slowquery", "Can explain slow queries")]
+
+    def __str__(self):
+        return self.fingerprint[:12]
+
+    def mean_time(self):
+        return self.total_time / self.calls if self.calls else 0
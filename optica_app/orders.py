@@ -0,0 +1,270 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Creation of full orders: the order with its identity, contact,
+institution, prescription and products.
+
+An order is described by a record, a dict of plain values as found in a
+JSON payload or an import line (see ``importers``)::
+
+    {"user": "alex", "created_at": "2023-05-02T10:00:00+00:00",
+     "uuid": "2f1c7e0e-...",
+     "identity": {"first_name": "Ana", "last_name": "Pop"},
+     "contact": {"phone_number": "+40722000000"},
+     "institution": {"title": "...", "address": "..."},
+     "prescription": {"fare_od_spheric": "-1.25", ...},
+     "products": [{"price": "450.00", "frame": 1, "glass_type": 2, "lens": 3}]}
+
+The ``uuid`` is optional, one is generated when missing.
+
+``parse_order`` validates a whole record without touching the database and
+``write_orders`` inserts any number of parsed orders with one INSERT per
+table. ``create_order`` puts both together for a single order, in one
+transaction, for the forms and the API.
+"""
+import uuid
+from dataclasses import dataclass
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import customers, metrics
+from .catalog import catalog
+from .models import (
+    ClientSearchEntry,
+    Contact,
+    Frame,
+    GlassType,
+    Identity,
+    Institution,
+    Lens,
+    Order,
+    PrescriptionDetail,
+    Product,
+)
+
+CATALOG = {"frame": Frame, "glass_type": GlassType, "lens": Lens}
+
+
+def clean_fields(model, values):
+    """Run the model field validators over ``values``.
+
+    Return the cleaned values keyed by attribute name; raise a
+    ValidationError keyed by field name otherwise, the required fields
+    missing from ``values`` included.
+    """
+    cleaned, errors = {}, {}
+    for model_field in model._meta.concrete_fields:
+        if (
+            model_field.name not in values
+            and not model_field.primary_key
+            and not model_field.is_relation
+            and not model_field.null
+            and not model_field.blank
+            and not model_field.has_default()
+        ):
+            errors[model_field.name] = ["This field is required."]
+    for name, value in values.items():
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            model_field = None
+        if model_field is None or model_field.is_relation:
+            errors[name] = ["Unknown field."]
+            continue
+        if value is None and model_field.empty_strings_allowed:
+            value = None if model_field.null else ""
+        try:
+            cleaned[model_field.attname] = model_field.clean(value, None)
+        except ValidationError as error:
+            errors[name] = error.messages
+        except (TypeError, ValueError, OverflowError):
+            # An infinite float of a JSON payload, say
+            errors[name] = ["Enter a valid value."]
+    if errors:
+        raise ValidationError(errors)
+    return cleaned
+
+
+def _is_empty(values):
+    return not values or all(value in (None, "") for value in values.values())
+
+
+@dataclass
+class ParsedOrder:
+    line_no: int
+    record: dict
+    username: str
+    created_at: object
+    identity: dict
+    contact: dict | None
+    institution: dict | None
+    prescription: dict | None
+    products: list
+    uuid: object = None
+    user_id: int | None = None
+
+
+def parse_order(line_no, record, catalog):
+    """Validate one record, without touching the database.
+
+    ``catalog`` maps ``frame``/``glass_type``/``lens`` to the set of existing
+    primary keys.
+    """
+    if not isinstance(record, dict):
+        raise ValidationError({"record": ["Expected a JSON object."]})
+    errors = {}
+
+    def section(name, model, values, optional=True):
+        if values is not None and not isinstance(values, dict):
+            errors[name] = ["Expected an object."]
+            return None
+        if optional and _is_empty(values):
+            return None
+        try:
+            return clean_fields(model, values or {})
+        except ValidationError as error:
+            errors.update(
+                {f"{name}.{key}": value for key, value in error.message_dict.items()}
+            )
+
+    username = record.get("user")
+    if not username:
+        errors["user"] = ["This field is required."]
+    elif not isinstance(username, str):
+        errors["user"] = ["Expected a string."]
+    created_at = record.get("created_at")
+    if created_at:
+        try:
+            created_at = parse_datetime(created_at)
+        except (TypeError, ValueError):
+            created_at = None
+        if created_at is None:
+            errors["created_at"] = ["Enter a valid date/time."]
+        elif timezone.is_naive(created_at):
+            created_at = timezone.make_aware(created_at)
+    order_uuid = record.get("uuid")
+    if order_uuid is not None:
+        try:
+            order_uuid = Order._meta.get_field("uuid").to_python(order_uuid)
+        except ValidationError as error:
+            errors["uuid"] = error.messages
+    identity = section("identity", Identity, record.get("identity"), optional=False)
+    contact = section("contact", Contact, record.get("contact"))
+    institution = section("institution", Institution, record.get("institution"))
+    prescription = section(
+        "prescription", PrescriptionDetail, record.get("prescription")
+    )
+    products = []
+    product_values = record.get("products")
+    if product_values is None:
+        product_values = []
+    elif not isinstance(product_values, list):
+        errors["products"] = ["Expected a list."]
+        product_values = []
+    for index, values in enumerate(product_values):
+        if not isinstance(values, dict):
+            errors[f"products.{index}"] = ["Expected an object."]
+            continue
+        values = dict(values)
+        for name, pks in catalog.items():
+            try:
+                values[name] = int(values.get(name))
+            except (TypeError, ValueError, OverflowError):
+                values[name] = None
+            if values[name] not in pks:
+                errors[f"products.{index}.{name}"] = ["Unknown reference."]
+        cleaned = section(
+            f"products.{index}",
+            Product,
+            {key: value for key, value in values.items() if key not in catalog},
+            optional=False,
+        )
+        if cleaned is not None:
+            products.append(
+                {**cleaned, **{f"{name}_id": values[name] for name in catalog}}
+            )
+    if errors:
+        raise ValidationError(errors)
+    return ParsedOrder(
+        line_no,
+        record,
+        username,
+        created_at,
+        identity,
+        contact,
+        institution,
+        prescription,
+        products,
+        order_uuid,
+    )
+
+
+def write_orders(parsed_orders):
+    """Insert validated orders, one INSERT per table; return the orders.
+
+    To be called inside a transaction.
+    """
+    orders = Order.objects.bulk_create(
+        [
+            Order(user_id=parsed.user_id, uuid=parsed.uuid or uuid.uuid4())
+            for parsed in parsed_orders
+        ]
+    )
+    dated = []
+    children = {Identity: [], Contact: [], Institution: [], PrescriptionDetail: []}
+    products = []
+    for order, parsed in zip(orders, parsed_orders):
+        if parsed.created_at:
+            order.created_at = parsed.created_at
+            dated.append(order)
+        for model, values in (
+            (Identity, parsed.identity),
+            (Contact, parsed.contact),
+            (Institution, parsed.institution),
+            (PrescriptionDetail, parsed.prescription),
+        ):
+            if values is not None:
+                children[model].append(model(order=order, **values))
+        products.extend(Product(order=order, **values) for values in parsed.products)
+    if dated:
+        Order.objects.bulk_update(dated, ["created_at"])
+    for model, objs in children.items():
+        model.objects.bulk_create(objs)
+    Product.objects.bulk_create(products)
+    ClientSearchEntry.objects.refresh([order.pk for order in orders])
+    metrics.order_created(len(orders))
+    return orders
+
+
+def catalog_keys():
+    """Map ``frame``/``glass_type``/``lens`` to their primary keys, as
+    ``parse_order`` expects them, from the catalog cache."""
+    return {
+        name: {obj.pk for obj in catalog.objects(model)}
+        for name, model in CATALOG.items()
+    }
+
+
+def create_order(record, user):
+    """Validate ``record`` and write the order of ``user`` with all its
+    children in one transaction; return the order.
+
+    The ``user`` key of the record is ignored. Raise a ValidationError keyed
+    like ``identity.first_name`` or ``products.0.price`` when the record is
+    invalid, before anything is written.
+    """
+    parsed = parse_order(None, {**record, "user": user.get_username()}, catalog_keys())
+    parsed.user_id = user.pk
+    with transaction.atomic():
+        (order,) = write_orders([parsed])
+        if parsed.identity is not None or parsed.contact is not None:
+            customers.link_order(order.pk)
+    # The total and the customer were written by the queries above
+    order.refresh_from_db(fields=["total_amount", "customer"])
+    return order
@@ -0,0 +1,98 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Text folding and the SQLite FTS5 index of the client search.
+
+ClientSearchEntry keeps one row per order with the client name, phone and
+institution folded to lowercase ASCII: ``Ștefan``, ``Ştefan`` and ``stefan``
+are the same word. On SQLite, the ``optica_app_clientsearch_fts`` FTS5 table
+indexes these rows, kept in sync by triggers on the entry table, and answers
+word prefix queries from its own prefix indexes. Other databases fall back to
+LIKE over the entry table.
+"""
+import re
+import unicodedata
+
+ENTRY_TABLE = "optica_app_clientsearchentry"
+FTS_TABLE = "optica_app_clientsearch_fts"
+PHONE_QUERY = re.compile(r"\+?[\d\s().-]+")
+
+FTS_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        name, phone, institution,
+        content='{ENTRY_TABLE}', content_rowid='order_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON {ENTRY_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, phone, institution)
+        VALUES (new.order_id, new.name, new.phone, new.institution);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON {ENTRY_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, phone, institution)
+        VALUES ('delete', old.order_id, old.name, old.phone, old.institution);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE ON {ENTRY_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, phone, institution)
+        VALUES ('delete', old.order_id, old.name, old.phone, old.institution);
+        INSERT INTO {FTS_TABLE}(rowid, name, phone, institution)
+        VALUES (new.order_id, new.name, new.phone, new.institution);
+    END
+    """,
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+DROP_FTS_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def fold(value):
+    """Lowercase ``value`` and strip its diacritics."""
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def words(value):
+    return re.findall(r"\w+", fold(value))
+
+
+def phone_digits(value):
+    """Return the national form of a phone number: ``+40 722 000 000``,
+    ``0040722000000`` and ``722000000`` all give ``0722000000``."""
+    value = (value or "").strip()
+    digits = re.sub(r"\D", "", value)
+    if value.startswith("+40"):
+        digits = digits[2:]
+    elif digits.startswith("0040"):
+        digits = digits[4:]
+    if digits and not digits.startswith("0"):
+        digits = "0" + digits
+    return digits
+
+
+def is_phone_query(term):
+    """Whether ``term`` reads as a phone number: at least four digits and
+    only the characters of a phone number."""
+    term = term.strip()
+    return bool(PHONE_QUERY.fullmatch(term)) and sum(c.isdigit() for c in term) >= 4
+
+
+def match_expression(term):
+    """Return the FTS5 query of ``term``: a phone number prefix, or every
+    word as a prefix; None when there is nothing to search."""
+    if is_phone_query(term):
+        return f'phone : "{phone_digits(term)}"*'
+    prefixes = [f'"{word}"*' for word in words(term)]
+    return " ".join(prefixes) or None
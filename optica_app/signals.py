@@ -0,0 +1,146 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+from django.db import transaction
+from django.db.models.functions import Now
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import customers, metrics, similarity
+from .catalog import catalog
+from .models import (
+    ClientSearchEntry,
+    Contact,
+    Frame,
+    GlassType,
+    Identity,
+    Institution,
+    Lens,
+    Order,
+    OrderTombstone,
+    PrescriptionDetail,
+    Voucher,
+    VoucherBalance,
+    VoucherLine,
+)
+
+
+@receiver(post_save, sender=Voucher)
+def create_voucher_balance(sender, instance, created, raw=False, **kwargs):
+    # Also on updates: the balance row dates the changes of the voucher
+    if not raw:
+        VoucherBalance.objects.refresh({instance.pk})
+
+
+@receiver(m2m_changed, sender=Voucher.orders.through)
+def refresh_balance_on_orders_change(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    if action == "pre_clear" and reverse:
+        # order.vouchers.clear() does not tell which vouchers lost the order
+        instance._cleared_voucher_ids = set(
+            instance.vouchers.values_list("pk", flat=True)
+        )
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        VoucherBalance.objects.refresh({instance.pk})
+    elif action == "post_clear":
+        VoucherBalance.objects.refresh(instance.__dict__.pop("_cleared_voucher_ids"))
+    else:
+        VoucherBalance.objects.refresh(pk_set)
+
+
+@receiver(pre_delete, sender=Order)
+def remember_order_vouchers(sender, instance, **kwargs):
+    # The links to the vouchers are cascade-deleted without m2m_changed
+    instance._deleted_voucher_ids = set(instance.vouchers.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Order)
+def refresh_balance_on_order_delete(sender, instance, **kwargs):
+    VoucherBalance.objects.refresh(instance.__dict__.pop("_deleted_voucher_ids", ()))
+
+
+@receiver(post_delete, sender=Order)
+def create_order_tombstone(sender, instance, **kwargs):
+    OrderTombstone.objects.create(
+        order_id=instance.pk, uuid=instance.uuid, user_id=instance.user_id
+    )
+
+
+@receiver(post_save, sender=PrescriptionDetail)
+def update_similarity_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: similarity.index.upsert(instance))
+
+
+@receiver(post_delete, sender=PrescriptionDetail)
+def remove_from_similarity_index(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: similarity.index.remove(pk))
+
+
+@receiver(post_save, sender=Frame)
+@receiver(post_save, sender=GlassType)
+@receiver(post_save, sender=Lens)
+@receiver(post_delete, sender=Frame)
+@receiver(post_delete, sender=GlassType)
+@receiver(post_delete, sender=Lens)
+def invalidate_catalog(sender, **kwargs):
+    catalog.invalidate()
+
+
+@receiver(post_save, sender=Identity)
+@receiver(post_save, sender=Contact)
+@receiver(post_save, sender=Institution)
+def refresh_client_search(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ClientSearchEntry.objects.refresh({instance.order_id})
+
+
+@receiver(post_delete, sender=Identity)
+@receiver(post_delete, sender=Contact)
+@receiver(post_delete, sender=Institution)
+def refresh_client_search_on_delete(sender, instance, **kwargs):
+    # After the commit: when the whole order is being deleted, its entry is
+    # gone by then and must not be written again
+    order_id = instance.order_id
+    transaction.on_commit(lambda: ClientSearchEntry.objects.refresh({order_id}))
+
+
+@receiver(post_save, sender=Identity)
+@receiver(post_save, sender=Contact)
+@receiver(post_save, sender=Institution)
+@receiver(post_save, sender=PrescriptionDetail)
+@receiver(post_delete, sender=Identity)
+@receiver(post_delete, sender=Contact)
+@receiver(post_delete, sender=Institution)
+@receiver(post_delete, sender=PrescriptionDetail)
+def touch_order(sender, instance, raw=False, **kwargs):
+    # The API and the sync serve these with the order, dated by its updated_at
+    if not raw:
+        Order.objects.filter(pk=instance.order_id).update(updated_at=Now())
+
+
+@receiver(post_save, sender=Identity)
+@receiver(post_save, sender=Contact)
+def link_customer(sender, instance, raw=False, **kwargs):
+    if not raw:
+        customers.link_order(instance.order_id)
+
+
+@receiver(post_save, sender=Order)
+def count_order(sender, instance, created, raw=False, **kwargs):
+    # The bulk created orders are counted by write_orders
+    if created and not raw:
+        metrics.order_created()
+
+
+@receiver(post_save, sender=VoucherLine)
+def count_payment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        metrics.payment_recorded(instance.amount)
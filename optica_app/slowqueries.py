@@ -0,0 +1,224 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Opt-in log of the slow queries, set ``SLOW_QUERY_THRESHOLD_MS`` to use it.
+
+Every query slower than the threshold is counted under the fingerprint of
+its SQL, with the literals, the parameters and the ``IN`` lists normalized.
+The counts are kept in memory and added to the SlowQuery rows at the end of
+each request, or of the process.
+
+``explain`` runs ``EXPLAIN QUERY PLAN`` (``EXPLAIN`` on the other databases)
+on the last SQL and parameters of a fingerprint, records the tables read by
+a full scan and suggests an index on the columns they are filtered on. The
+``explain_slow_queries`` command explains the fingerprints of the most total
+time, the SlowQuery admin lists them.
+"""
+import atexit
+import hashlib
+import re
+import threading
+import time
+
+import structlog
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DatabaseError, IntegrityError, connections, models, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+EXPLAIN_TOP = 20
+
+logger = structlog.get_logger(__name__)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+ALIASES = re.compile(r'"(\w+)" ([A-Z]\d+)\b')
+# A column compared to a value, not to another column as in a join
+COMPARISONS = re.compile(
+    r'(?:"(\w+)"|\b([A-Z]\d+))\."(\w+)"\s*(=|<>|!=|<=|>=|<|>|IN\b|IS\b|LIKE\b)'
+    r'(?!\s*(?:"\w+"|[A-Z]\d+)\.)'
+)
+FULL_SCANS = re.compile(r"^SCAN (\w+)$|Seq Scan on (\w+)")
+RANGE_OPERATORS = ("<", ">", "<=", ">=", "LIKE")
+
+
+def normalize(sql):
+    sql = IN_LIST.sub("IN (...)", LITERALS.sub("%s", sql))
+    return " ".join(sql.split())
+
+
+def fingerprint(sql):
+    return hashlib.sha1(normalize(sql).encode()).hexdigest()
+
+
+class SlowQueryRecorder:
+    """Execute wrapper counting the queries slower than ``threshold_ms``."""
+
+    def __init__(self, threshold_ms):
+        self.threshold = threshold_ms / 1000
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.threshold and not getattr(self.local, "flushing", 0):
+                alias = context["connection"].alias
+                self.record(alias, sql, None if many else params, elapsed)
+
+    def record(self, alias, sql, params, elapsed):
+        key = fingerprint(sql)
+        with self.lock:
+            entry = self.pending.setdefault(
+                key, {"calls": 0, "total_time": 0.0, "max_time": 0.0}
+            )
+            entry["calls"] += 1
+            entry["total_time"] += elapsed * 1000
+            entry["max_time"] = max(entry["max_time"], elapsed * 1000)
+            entry.update(database=alias, sql=sql, params=list(params or ()))
+
+    def flush(self, **kwargs):
+        """Add the pending counts to the SlowQuery rows.
+
+        Called when the response is closed: an entry that cannot be written,
+        in a locked database say, is logged and dropped, never raised.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        self.local.flushing = True
+        now = timezone.now()
+        try:
+            for key, entry in pending.items():
+                try:
+                    with transaction.atomic():
+                        self.write(key, entry, now)
+                except DatabaseError:
+                    logger.warning("slow_query_dropped", fingerprint=key, exc_info=True)
+        finally:
+            self.local.flushing = False
+
+    def write(self, key, entry, now):
+        from .models import SlowQuery
+
+        def update():
+            return SlowQuery.objects.filter(fingerprint=key).update(
+                calls=models.F("calls") + entry["calls"],
+                total_time=models.F("total_time") + entry["total_time"],
+                max_time=Greatest("max_time", models.Value(entry["max_time"])),
+                sample_sql=entry["sql"],
+                sample_params=entry["params"],
+                last_seen=now,
+            )
+
+        if update():
+            return
+        try:
+            with transaction.atomic():
+                SlowQuery.objects.create(
+                    fingerprint=key,
+                    database=entry["database"],
+                    sql=normalize(entry["sql"]),
+                    sample_sql=entry["sql"],
+                    sample_params=entry["params"],
+                    calls=entry["calls"],
+                    total_time=entry["total_time"],
+                    max_time=entry["max_time"],
+                    last_seen=now,
+                )
+        except IntegrityError:
+            # Created by another process since the update
+            update()
+
+
+recorder = None
+
+
+def install():
+    """Record the slow queries of every connection, when configured."""
+    global recorder
+    if settings.SLOW_QUERY_THRESHOLD_MS is None or recorder is not None:
+        return
+    recorder = SlowQueryRecorder(settings.SLOW_QUERY_THRESHOLD_MS)
+
+    def add_wrapper(sender, connection, **kwargs):
+        if recorder not in connection.execute_wrappers:
+            connection.execute_wrappers.append(recorder)
+
+    connection_created.connect(add_wrapper, weak=False)
+    request_finished.connect(recorder.flush, weak=False)
+    atexit.register(recorder.flush)
+
+
+def suggest_index(connection, table, columns):
+    """Return the columns of an index for the comparisons ``columns``, a
+    list of ``(column, operator)``, or None when one exists already."""
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    indexed = {
+        constraint["columns"][0]
+        for constraint in constraints.values()
+        if constraint["columns"]
+        and (constraint["index"] or constraint["primary_key"] or constraint["unique"])
+    }
+    equalities = [c for c, operator in columns if operator not in RANGE_OPERATORS]
+    ranges = [c for c, operator in columns if operator in RANGE_OPERATORS]
+    candidates = list(dict.fromkeys(equalities + ranges[:1]))
+    if not candidates or candidates[0] in indexed:
+        return None
+    return candidates[:3]
+
+
+def explain(slow_query):
+    """Explain the sample of ``slow_query``, save its plan, full scans and
+    suggested indexes."""
+    connection = connections[slow_query.database]
+    sql = slow_query.sample_sql
+    if connection.vendor == "sqlite":
+        prefix, column = "EXPLAIN QUERY PLAN ", -1
+    else:
+        prefix, column = "EXPLAIN ", 0
+    try:
+        with transaction.atomic(using=slow_query.database):
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql, slow_query.sample_params or None)
+                plan = [str(row[column]) for row in cursor.fetchall()]
+    except DatabaseError as error:
+        # A table of a migration since dropped, say
+        plan = [f"EXPLAIN failed: {error}"]
+
+    aliases = dict((alias, table) for table, alias in ALIASES.findall(sql))
+    scans = []
+    for line in plan:
+        match = FULL_SCANS.search(line.strip())
+        if match:
+            name = match.group(1) or match.group(2)
+            scans.append(aliases.get(name, name))
+    comparisons = {}
+    for table, alias, column_name, operator in COMPARISONS.findall(sql):
+        comparisons.setdefault(aliases.get(alias, table), []).append(
+            (column_name, operator.strip())
+        )
+    suggestions = []
+    for table in dict.fromkeys(scans):
+        columns = suggest_index(connection, table, comparisons.get(table, []))
+        if columns:
+            suggestions.append(f"{table} ({', '.join(columns)})")
+
+    slow_query.plan = "\n".join(plan)
+    slow_query.full_scans = list(dict.fromkeys(scans))
+    slow_query.suggested_indexes = suggestions
+    slow_query.explained_at = timezone.now()
+    slow_query.save(
+        update_fields=["plan", "full_scans", "suggested_indexes", "explained_at"]
+    )
@@ -0,0 +1,24 @@
+/* Turn the selects rendered by optica_app.forms.AutocompleteSelect into
+ * select2 widgets paging through the optica_app:autocomplete endpoint. */
+'use strict';
+{
+    const $ = window.jQuery;
+    $(function() {
+        $('select[data-autocomplete-url]').each(function() {
+            $(this).select2({
+                width: '100%',
+                allowClear: !this.required,
+                placeholder: '',
+                minimumInputLength: 0,
+                ajax: {
+                    url: this.dataset.autocompleteUrl,
+                    dataType: 'json',
+                    delay: 250,
+                    data: function(params) {
+                        return {term: params.term, page: params.page};
+                    }
+                }
+            });
+        });
+    });
+}
@@ -0,0 +1,51 @@
+/* Check the step of optica_app.views.TunnelWizard through the
+ * optica_app:wizard_validate endpoint before moving on: an invalid step
+ * only costs its errors, not the whole page. */
+'use strict';
+{
+    function showErrors(form, errors) {
+        form.querySelectorAll('.wizard-error').forEach(function(node) {
+            node.remove();
+        });
+        Object.entries(errors).forEach(function([name, messages]) {
+            const node = document.createElement('p');
+            node.className = 'wizard-error text-red-700 text-sm';
+            node.textContent = messages.join(' ');
+            const input = form.elements[name];
+            if (input && input.after) {
+                input.after(node);
+            } else {
+                form.querySelector('.wizard-errors').append(node);
+            }
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function() {
+        const form = document.querySelector('form[data-validate-url]');
+        if (!form || !window.fetch) {
+            return;
+        }
+        form.addEventListener('submit', function(event) {
+            if (event.submitter && event.submitter.name === 'wizard_goto_step') {
+                return;
+            }
+            event.preventDefault();
+            fetch(form.dataset.validateUrl, {
+                method: 'POST',
+                body: new FormData(form),
+                credentials: 'same-origin',
+                headers: {'X-Requested-With': 'XMLHttpRequest'},
+            }).then(function(response) {
+                return response.json();
+            }).then(function(data) {
+                if (Object.keys(data.errors).length) {
+                    showErrors(form, data.errors);
+                } else {
+                    form.submit();
+                }
+            }).catch(function() {
+                form.submit();
+            });
+        });
+    });
+}
@@ -0,0 +1,220 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Delta sync for the devices of the opticians working offline.
+
+A device pulls the changes of the orders of its optician since its last
+cursor: the orders changed since then, with their identity, contact,
+institution, prescription and products, the orders deleted since then
+(OrderTombstone), and the catalog when its version changed. Batches are at
+most ``PULL_SIZE`` orders; the device pulls again while ``more`` is true,
+then keeps the last ``cursor``.
+
+The changes of the last ``SETTLE_DELAY`` are left for the next pull: a
+transaction committing after a pull may have dated its rows before it.
+
+A device pushes the orders created offline, each with a UUID generated on
+the device. The batch is validated as a whole, then written in one
+transaction; the orders already received are answered again instead of
+being created twice, so a device can push again after a lost answer.
+"""
+import datetime
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from . import customers
+from .catalog import catalog
+from .changelists import encode_cursor, keyset_after, load_cursor
+from .models import (
+    CacheVersion,
+    Contact,
+    Frame,
+    GlassType,
+    Identity,
+    Institution,
+    Lens,
+    Order,
+    OrderTombstone,
+    PrescriptionDetail,
+    Product,
+)
+from .orders import catalog_keys, parse_order, write_orders
+
+PULL_SIZE = 500
+MAX_PUSH_SIZE = 500
+SETTLE_DELAY = datetime.timedelta(seconds=5)
+ORDER_KEY = ("updated_at", "pk")
+ORDER_FIELDS = {
+    "id": "pk",
+    "uuid": "uuid",
+    "user": "user_id",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+    "total_amount": "total_amount",
+}
+SECTIONS = {
+    "identity": ("identities", Identity),
+    "contact": ("contacts", Contact),
+    "institution": ("institutions", Institution),
+    "prescription": ("prescriptions", PrescriptionDetail),
+}
+CATALOG_MODELS = {"frames": Frame, "glass_types": GlassType, "lenses": Lens}
+
+
+def section_fields(model):
+    return [
+        field.name
+        for field in model._meta.concrete_fields
+        if not field.primary_key and not field.is_relation
+    ]
+
+
+def serialize_orders(queryset):
+    """Return the orders of ``queryset`` as records, in two queries."""
+    lookups = dict(ORDER_FIELDS)
+    for name, (relation, model) in SECTIONS.items():
+        lookups[f"{name}.pk"] = f"{relation}__pk"
+        for field in section_fields(model):
+            lookups[f"{name}.{field}"] = f"{relation}__{field}"
+    records = []
+    for values in queryset.values_list(*lookups.values()):
+        flat = dict(zip(lookups, values))
+        record = {name: flat[name] for name in ORDER_FIELDS}
+        for name, (_, model) in SECTIONS.items():
+            record[name] = (
+                None
+                if flat[f"{name}.pk"] is None
+                else {field: flat[f"{name}.{field}"] for field in section_fields(model)}
+            )
+        record["products"] = []
+        records.append(record)
+
+    by_id = {record["id"]: record for record in records}
+    products = Product.objects.filter(order__in=by_id).order_by("pk")
+    for order_id, pk, price, frame, glass_type, lens in products.values_list(
+        "order_id", "pk", "price", "frame_id", "glass_type_id", "lens_id"
+    ):
+        by_id[order_id]["products"].append(
+            {
+                "id": pk,
+                "price": price,
+                "frame": frame,
+                "glass_type": glass_type,
+                "lens": lens,
+            }
+        )
+    return records
+
+
+def _load_state(cursor):
+    """Return ``(order key, last tombstone id, catalog version)``."""
+    if not cursor:
+        return None, 0, None
+    state = load_cursor(cursor)
+    try:
+        updated_at, pk, tombstone, version = state
+        if updated_at is not None:
+            updated_at = Order._meta.get_field("updated_at").to_python(updated_at)
+            if updated_at is None:
+                raise ValidationError("Invalid date.")
+        key = None if pk is None else (updated_at, int(pk))
+        return key, int(tombstone), version
+    except (TypeError, ValueError, ValidationError) as error:
+        raise ValueError("Invalid cursor.") from error
+
+
+def pull(user, cursor=None, limit=PULL_SIZE):
+    """Return the changes of the orders of ``user`` after ``cursor``, see the
+    module docstring."""
+    key, tombstone, version = _load_state(cursor)
+    until = timezone.now() - SETTLE_DELAY
+
+    orders = Order.objects.filter(user=user, updated_at__lt=until).order_by(*ORDER_KEY)
+    if key is not None:
+        orders = orders.filter(keyset_after(Order._meta, ORDER_KEY, key))
+    records = serialize_orders(orders[: limit + 1])
+    deleted = list(
+        OrderTombstone.objects.filter(
+            user_id=user.pk, pk__gt=tombstone, deleted_at__lt=until
+        )
+        .order_by("pk")
+        .values_list("pk", "order_id", "uuid")[: limit + 1]
+    )
+    more = len(records) > limit or len(deleted) > limit
+    records, deleted = records[:limit], deleted[:limit]
+    if records:
+        key = (records[-1]["updated_at"], records[-1]["id"])
+    if deleted:
+        tombstone = deleted[-1][0]
+
+    current = CacheVersion.objects.current("catalog")
+    labels = None
+    if current != version:
+        labels = {
+            name: [{"id": obj.pk, "title": str(obj)} for obj in catalog.objects(model)]
+            for name, model in CATALOG_MODELS.items()
+        }
+    return {
+        "orders": records,
+        "deleted": [{"id": order_id, "uuid": uuid} for _, order_id, uuid in deleted],
+        "catalog": labels,
+        "cursor": encode_cursor([*(key or (None, None)), tombstone, current]),
+        "more": more,
+    }
+
+
+def push(records, user):
+    """Create the orders of ``records`` for ``user``, skipping the UUIDs
+    already received; return ``{"uuid", "id", "created"}`` per record.
+
+    Raise a ValidationError keyed like ``0.identity.first_name``, with the
+    index of the record, before anything is written when a record is
+    invalid.
+    """
+    if len(records) > MAX_PUSH_SIZE:
+        raise ValidationError(f"At most {MAX_PUSH_SIZE} orders per push.")
+    keys = catalog_keys()
+    parsed_orders, errors = [], {}
+    for index, record in enumerate(records):
+        try:
+            if not isinstance(record, dict):
+                raise ValidationError({"record": ["Expected a JSON object."]})
+            parsed = parse_order(index, {**record, "user": user.get_username()}, keys)
+            if parsed.uuid is None:
+                raise ValidationError({"uuid": ["This field is required."]})
+        except ValidationError as error:
+            errors.update(
+                {f"{index}.{key}": value for key, value in error.message_dict.items()}
+            )
+        else:
+            parsed.user_id = user.pk
+            parsed_orders.append(parsed)
+    if errors:
+        raise ValidationError(errors)
+
+    with transaction.atomic():
+        received = dict(
+            Order.objects.filter(
+                uuid__in=[parsed.uuid for parsed in parsed_orders]
+            ).values_list("uuid", "pk")
+        )
+        new = {}
+        for parsed in parsed_orders:
+            if parsed.uuid not in received:
+                new.setdefault(parsed.uuid, parsed)
+        for order, parsed in zip(write_orders(list(new.values())), new.values()):
+            received[parsed.uuid] = order.pk
+            customers.link_order(order.pk)
+    return [
+        {
+            "uuid": parsed.uuid,
+            "id": received[parsed.uuid],
+            "created": new.get(parsed.uuid) is parsed,
+        }
+        for parsed in parsed_orders
+    ]
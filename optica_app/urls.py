@@ -6,7 +6,9 @@
 # github: https://github.com/boot-sandre/alexandru-optica-app/
 from django.urls import path
 
+from optica_app import api
 from optica_app.views import home, view_index, order_view, identity_form_view, tunnel_form_view
+from optica_app.views import TunnelWizard, autocomplete_view, wizard_validate_view
 
 app_name = 'optica_app'
 
@@ -16,4 +18,13 @@ urlpatterns = [
     path('order/', order_view, name='order'),
     path('identity/', identity_form_view, name='identity'),
     path('tunnel/', tunnel_form_view, name='tunnel'),
+    path('autocomplete/<str:source>/', autocomplete_view, name='autocomplete'),
+    path('wizard/', TunnelWizard.as_view(), name='wizard'),
+    path('wizard/validate/<str:step>/', wizard_validate_view, name='wizard_validate'),
+    path('api/orders/', api.order_list_view, name='api_orders'),
+    path('api/orders/<int:pk>/', api.order_detail_view, name='api_order'),
+    path('api/vouchers/', api.voucher_list_view, name='api_vouchers'),
+    path('api/catalog/', api.catalog_view, name='api_catalog'),
+    path('sync/pull/', api.sync_pull_view, name='sync_pull'),
+    path('sync/push/', api.sync_push_view, name='sync_push'),
 ]
@@ -1,13 +1,23 @@
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.forms.formsets import BaseFormSet
+from django.http import Http404, JsonResponse
 from django.shortcuts import redirect, render
-from .models import Order, Identity
-from .forms import ContactForm, FrameForm, GlassTypeForm, InstitutionForm, LensForm, OrderForm, IdentityForm, PrescriptionDetailForm, ProductForm
+from django.views.decorators.http import require_POST
+from formtools.wizard.views import SessionWizardView
+from .dashboard import DASHBOARD_TIMEOUT, Dashboard
+from .models import Frame, Order, Lens
+from .forms import TUNNEL_FORMS, OrderForm, IdentityForm, ProductFormSet, TunnelForm
+from .orders import create_order
 
 
 
+@login_required
 def view_index(request):
-    order = Order.objects.get(pk=1)
-    identity = Identity.objects.get(order=order)
-    return render(request, 'optica_app/home.html', {'order': order, 'identity': identity})
+    """Dashboard of the logged in optician, see ``dashboard``."""
+    context = {'dashboard': Dashboard(request.user), 'timeout': DASHBOARD_TIMEOUT}
+    return render(request, 'optica_app/home.html', context)
 
 def home(request):
     return render(request, 'optica_app/index.html')
@@ -36,40 +46,147 @@ def identity_form_view(request):
     return render(request, 'optica_app/form_identity.html', context)
 
 
+AUTOCOMPLETE_PAGE_SIZE = 20
+# Past it the pages are empty, and the OFFSET stays a database integer
+AUTOCOMPLETE_MAX_PAGE = 1000
+
+
+@login_required
+def autocomplete_view(request, source):
+    """Select2 results for the AutocompleteSelect widgets of the forms."""
+    term = request.GET.get("term", "").strip()
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    if source == "frame":
+        queryset = Frame.objects.title_prefix(term)
+    elif source == "lens":
+        queryset = Lens.objects.title_prefix(term)
+    elif source == "order":
+        queryset = Order.objects.only("pk").order_by("-pk")
+        if term:
+            queryset = queryset.filter(pk=Order.parse_code(term))
+    else:
+        raise Http404
+    if page > AUTOCOMPLETE_MAX_PAGE:
+        return JsonResponse({"results": [], "pagination": {"more": False}})
+    start = (page - 1) * AUTOCOMPLETE_PAGE_SIZE
+    # One more row than the page tells whether there is a next page, no COUNT
+    end = start + AUTOCOMPLETE_PAGE_SIZE + 1
+    rows = list(queryset[start:end])
+    return JsonResponse(
+        {
+            "results": [
+                {"id": obj.pk, "text": str(obj)}
+                for obj in rows[:AUTOCOMPLETE_PAGE_SIZE]
+            ],
+            "pagination": {"more": len(rows) > AUTOCOMPLETE_PAGE_SIZE},
+        }
+    )
+
+
+def tunnel_record(sections, products):
+    """Record for ``orders.create_order`` from the cleaned data of the forms."""
+    record = dict(sections)
+    record["products"] = [
+        {name: getattr(value, "pk", value) for name, value in product.items()}
+        for product in products
+        if product
+    ]
+    return record
+
 
 def tunnel_form_view(request):
-    order_form = OrderForm(request.POST or None)
-    identity_form = IdentityForm(request.POST or None)
-    contact_form = ContactForm(request.POST or None)
-    institution_form = InstitutionForm(request.POST or None)
-    prescription_detail_form = PrescriptionDetailForm(request.POST or None)
-    product_form = ProductForm(request.POST or None)
-    frame_form = FrameForm(request.POST or None)
-    glass_type_form = GlassTypeForm(request.POST or None)
-    lens_form = LensForm(request.POST or None)
-
-    if all([order_form.is_valid(), identity_form.is_valid(), contact_form.is_valid(), institution_form.is_valid(), prescription_detail_form.is_valid(), product_form.is_valid(), frame_form.is_valid(), glass_type_form.is_valid(), lens_form.is_valid()]):
-        order_form.save()
-        identity_form.save()
-        contact_form.save()
-        institution_form.save()
-        prescription_detail_form.save()
-        product_form.save()
-        frame_form.save()
-        glass_type_form.save()
-        lens_form.save()
-
-        return redirect('optica_app:identity')
+    """Create an order with all its children from one form.
+
+    The forms only check the input; the order is written by
+    ``orders.create_order``, in one transaction.
+    """
+    data = request.POST or None
+    order_form = TunnelForm(data, prefix="order")
+    forms = {
+        name: form_class(data, prefix=name) for name, form_class in TUNNEL_FORMS.items()
+    }
+
+    if all([order_form.is_valid()] + [form.is_valid() for form in forms.values()]):
+        sections = {
+            name: form.cleaned_data for name, form in forms.items() if name != "product"
+        }
+        record = tunnel_record(sections, [forms["product"].cleaned_data])
+        try:
+            create_order(record, order_form.cleaned_data["user"])
+        except ValidationError as error:
+            for key, messages in error.message_dict.items():
+                order_form.add_error(None, f'{key}: {" ".join(messages)}')
+        else:
+            return redirect("optica_app:identity")
 
     context = {
-        'order_form': order_form,
-        'identity_form': identity_form,
-        'contact_form': contact_form,
-        'institution_form': institution_form,
-        'prescription_detail_form': prescription_detail_form,
-        'product_form': product_form,
-        'frame_form': frame_form,
-        'glass_type_form': glass_type_form,
-        'lens_form': lens_form,
+        "order_form": order_form,
+        "identity_form": forms["identity"],
+        "contact_form": forms["contact"],
+        "institution_form": forms["institution"],
+        "prescription_detail_form": forms["prescription"],
+        "product_form": forms["product"],
     }
-    return render(request, 'optica_app/form_tunnel.html', context)
+    return render(request, "optica_app/form_tunnel.html", context)
+
+
+class TunnelWizard(LoginRequiredMixin, SessionWizardView):
+    """The tunnel form one step at a time, for the opticians on the road.
+
+    Each step only posts its own fields, the steps already filled are kept on
+    the server by ``wizards.DatabaseStorage``. The order is written by
+    ``orders.create_order`` at the end, for the logged in optician.
+    """
+
+    form_list = [
+        ("identity", TUNNEL_FORMS["identity"]),
+        ("contact", TUNNEL_FORMS["contact"]),
+        ("institution", TUNNEL_FORMS["institution"]),
+        ("prescription", TUNNEL_FORMS["prescription"]),
+        ("products", ProductFormSet),
+    ]
+    storage_name = "optica_app.wizards.DatabaseStorage"
+    template_name = "optica_app/form_wizard.html"
+
+    def done(self, form_list, form_dict, **kwargs):
+        sections = {
+            name: form.cleaned_data
+            for name, form in form_dict.items()
+            if name != "products"
+        }
+        create_order(
+            tunnel_record(sections, form_dict["products"].cleaned_data),
+            self.request.user,
+        )
+        return redirect("optica_app:identity")
+
+
+def form_errors(form):
+    """Errors of a form or formset keyed by the name of their input,
+    ``__all__`` for the others."""
+    if isinstance(form, BaseFormSet):
+        errors = {}
+        for subform in form.forms:
+            errors.update(form_errors(subform))
+        if form.non_form_errors():
+            errors.setdefault(NON_FIELD_ERRORS, []).extend(form.non_form_errors())
+        return errors
+    return {
+        name if name == NON_FIELD_ERRORS else form.add_prefix(name): list(messages)
+        for name, messages in form.errors.items()
+    }
+
+
+@require_POST
+@login_required
+def wizard_validate_view(request, step):
+    """Validate one step of the TunnelWizard, answer only its errors."""
+    form_class = dict(TunnelWizard.form_list).get(step)
+    if form_class is None:
+        raise Http404
+    form = form_class(request.POST, prefix=step)
+    errors = form_errors(form) if not form.is_valid() else {}
+    return JsonResponse({"errors": errors}, status=400 if errors else 200)
@@ -0,0 +1,76 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+"""Server side storage for the formtools wizards.
+
+The sessions are signed cookies: keeping the wizard data in the session
+would send every step already filled back and forth with each request. The
+data is kept in a WizardState row instead, and the browser only holds the
+random token of the row in a cookie.
+"""
+import copy
+import secrets
+
+from django.utils import timezone
+from formtools.wizard.storage.base import BaseStorage
+
+from .models import WIZARD_STATE_MAX_AGE, WizardState
+
+
+class DatabaseStorage(BaseStorage):
+    max_age = WIZARD_STATE_MAX_AGE
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.token = self.request.COOKIES.get(self.prefix)
+        self.data = self._stored = None
+        if self.token:
+            self._stored = (
+                WizardState.objects.filter(token=self.token)
+                .values_list("data", flat=True)
+                .first()
+            )
+            self.data = copy.deepcopy(self._stored)
+        if self.data is None:
+            self.token = None
+            self.init_data()
+
+    def set_step_data(self, step, cleaned_data):
+        # Only the fields of the step, not the CSRF token nor the management
+        # form of the wizard
+        super().set_step_data(step, cleaned_data)
+        prefix = f"{step}-"
+        self.data[self.step_data_key][step] = {
+            key: value
+            for key, value in self.data[self.step_data_key][step].items()
+            if key.startswith(prefix)
+        }
+
+    def update_response(self, response):
+        super().update_response(response)
+        if not self.data[self.step_data_key] and not self.data[self.extra_data_key]:
+            # Not started, or done
+            if self.token:
+                WizardState.objects.filter(token=self.token).delete()
+                response.delete_cookie(self.prefix)
+            return
+        if self.data == self._stored:
+            return
+        if self.token is None:
+            self.token = secrets.token_urlsafe(32)
+            WizardState.objects.expired(self.max_age).delete()
+            WizardState.objects.create(token=self.token, data=self.data)
+        else:
+            WizardState.objects.filter(token=self.token).update(
+                data=self.data, updated_at=timezone.now()
+            )
+        response.set_cookie(
+            self.prefix,
+            self.token,
+            max_age=int(self.max_age.total_seconds()),
+            httponly=True,
+            samesite="Lax",
+        )
@@ -0,0 +1,72 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import pytest
+import structlog
+from django.http import HttpResponse
+from django_structlog import signals
+
+from alexandru_optica_app.instrumentation import (
+    REPEATED_QUERY_THRESHOLD,
+    RequestMetricsMiddleware,
+    query_shape,
+)
+from optica_app.factory import IdentityFactory, UserFactory
+from optica_app.models import Identity
+
+
+@pytest.fixture
+def bound():
+    structlog.contextvars.clear_contextvars()
+    yield structlog.contextvars.get_contextvars
+    structlog.contextvars.clear_contextvars()
+
+
+def test_query_shape():
+    sql = 'SELECT * FROM "t" WHERE "id" IN (%s, %s, %s) AND "a" IN (%s)'
+    assert query_shape(sql) == 'SELECT * FROM "t" WHERE "id" IN (...) AND "a" IN (...)'
+
+
+@pytest.mark.django_db
+def test_repeated_queries(rf, bound):
+    identities = IdentityFactory.create_batch(REPEATED_QUERY_THRESHOLD + 1)
+
+    def view(request):
+        for identity in Identity.objects.filter(pk__in=[i.pk for i in identities]):
+            identity.order.user_id
+        return HttpResponse()
+
+    RequestMetricsMiddleware(view)(rf.get("/"))
+    metrics = bound()
+    assert metrics["db_queries"] == REPEATED_QUERY_THRESHOLD + 2
+    assert metrics["db_ms"] >= 0
+    [repeated] = metrics["repeated_queries"]
+    assert repeated["count"] == REPEATED_QUERY_THRESHOLD + 1
+    assert repeated["sql"].startswith('SELECT "optica_app_order"')
+    assert repeated["site"].startswith(
+        "tests/alexandru_optica_app/test_instrumentation.py:"
+    )
+    assert repeated["site"].endswith(" in view")
+
+
+@pytest.mark.django_db
+def test_request_log(client):
+    client.force_login(UserFactory())
+    logged = []
+
+    def receiver(sender, **kwargs):
+        logged.append(structlog.contextvars.get_contextvars())
+
+    signals.bind_extra_request_finished_metadata.connect(receiver)
+    try:
+        assert client.get("/").status_code == 200
+    finally:
+        signals.bind_extra_request_finished_metadata.disconnect(receiver)
+    [context] = logged
+    assert context["db_queries"] > 0
+    assert context["template_ms"] > 0
+    assert context["duration_ms"] >= context["template_ms"]
+    assert "repeated_queries" not in context
@@ -0,0 +1,100 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import gzip
+import json
+import logging
+import time
+
+import pytest
+
+from alexandru_optica_app import logshipping
+
+
+@pytest.fixture
+def ship(tmp_path):
+    handlers = []
+
+    def ship(**options):
+        handler = logshipping.LokiHandler(
+            path=tmp_path / "logs.gz", tags={"application": "test"}, **options
+        )
+        logger = logging.getLogger(f"test_logshipping.{len(handlers)}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+        handlers.append((logger, handler))
+        return logger, handler
+
+    yield ship
+    for logger, handler in handlers:
+        logger.removeHandler(handler)
+        handler.close()
+
+
+def batches(tmp_path):
+    path = tmp_path / "logs.gz"
+    if not path.exists():
+        return []
+    with gzip.open(path, "rt") as file:
+        return [json.loads(line) for line in file]
+
+
+def lines(batch):
+    return [line for stream in batch["streams"] for _, line in stream["values"]]
+
+
+def test_batches(ship, tmp_path):
+    logger, handler = ship(batch_size=2, interval=60)
+    logger.info("one")
+    logger.warning("two")
+    deadline = time.monotonic() + 5
+    while not batches(tmp_path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Sent by the flusher as soon as the batch is full
+    [batch] = batches(tmp_path)
+    assert sorted(lines(batch)) == ["one", "two"]
+    assert {"application": "test", "severity": "warning"}.items() <= (
+        batch["streams"][1]["stream"].items()
+    )
+
+    logger.info("three")
+    handler.close()
+    assert [lines(batch) for batch in batches(tmp_path)][1:] == [["three"]]
+    assert (handler.sent, handler.dropped, handler.failed) == (3, 0, 0)
+
+
+def test_drop_oldest(ship, tmp_path):
+    logger, handler = ship(capacity=3, batch_size=100, interval=60)
+    for index in range(5):
+        logger.info("line %s", index)
+    assert handler.dropped == 2
+    handler.close()
+    assert [lines(batch) for batch in batches(tmp_path)] == [
+        ["line 2", "line 3", "line 4"]
+    ]
+
+
+def test_sink_failure(ship, monkeypatch):
+    logger, handler = ship(interval=60)
+
+    def send(payload):
+        raise OSError("collector down")
+
+    monkeypatch.setattr(handler.sink, "send", send)
+    logger.info("lost")
+    handler.flush()
+    assert (handler.sent, handler.failed) == (0, 1)
+
+
+def test_started_again_after_fork(ship, monkeypatch, tmp_path):
+    logger, handler = ship(interval=60)
+    logger.info("parent")
+    parent_thread = handler._thread
+    monkeypatch.setattr(logshipping.os, "getpid", lambda: -1)
+    logger.info("child")
+    assert handler._thread is not parent_thread
+    assert [entry[2] for entry in handler._buffer] == ["child"]
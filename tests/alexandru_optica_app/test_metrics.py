@@ -0,0 +1,121 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import os
+from decimal import Decimal
+
+import pytest
+
+from alexandru_optica_app import metrics
+from optica_app.factory import (
+    OrderFactory,
+    ProductFactory,
+    UserFactory,
+    VoucherFactory,
+    VoucherLineFactory,
+)
+
+# The exposition computes the receivables
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def metrics_dir(settings, tmp_path):
+    settings.METRICS_DIR = tmp_path
+    return tmp_path
+
+
+counter = metrics.Counter("test_events_total", "Test events.", ["kind"])
+gauge = metrics.Gauge("test_busy", "Test gauge.")
+histogram = metrics.Histogram("test_seconds", "Test durations.", [], (0.1, 1))
+
+
+def samples():
+    return dict(
+        line.rsplit(" ", 1)
+        for line in metrics.exposition().splitlines()
+        if not line.startswith("#")
+    )
+
+
+def test_mmaped_dict(tmp_path):
+    values = metrics.MmapedDict(tmp_path / "1.db")
+    keys = [f"key {index}" for index in range(5000)]
+    for index, key in enumerate(keys):
+        values.set(key, index)
+    values.set("key 1", 1.5)
+    # Grown past its initial size, read by another process
+    assert values.capacity > metrics.INITIAL_SIZE
+    read = dict(metrics.MmapedDict.read(tmp_path / "1.db"))
+    assert len(read) == 5000
+    assert (read["key 1"], read["key 4999"]) == (1.5, 4999)
+    assert metrics.MmapedDict(tmp_path / "1.db").get("key 4999") == 4999
+
+
+def test_processes_merged():
+    counter.inc(kind="a")
+    gauge.inc()
+    pid = os.fork()
+    if pid == 0:
+        # The child writes its own file
+        try:
+            counter.inc(2, kind="a")
+            counter.inc(kind="b")
+            gauge.inc()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+
+    values = samples()
+    assert values['test_events_total{kind="a"}'] == "3"
+    assert values['test_events_total{kind="b"}'] == "1"
+    # The gauge of the child gone is not counted
+    assert values["test_busy"] == "1"
+
+
+def test_histogram():
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value)
+    values = samples()
+    assert values['test_seconds_bucket{le="0.1"}'] == "1"
+    assert values['test_seconds_bucket{le="1"}'] == "3"
+    assert values['test_seconds_bucket{le="+Inf"}'] == "4"
+    assert values["test_seconds_count"] == "4"
+    assert values["test_seconds_sum"] == "4.05"
+
+
+def test_view(client, settings):
+    settings.METRICS_TOKEN = "secret"
+    assert client.get("/metrics").status_code == 403
+    assert (
+        client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code
+        == 403
+    )
+    response = client.get("/metrics", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+
+    client.force_login(UserFactory())
+    client.get("/")
+    values = samples()
+    assert values['http_requests_total{status="4xx",view="metrics"}'] == "2"
+    assert values['http_requests_total{status="2xx",view="optica_app:index"}'] == "1"
+    assert values['http_request_db_queries_count{view="optica_app:index"}'] == "1"
+    assert values["http_requests_in_progress"] == "0"
+
+
+def test_business_metrics(django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        order = OrderFactory()
+        ProductFactory(order=order, price=Decimal("150.00"))
+        voucher = VoucherFactory()
+        voucher.orders.add(order)
+        VoucherLineFactory(voucher=voucher, amount=Decimal("100.00"))
+    values = samples()
+    assert values["optica_orders_created_total"] == "1"
+    assert values["optica_payments_total"] == "1"
+    assert values["optica_payments_amount_total"] == "100"
+    assert values["optica_receivables"] == "50"
@@ -0,0 +1,89 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import sys
+import time
+from collections import Counter
+
+import pytest
+
+from alexandru_optica_app import profiling
+from optica_app.factory import UserFactory
+
+
+@pytest.fixture(autouse=True)
+def clear_store():
+    profiling.store.clear()
+    yield
+    profiling.store.clear()
+
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_sampler():
+    with profiling.sampler.profile(sys._getframe()) as stacks:
+        busy(0.1)
+    assert stacks.total() > 5
+    stack, _ = stacks.most_common(1)[0]
+    assert stack.split(";") == [
+        "tests.alexandru_optica_app.test_profiling:test_sampler",
+        "tests.alexandru_optica_app.test_profiling:busy",
+    ]
+
+
+def test_store_bounds():
+    store = profiling.ProfileStore(max_endpoints=2, max_stacks=2)
+    store.add("a", Counter({"x": 5, "x;y": 3, "x;z": 1}))
+    store.add("b", Counter({"x": 1}))
+    store.add("c", Counter({"x": 2}))
+    assert store.stacks("a") == Counter({"x": 5, "x;y": 3, "(other)": 1})
+    assert [row["name"] for row in store.endpoints()] == ["a", "(other)", "b"]
+    assert store.top_frames("a") == [
+        {"frame": "x", "total": 88.9, "self": 55.6},
+        {"frame": "y", "total": 33.3, "self": 33.3},
+        {"frame": "(other)", "total": 11.1, "self": 11.1},
+    ]
+
+
+@pytest.mark.django_db
+def test_signed_header(client):
+    client.force_login(UserFactory())
+    client.get("/", headers={"X-Profile": "forged"})
+    assert profiling.store.endpoints() == []
+
+    client.get("/", headers={"X-Profile": profiling.debug_token()})
+    [row] = profiling.store.endpoints()
+    assert (row["name"], row["requests"]) == ("optica_app:index", 1)
+
+
+@pytest.mark.django_db
+def test_sample_rate(client, settings):
+    settings.PROFILING_SAMPLE_RATE = 1
+    client.get("/api/catalog/")
+    assert [row["name"] for row in profiling.store.endpoints()] == [
+        "optica_app:api_catalog"
+    ]
+
+
+@pytest.mark.django_db
+def test_views(client):
+    profiling.store.add("optica_app:tunnel", Counter({"root;view;save": 3}))
+    assert client.get("/admin/profiles/").status_code == 302
+
+    client.force_login(UserFactory())
+    response = client.get("/admin/profiles/", {"endpoint": "optica_app:tunnel"})
+    assert response.status_code == 200
+    assert [frame["frame"] for frame in response.context["frames"]] == [
+        "root",
+        "view",
+        "save",
+    ]
+    response = client.get("/admin/profiles/export/")
+    assert response.content == b"optica_app:tunnel;root;view;save 3\n"
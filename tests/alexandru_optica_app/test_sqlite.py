@@ -0,0 +1,97 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import pytest
+from django.db import OperationalError, connections
+
+from alexandru_optica_app.sqlite import base
+
+
+@pytest.fixture
+def make_connection(tmp_path, django_db_blocker):
+    opened = []
+
+    def make_connection(**options):
+        settings_dict = connections.configure_settings(
+            {
+                "default": {
+                    "ENGINE": "alexandru_optica_app.sqlite",
+                    "NAME": tmp_path / "db.sqlite3",
+                    "OPTIONS": options,
+                }
+            }
+        )["default"]
+        connection = base.DatabaseWrapper(settings_dict)
+        opened.append(connection)
+        connection.ensure_connection()
+        return connection
+
+    with django_db_blocker.unblock():
+        yield make_connection
+        for connection in opened:
+            connection.close()
+
+
+def pragma(connection, name):
+    return connection.connection.execute(f"PRAGMA {name}").fetchone()[0]
+
+
+def test_pragmas(make_connection):
+    connection = make_connection(pragmas={"cache_size": -4000})
+    assert pragma(connection, "journal_mode") == "wal"
+    assert pragma(connection, "synchronous") == 1  # NORMAL
+    assert pragma(connection, "cache_size") == -4000
+    assert pragma(connection, "temp_store") == 2  # MEMORY
+    assert pragma(connection, "foreign_keys") == 1
+    assert connection.is_usable()
+
+
+def test_invalid_transaction_mode(make_connection):
+    with pytest.raises(ValueError):
+        make_connection(transaction_mode="LAZY")
+
+
+def test_transactions_take_the_write_lock(make_connection):
+    writer = make_connection()
+    other = make_connection(timeout=0, transaction_mode="deferred")
+    writer.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+    # A deferred transaction of another connection can read, not write
+    other.connection.execute("BEGIN")
+    other.connection.execute("SELECT 1 FROM sqlite_master").fetchall()
+    other.connection.execute("ROLLBACK")
+    with pytest.raises(OperationalError, match="locked"):
+        other.cursor().execute("CREATE TABLE t (id INTEGER)")
+
+
+def test_begin_retried_while_locked(make_connection, monkeypatch):
+    writer = make_connection()
+    waiting = make_connection(timeout=0)
+    writer.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+    delays = []
+
+    def sleep(delay):
+        delays.append(delay)
+        if len(delays) == 2:
+            writer.commit()
+
+    monkeypatch.setattr(base.time, "sleep", sleep)
+    waiting.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+    assert not waiting.get_autocommit()
+    assert len(delays) == 2
+    assert 0 <= delays[1] <= 2 * base.LOCK_RETRY_DELAY
+
+
+def test_begin_retries_bounded(make_connection, monkeypatch):
+    writer = make_connection()
+    waiting = make_connection(timeout=0)
+    writer.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+    delays = []
+    monkeypatch.setattr(base.time, "sleep", delays.append)
+    with pytest.raises(OperationalError, match="locked"):
+        waiting.set_autocommit(
+            False, force_begin_transaction_with_broken_autocommit=True
+        )
+    assert len(delays) == base.LOCK_RETRIES
@@ -0,0 +1,78 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+from decimal import Decimal
+
+import pytest
+
+from optica_app.catalog import catalog
+from optica_app.factory import (
+    ContactFactory,
+    FrameFactory,
+    GlassTypeFactory,
+    IdentityFactory,
+    LensFactory,
+    OrderFactory,
+    ProductFactory,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_catalog_cache():
+    # Each test rolls its catalog rows back: never reuse them in the next one
+    catalog.clear()
+    yield
+    catalog.clear()
+
+
+@pytest.fixture
+def catalog_references():
+    """Frame, glass type and lens of the product lines of a record."""
+    return {
+        "frame": FrameFactory().pk,
+        "glass_type": GlassTypeFactory().pk,
+        "lens": LensFactory().pk,
+    }
+
+
+@pytest.fixture
+def order_record(catalog_references):
+    """Build the record of an order, as imported or created in one call."""
+
+    def build(prices=("400.00", "50.50"), **overrides):
+        record = {
+            "user": "alex",
+            "created_at": "2023-05-02T10:00:00+00:00",
+            "identity": {"first_name": "Ana", "last_name": "Popescu"},
+            "contact": {"phone_number": "+40722000000"},
+            "institution": {"title": "Cămin", "address": "Strada Mare 1"},
+            "prescription": {
+                "fare_od_spheric": "-1.25",
+                "fare_pupillary_distance": "62",
+            },
+            "products": [{"price": price, **catalog_references} for price in prices],
+        }
+        record.update(overrides)
+        return record
+
+    return build
+
+
+@pytest.fixture
+def client_order():
+    """Create the order of a client, with a contact and a product when given."""
+
+    def create(first_name, last_name, phone_number=None, price=None, **order_fields):
+        order = OrderFactory(**order_fields)
+        IdentityFactory(order=order, first_name=first_name, last_name=last_name)
+        if phone_number is not None:
+            ContactFactory(order=order, phone_number=phone_number)
+        if price is not None:
+            ProductFactory(order=order, price=Decimal(price))
+        order.refresh_from_db()
+        return order
+
+    return create
@@ -0,0 +1,83 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import io
+import json
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+
+from optica_app.analytics import (
+    COLUMNS,
+    column,
+    load_prescriptions,
+    prescription_statistics,
+)
+from optica_app.factory import PrescriptionDetailFactory, UserFactory
+from optica_app.models import PrescriptionDetail
+
+
+@pytest.fixture
+def sample_prescriptions():
+    values = [
+        # od sphere, od cylinder, os sphere, os cylinder, pd
+        ("-2.00", "-1.00", "-2.50", "0.00", "62.0"),
+        ("1.00", "0.00", "1.00", "0.00", "64.5"),
+        ("0.00", "0.00", None, None, None),
+    ]
+    return [
+        PrescriptionDetailFactory(
+            fare_od_spheric=Decimal(od_sph),
+            fare_od_cylindric=Decimal(od_cyl),
+            fare_os_spheric=os_sph and Decimal(os_sph),
+            fare_os_cylindric=os_cyl and Decimal(os_cyl),
+            fare_pupillary_distance=pd and Decimal(pd),
+        )
+        for od_sph, od_cyl, os_sph, os_cyl, pd in values
+    ]
+
+
+@pytest.mark.django_db
+def test_load_prescriptions_in_chunks(sample_prescriptions):
+    data = load_prescriptions(chunk_size=2)
+
+    assert data.shape == (3, len(COLUMNS)) == (3, 21)
+    np.testing.assert_array_equal(column(data, "fare_od_spheric"), [-2.0, 1.0, 0.0])
+    assert np.isnan(column(data, "fare_pupillary_distance")[2])
+    assert load_prescriptions(PrescriptionDetail.objects.none()).shape == (0, 21)
+
+
+@pytest.mark.django_db
+def test_prescription_statistics(sample_prescriptions):
+    fare = prescription_statistics()["distances"]["fare"]
+
+    od = fare["eyes"]["od"]
+    assert od["spherical_equivalent"]["count"] == 3
+    assert od["spherical_equivalent"]["min"] == -2.5
+    assert od["myopia"] == {"count": 1, "total": 3, "rate": 0.3333}
+    assert od["hyperopia"]["count"] == 1
+    assert od["astigmatism"]["count"] == 1
+    assert {"from": -2.5, "to": -2.25, "count": 1} in od[
+        "spherical_equivalent_histogram"
+    ]
+    # Only two prescriptions have both eyes, with equal spherical equivalents
+    assert fare["anisometropia"] == {"count": 0, "total": 2, "rate": 0.0}
+    assert fare["pupillary_distance"]["median"] == 63.25
+    assert [b["from"] for b in fare["pupillary_distance_histogram"]] == [62.0, 64.0]
+
+
+@pytest.mark.django_db
+def test_statistics_command_and_admin_page(client, sample_prescriptions):
+    out = io.StringIO()
+    call_command("prescription_stats", stdout=out)
+    assert json.loads(out.getvalue())["prescriptions"] == 3
+
+    client.force_login(UserFactory())
+    response = client.get("/admin/optica_app/prescriptiondetail/statistics/")
+    assert response.status_code == 200
+    assert response.context["statistics"]["prescriptions"] == 3
@@ -0,0 +1,136 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import pytest
+
+from optica_app.changelists import encode_cursor
+from optica_app.factory import (
+    FrameFactory,
+    IdentityFactory,
+    OrderFactory,
+    ProductFactory,
+    UserFactory,
+    VoucherFactory,
+)
+from optica_app.models import Order
+
+
+@pytest.fixture
+def api(client):
+    client.force_login(UserFactory())
+    return client
+
+
+def read_all(client, url, **params):
+    ids, pages = [], 0
+    while url:
+        response = client.get(url, params)
+        assert response.status_code == 200, response.content
+        data = response.json()
+        ids += [row["id"] for row in data["results"]]
+        url, params, pages = data["next"], {}, pages + 1
+    return ids, pages
+
+
+@pytest.mark.django_db
+def test_orders_by_cursor_oldest_change_first(api):
+    orders = [OrderFactory() for _ in range(5)]
+
+    ids, pages = read_all(api, "/api/orders/", limit=2)
+    assert ids == [order.pk for order in orders]
+    assert pages == 3
+
+    # Editing its identity moves the order to the end
+    IdentityFactory(order=orders[1], last_name="Popescu")
+    ids, _ = read_all(api, "/api/orders/", limit=2)
+    assert ids[-1] == orders[1].pk
+    row = api.get(f"/api/orders/{orders[1].pk}/").json()
+    assert row["last_name"] == "Popescu"
+
+
+@pytest.mark.django_db
+def test_pages_take_a_constant_number_of_queries(api, django_assert_num_queries):
+    for _ in range(30):
+        ProductFactory(order=IdentityFactory().order)
+    voucher = VoucherFactory()
+    voucher.orders.set(Order.objects.all())
+    VoucherFactory()
+
+    # The user of the session, then the page
+    for limit in (2, 25):
+        with django_assert_num_queries(2):
+            api.get("/api/orders/", {"limit": limit})
+    # Plus the orders of the vouchers of the page
+    with django_assert_num_queries(3):
+        data = api.get("/api/vouchers/").json()
+    assert [len(row["orders"]) for row in data["results"]] == [30, 0]
+
+
+@pytest.mark.django_db
+def test_sparse_fieldsets(api):
+    order = OrderFactory()
+
+    data = api.get("/api/orders/", {"fields": "id,total_amount"}).json()
+    assert data["results"] == [{"id": order.pk, "total_amount": "0.00"}]
+
+    response = api.get("/api/orders/", {"fields": "id,password"})
+    assert response.status_code == 400
+    assert response.json() == {"error": "Unknown fields: password."}
+
+
+@pytest.mark.django_db
+def test_conditional_get(api):
+    order = OrderFactory()
+    response = api.get("/api/orders/")
+    etag = response["ETag"]
+    assert response["Last-Modified"]
+
+    response = api.get("/api/orders/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response.content == b""
+    # The fields are part of the version
+    response = api.get("/api/orders/", {"fields": "id"}, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+    detail = api.get(f"/api/orders/{order.pk}/")
+    assert (
+        api.get(
+            f"/api/orders/{order.pk}/",
+            HTTP_IF_MODIFIED_SINCE=detail["Last-Modified"],
+        ).status_code
+        == 304
+    )
+
+    ProductFactory(order=order)
+    assert api.get("/api/orders/", HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_catalog(api):
+    frame = FrameFactory(title="Aviator")
+
+    response = api.get("/api/catalog/")
+    assert {"id": frame.pk, "title": "Aviator"} in response.json()["frames"]
+    assert (
+        api.get("/api/catalog/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code == 304
+    )
+
+    FrameFactory()
+    assert (
+        api.get("/api/catalog/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code == 200
+    )
+
+
+@pytest.mark.django_db
+def test_access(client):
+    assert client.get("/api/orders/").status_code == 401
+    client.force_login(UserFactory(is_staff=False, is_superuser=False))
+    assert client.get("/api/orders/").status_code == 403
+    client.force_login(UserFactory())
+    assert client.post("/api/orders/").status_code == 405
+    for cursor in ("nope", encode_cursor([[1], 1]), encode_cursor([None, 10**30])):
+        assert client.get("/api/orders/", {"cursor": cursor}).status_code == 400
+    assert client.get("/api/orders/0/").status_code == 404
@@ -0,0 +1,122 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import pytest
+
+from optica_app.factory import (
+    FrameFactory,
+    LensFactory,
+    OrderFactory,
+    ProductFactory,
+    UserFactory,
+)
+from optica_app.forms import ProductForm
+from optica_app.models import Frame, Lens
+from optica_app.views import AUTOCOMPLETE_MAX_PAGE, AUTOCOMPLETE_PAGE_SIZE
+
+
+@pytest.fixture
+def optician_client(client):
+    client.force_login(UserFactory(is_staff=False, is_superuser=False))
+    return client
+
+
+@pytest.mark.django_db
+def test_title_prefix_is_case_insensitive_and_uses_the_index():
+    FrameFactory(title="Ray-Ban Aviator")
+    FrameFactory(title="ray-ban wayfarer")
+    FrameFactory(title="Oakley Ray")
+
+    titles = [frame.title for frame in Frame.objects.title_prefix(" RAY-")]
+
+    assert titles == ["Ray-Ban Aviator", "ray-ban wayfarer"]
+    assert "frame_title_lower_idx" in Frame.objects.title_prefix("ray").explain()
+    assert "lens_title_lower_idx" in Lens.objects.title_prefix("ray").explain()
+
+
+@pytest.mark.django_db
+def test_autocomplete_pages(optician_client):
+    for number in range(AUTOCOMPLETE_PAGE_SIZE + 5):
+        LensFactory(title=f"Progressive {number:02}")
+    LensFactory(title="Single vision")
+
+    first = optician_client.get("/autocomplete/lens/", {"term": "prog"}).json()
+    second = optician_client.get(
+        "/autocomplete/lens/", {"term": "prog", "page": 2}
+    ).json()
+
+    assert len(first["results"]) == AUTOCOMPLETE_PAGE_SIZE
+    assert first["results"][0]["text"] == "Progressive 00"
+    assert first["pagination"] == {"more": True}
+    assert [result["text"] for result in second["results"]] == [
+        f"Progressive {number}" for number in range(20, 25)
+    ]
+    assert second["pagination"] == {"more": False}
+    assert optician_client.get("/autocomplete/identity/").status_code == 404
+    for page in (AUTOCOMPLETE_MAX_PAGE + 1, 10**20):
+        response = optician_client.get("/autocomplete/lens/", {"page": page})
+        assert response.json() == {"results": [], "pagination": {"more": False}}
+
+
+@pytest.mark.django_db
+def test_autocomplete_needs_a_login(client):
+    OrderFactory()
+
+    response = client.get("/autocomplete/order/")
+
+    assert response.status_code == 302
+    assert response.url.startswith("/admin/login/")
+
+
+@pytest.mark.django_db
+def test_order_autocomplete(optician_client):
+    orders = [OrderFactory() for _ in range(3)]
+
+    response = optician_client.get("/autocomplete/order/", {"term": str(orders[1])})
+    latest = optician_client.get("/autocomplete/order/").json()
+
+    assert response.json()["results"] == [{"id": orders[1].pk, "text": str(orders[1])}]
+    assert latest["results"][0]["id"] == orders[2].pk
+    assert (
+        optician_client.get("/autocomplete/order/", {"term": "x"}).json()["results"]
+        == []
+    )
+
+
+@pytest.mark.django_db
+def test_product_form_renders_only_the_selected_options():
+    FrameFactory.create_batch(10)
+    product = ProductFactory()
+
+    html = ProductForm(instance=product).as_p()
+
+    # The blank and selected options of the four selects, none of the 10 frames
+    assert html.count("<option") == 8
+    assert f'<option value="{product.frame_id}" selected>{product.frame}' in html
+    assert 'data-autocomplete-url="/autocomplete/frame/"' in html
+
+    # An invalid bound value renders no option rather than failing the query
+    html = ProductForm({"frame": "²", "lens": str(product.lens_id)}).as_p()
+    assert f'<option value="{product.lens_id}" selected>{product.lens}' in html
+
+
+@pytest.mark.django_db
+def test_admin_frame_autocomplete(admin_client):
+    FrameFactory(title="Lindberg Air")
+    FrameFactory(title="Silhouette")
+
+    response = admin_client.get(
+        "/admin/autocomplete/",
+        {
+            "app_label": "optica_app",
+            "model_name": "product",
+            "field_name": "frame",
+            "term": "lind",
+        },
+    )
+
+    assert response.status_code == 200
+    assert [result["text"] for result in response.json()["results"]] == ["Lindberg Air"]
@@ -0,0 +1,97 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import pytest
+
+from optica_app.catalog import CatalogCache, catalog
+from optica_app.factory import (
+    FrameFactory,
+    GlassTypeFactory,
+    LensFactory,
+    OrderFactory,
+    ProductFactory,
+    UserFactory,
+)
+from optica_app.forms import ProductForm
+from optica_app.models import CacheVersion, Frame
+
+
+@pytest.mark.django_db
+def test_product_labels_come_from_the_cache(django_assert_num_queries):
+    products = [ProductFactory() for _ in range(5)]
+    str(products[0])
+
+    with django_assert_num_queries(0):
+        labels = [str(product) for product in products]
+
+    assert labels[0] == (
+        f"{products[0].frame.title} - {products[0].glass_type} - "
+        f"{products[0].lens.title}"
+    )
+
+
+@pytest.mark.django_db
+def test_product_forms_do_not_query_the_catalog(django_assert_num_queries):
+    frame, glass_type, lens = FrameFactory(), GlassTypeFactory(), LensFactory()
+    order = OrderFactory()
+    data = {
+        "order": order.pk,
+        "price": "100.00",
+        "frame": frame.pk,
+        "glass_type": glass_type.pk,
+        "lens": lens.pk,
+    }
+    ProductForm().as_p()
+
+    # Only the order of each form is fetched, then validated
+    with django_assert_num_queries(6):
+        forms = [ProductForm(data) for _ in range(3)]
+        assert all(form.is_valid() for form in forms)
+    with django_assert_num_queries(0):
+        html = ProductForm().fields["glass_type"].widget.render("glass_type", None)
+        choices = [label for _, label in ProductForm().fields["frame"].choices]
+    assert str(glass_type) in html
+    assert frame.title in choices
+
+    form = ProductForm(dict(data, frame=frame.pk + 1000))
+    assert not form.is_valid()
+    assert "frame" in form.errors
+
+
+@pytest.mark.django_db
+def test_other_processes_see_catalog_writes(django_assert_num_queries):
+    frame = FrameFactory(title="Old")
+    other_process = CatalogCache(check_interval=60)
+    assert other_process.label(Frame, frame.pk) == "Old"
+
+    frame.title = "New"
+    frame.save()
+    new_frame = FrameFactory(title="Added")
+
+    # Unknown keys force a check of the shared version
+    assert other_process.label(Frame, new_frame.pk) == "Added"
+    assert other_process.label(Frame, frame.pk) == "New"
+    assert CacheVersion.objects.current("catalog") == 3
+    with django_assert_num_queries(0):
+        assert other_process.label(Frame, frame.pk) == "New"
+
+    frame.title = "Renamed"
+    frame.save()
+    other_process.check_interval = 0
+    assert other_process.label(Frame, frame.pk) == "Renamed"
+
+
+@pytest.mark.django_db
+def test_admin_order_page_with_products(client):
+    order = OrderFactory()
+    for _ in range(4):
+        ProductFactory(order=order)
+    client.force_login(UserFactory())
+
+    response = client.get(f"/admin/optica_app/order/{order.pk}/change/")
+
+    assert response.status_code == 200
+    assert catalog.label(Frame, order.products.first().frame_id)
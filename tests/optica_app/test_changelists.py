@@ -0,0 +1,140 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import datetime
+
+import pytest
+from django.contrib import admin
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from optica_app.changelists import EstimatedCountPaginator, encode_cursor
+from optica_app.factory import OrderFactory, PrescriptionDetailFactory, UserFactory
+from optica_app.models import Order, PrescriptionDetail
+
+ORDERS_URL = "/admin/optica_app/order/"
+
+
+@pytest.fixture
+def staff_client(client):
+    client.force_login(UserFactory())
+    return client
+
+
+@pytest.fixture
+def dated_orders(monkeypatch):
+    monkeypatch.setattr(admin.site._registry[Order], "list_per_page", 3)
+    day = timezone.make_aware(datetime.datetime(2024, 3, 1, 10))
+    orders = [OrderFactory() for _ in range(7)]
+    # Ties on created_at, and a NULL, are broken by the primary key
+    dates = [day, day, day + datetime.timedelta(days=1), day, None, day, day]
+    for order, created_at in zip(orders, dates):
+        order.created_at = created_at
+    Order.objects.bulk_update(orders, ["created_at"])
+    return sorted(
+        orders,
+        key=lambda order: (order.created_at is None, order.created_at, order.pk),
+        reverse=True,
+    )
+
+
+def walk(client, url):
+    pages = []
+    while url:
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        assert response.status_code == 200
+        assert not any("OFFSET" in query["sql"] for query in queries)
+        pages.append(list(response.context["cl"].result_list))
+        next_page_url = response.context["cl"].next_page_url
+        url = next_page_url and ORDERS_URL + next_page_url
+    return pages
+
+
+@pytest.mark.django_db
+def test_order_changelist_keyset_pages(staff_client, dated_orders):
+    pages = walk(staff_client, ORDERS_URL)
+
+    expected = [order for order in dated_orders if order.created_at] + [
+        order for order in dated_orders if order.created_at is None
+    ]
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sum(pages, []) == expected
+
+
+@pytest.mark.django_db
+def test_keyset_pages_keep_the_filters(staff_client, dated_orders):
+    user = dated_orders[0].user
+
+    response = staff_client.get(ORDERS_URL, {"user__id__exact": user.pk})
+
+    assert list(response.context["cl"].result_list) == [dated_orders[0]]
+    assert response.context["cl"].next_page_url is None
+
+
+@pytest.mark.django_db
+def test_sorted_changelist_falls_back_to_page_numbers(staff_client, dated_orders):
+    response = staff_client.get(ORDERS_URL, {"o": "5", "p": "2"})
+
+    cl = response.context["cl"]
+    assert not cl.keyset
+    assert cl.result_count == 7
+    assert len(cl.result_list) == 3
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not-a-cursor",
+        encode_cursor([[1], 1]),
+        encode_cursor(["2024-01-01T00:00:00", {"a": 1}]),
+        encode_cursor(["2024-01-01T00:00:00", 10**30]),
+    ],
+)
+def test_invalid_cursor(staff_client, dated_orders, cursor):
+    response = staff_client.get(ORDERS_URL, {"cursor": cursor})
+
+    assert response.status_code == 302
+    assert response.url.endswith("?e=1")
+
+
+@pytest.mark.django_db
+def test_estimated_count(staff_client, dated_orders, monkeypatch):
+    monkeypatch.setattr(EstimatedCountPaginator, "count_limit", 5)
+
+    response = staff_client.get(
+        ORDERS_URL, {"user__id__exact": dated_orders[0].user_id}
+    )
+    assert response.context["cl"].result_count == 1
+    response = staff_client.get(ORDERS_URL)
+    assert response.context["cl"].result_count == 5
+    assert b"More than 5 Orders" in response.content
+
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    response = staff_client.get(ORDERS_URL)
+    assert response.context["cl"].result_count == 7
+    assert b"About 7 Orders" in response.content
+
+
+@pytest.mark.django_db
+def test_prescription_changelist_loads_the_displayed_columns(staff_client):
+    PrescriptionDetailFactory.create_batch(3)
+
+    with CaptureQueriesContext(connection) as queries:
+        response = staff_client.get("/admin/optica_app/prescriptiondetail/")
+
+    assert len(response.context["cl"].result_list) == 3
+    table = PrescriptionDetail._meta.db_table
+    select = next(
+        query["sql"]
+        for query in queries
+        if query["sql"].startswith(f'SELECT "{table}"."id"')
+    )
+    assert "fare_pupillary_distance" in select
+    assert "fare_od_spheric" not in select
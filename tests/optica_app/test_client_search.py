@@ -0,0 +1,146 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import io
+import json
+
+import pytest
+
+from optica_app.factory import (
+    ContactFactory,
+    IdentityFactory,
+    InstitutionFactory,
+    UserFactory,
+)
+from optica_app.importers import import_orders, read_jsonl
+from optica_app.models import ClientSearchEntry
+from optica_app.search import fold, phone_digits
+
+
+def test_fold():
+    assert fold("Ștefan Ţugui, Măgurele Înşir") == "stefan tugui, magurele insir"
+
+
+@pytest.mark.parametrize(
+    "value", ["+40 722 000 111", "0040722000111", "0722-000-111", "722000111"]
+)
+def test_phone_digits(value):
+    assert phone_digits(value) == "0722000111"
+
+
+@pytest.fixture
+def clients():
+    stefan = IdentityFactory(first_name="Ștefan", last_name="Țugui")
+    ContactFactory(order=stefan.order, phone_number="+40722000111")
+    InstitutionFactory(
+        order=stefan.order, title="Spitalul Județean", address="Str. Mare 1"
+    )
+    # The same name, typed with cedillas, on a later order
+    stefan_again = IdentityFactory(first_name="Ştefan", last_name="Ţugui")
+    ioana = IdentityFactory(first_name="Ioana", last_name="Stănescu")
+    ContactFactory(order=ioana.order, phone_number="0733555444")
+    return stefan.order, stefan_again.order, ioana.order
+
+
+def search(term):
+    return ClientSearchEntry.objects.search(term)
+
+
+@pytest.mark.django_db
+def test_search_folds_diacritics_and_matches_prefixes(clients):
+    stefan, stefan_again, ioana = clients
+
+    assert search("stefan tugui") == [stefan_again.pk, stefan.pk]
+    assert search("ȘTEF ŢUG") == [stefan_again.pk, stefan.pk]
+    assert search("st") == [ioana.pk, stefan_again.pk, stefan.pk]
+    assert search("judet") == [stefan.pk]
+    assert search("stanescu ioana") == [ioana.pk]
+    assert search("tugui ioana") == []
+    assert search("  ") == []
+
+
+@pytest.mark.django_db
+def test_search_phone_numbers_and_order_codes(clients):
+    stefan, _, ioana = clients
+
+    assert search("+40 722 000") == [stefan.pk]
+    assert search("0733 555 444") == [ioana.pk]
+    assert search("733555") == [ioana.pk]
+    assert search(str(ioana)) == [ioana.pk]
+    assert search(str(ioana.pk)) == [ioana.pk]
+
+
+@pytest.mark.django_db
+def test_search_entries_follow_writes(clients, django_capture_on_commit_callbacks):
+    stefan, stefan_again, ioana = clients
+    identity = ioana.identities
+
+    identity.last_name = "Popescu"
+    identity.save()
+    assert search("stanescu") == []
+    assert search("popescu") == [ioana.pk]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ioana.contacts.delete()
+    assert search("0733") == []
+
+    with django_capture_on_commit_callbacks(execute=True):
+        stefan.delete()
+    assert search("stefan") == [stefan_again.pk]
+    assert not ClientSearchEntry.objects.filter(order_id=stefan.pk).exists()
+
+
+@pytest.mark.django_db
+def test_imported_orders_are_searchable():
+    user = UserFactory()
+    record = {
+        "user": user.username,
+        "identity": {"first_name": "Mihăiță", "last_name": "Dumitrașcu"},
+        "contact": {"phone_number": "+40744123456"},
+    }
+    stream = io.StringIO(json.dumps(record) + "\n")
+
+    report = import_orders(read_jsonl(stream))
+
+    assert report.orders == 1
+    assert len(search("mihaita dumitrascu")) == 1
+    assert search("0744 123") == search("mihaita")
+
+
+@pytest.mark.django_db
+def test_admin_client_search(client, clients):
+    stefan, stefan_again, ioana = clients
+    client.force_login(UserFactory())
+
+    response = client.get("/admin/optica_app/order/client-search/", {"q": "tugui"})
+    results = response.json()["results"]
+    assert [result["id"] for result in results] == [stefan_again.pk, stefan.pk]
+    assert results[1] == {
+        "id": stefan.pk,
+        "order": str(stefan),
+        "name": "Ștefan Țugui",
+        "phone_number": "+40722000111",
+        "institution": "Spitalul Județean",
+        "url": f"/admin/optica_app/order/{stefan.pk}/change/",
+    }
+
+    response = client.get("/admin/optica_app/identity/", {"q": "stanescu"})
+    assert list(response.context["cl"].result_list) == [ioana.identities]
+    response = client.get("/admin/optica_app/order/", {"q": "0722 000 111"})
+    assert list(response.context["cl"].result_list) == [stefan]
+    response = client.get("/admin/optica_app/order/", {"q": str(ioana)})
+    assert list(response.context["cl"].result_list) == [ioana]
+
+
+@pytest.mark.django_db
+def test_admin_client_search_is_not_capped(client):
+    client.force_login(UserFactory())
+    IdentityFactory.create_batch(25, last_name="Popescu")
+
+    response = client.get("/admin/optica_app/identity/", {"q": "popescu"})
+
+    # More than the 20 results of ClientSearchEntry.objects.search()
+    assert response.context["cl"].result_count == 25
@@ -0,0 +1,129 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import pytest
+from django.core.management import call_command
+
+from optica_app.customers import customer_keys, link_order
+from optica_app.factory import ContactFactory, UserFactory
+from optica_app.models import Customer, CustomerKey, Order
+
+
+def test_customer_keys():
+    assert customer_keys("Ștefan", "Țugui", "+40 721 234 567") == [
+        (CustomerKey.PHONE, "0721234567"),
+        (CustomerKey.NAME, "stefan tugui"),
+    ]
+    assert customer_keys("Ana", "", "1234") == []
+
+
+@pytest.mark.django_db
+def test_same_phone_is_same_customer(client_order):
+    first = client_order("Maria", "Ionescu", "0721 234 567")
+    second = client_order("Maria", "Ionescu-Pop", "+40721234567")
+
+    assert first.customer is not None
+    assert second.customer == first.customer
+    assert list(first.customer.orders.order_by("pk")) == [first, second]
+
+
+@pytest.mark.django_db
+def test_same_name_is_same_customer(client_order):
+    first = client_order("Ștefan", "Țugui", "0721234567")
+    second = client_order("tugui", "stefan")
+
+    assert second.customer == first.customer
+
+
+@pytest.mark.django_db
+def test_namesakes_with_other_phones_are_other_customers(client_order):
+    first = client_order("Ion", "Popescu", "0721234567")
+    second = client_order("Ion", "Popescu", "0744000111")
+    third = client_order("Ion", "Popescu")
+
+    assert second.customer != first.customer
+    # Two namesakes: the order cannot be told apart
+    assert third.customer not in (first.customer, second.customer)
+    assert Customer.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_phone_links_and_merges_customers(client_order):
+    first = client_order("Elena", "Radu", "0721234567")
+    second = client_order("Elena", "Radu-Marin")
+    assert second.customer != first.customer
+
+    ContactFactory(order=second, phone_number="0721 234 567")
+    second.refresh_from_db()
+
+    assert second.customer == first.customer
+    assert Customer.objects.count() == 1
+    assert set(first.customer.keys.values_list("value", flat=True)) == {
+        "0721234567",
+        "elena radu",
+        "elena marin radu",
+    }
+
+
+@pytest.mark.django_db
+def test_edited_orders_drop_their_old_keys(client_order):
+    order = client_order("Maria", "Ionescu", "0721234567")
+    identity = order.identities
+    identity.last_name = "Pop"
+    identity.save()
+    order.refresh_from_db()
+
+    assert set(order.customer.keys.values_list("value", flat=True)) == {
+        "0721234567",
+        "maria pop",
+    }
+    # The old name is not this client any more
+    assert client_order("Ionescu", "Maria").customer != order.customer
+
+    # Keys given by another order of the customer are kept
+    other = client_order("Maria", "Pop", "0744000111")
+    assert other.customer != order.customer
+    same = client_order("Maria", "Ionescu", "0721234567")
+    assert same.customer == order.customer
+    identity.last_name = "Popa"
+    identity.save()
+    assert set(order.customer.keys.values_list("value", flat=True)) == {
+        "0721234567",
+        "ionescu maria",
+        "maria popa",
+    }
+
+
+@pytest.mark.django_db
+def test_link_customers_command_resumes(client_order):
+    orders = [
+        client_order("Dan", "Stan", "0721234567"),
+        client_order("Dan", "Stan", "0721234567"),
+        client_order("Dan", "Stan"),
+    ]
+    # As a bulk import would leave them
+    Order.objects.update(customer=None)
+    Customer.objects.all().delete()
+
+    link_order(orders[0].pk)
+    call_command("link_customers", chunk_size=1, verbosity=0)
+
+    assert Customer.objects.count() == 1
+    assert not Order.objects.filter(customer__isnull=True).exists()
+
+
+@pytest.mark.django_db
+def test_admin_customer_pages(client, client_order):
+    order = client_order("Maria", "Ionescu", "0721234567")
+    client.force_login(UserFactory())
+
+    response = client.get("/admin/optica_app/customer/?q=ionescu")
+    assert response.status_code == 200
+    assert response.context["cl"].result_count == 1
+
+    response = client.get(f"/admin/optica_app/customer/{order.customer_id}/change/")
+    assert response.status_code == 200
+    assert str(order) in response.content.decode()
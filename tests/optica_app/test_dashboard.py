@@ -0,0 +1,88 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.core.cache import cache
+
+from optica_app.dashboard import Dashboard
+from optica_app.factory import UserFactory, VoucherFactory, VoucherLineFactory
+from optica_app.models import Order
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.mark.django_db
+def test_dashboard_of_the_optician(client_order, django_assert_max_num_queries):
+    user = UserFactory()
+    order = client_order("Ana", "Popescu", "0722000000", "100.00", user=user)
+    old = client_order("Ana", "Ionescu", "0744000111", "100.00", user=user)
+    Order.objects.filter(pk=old.pk).update(
+        created_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.UTC)
+    )
+    client_order("Ana", "Other", "0722000000", "100.00", user=UserFactory())
+    voucher = VoucherFactory()
+    voucher.orders.add(order)
+    VoucherLineFactory(voucher=voucher, amount=Decimal("30.00"))
+
+    dashboard = Dashboard(user)
+    with django_assert_max_num_queries(5):
+        assert dashboard.today_orders == [order]
+        assert dashboard.today_orders[0].rest == Decimal("70.00")
+        assert dashboard.unpaid_total == Decimal("70.00")
+        assert [row.voucher_id for row in dashboard.unpaid_vouchers] == [voucher.pk]
+        assert [c.last_name for c in dashboard.recent_clients] == [
+            "Popescu",
+            "Ionescu",
+        ]
+
+
+@pytest.mark.django_db
+def test_dashboard_page_is_cached_per_optician(
+    client, client_order, django_assert_num_queries
+):
+    user = UserFactory()
+    order = client_order("Ana", "Popescu", "0722000000", "100.00", user=user)
+    client.force_login(user)
+
+    response = client.get("/")
+    assert response.status_code == 200
+    assert "Popescu" in response.content.decode()
+
+    # The user of the session and the version of the fragment
+    with django_assert_num_queries(2):
+        assert "Popescu" in client.get("/").content.decode()
+
+    # Order writes and payments change the version
+    identity = order.identities
+    identity.last_name = "Popescu-Radu"
+    identity.save()
+    assert "Popescu-Radu" in client.get("/").content.decode()
+
+    voucher = VoucherFactory()
+    voucher.orders.add(order)
+    client.get("/")
+    VoucherLineFactory(voucher=voucher, amount=Decimal("100.00"))
+    assert "Nothing to collect." in client.get("/").content.decode()
+
+    other = UserFactory()
+    client.force_login(other)
+    assert "Popescu" not in client.get("/").content.decode()
+
+
+@pytest.mark.django_db
+def test_dashboard_requires_login(client):
+    response = client.get("/")
+
+    assert response.status_code == 302
+    assert response["Location"].startswith("/admin/login/")
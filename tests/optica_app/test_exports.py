@@ -0,0 +1,104 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import csv
+import datetime
+import io
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+
+from optica_app.catalog import catalog
+from optica_app.exports import ORDER_HEADER, order_rows
+from optica_app.factory import (
+    ContactFactory,
+    IdentityFactory,
+    OrderFactory,
+    ProductFactory,
+    UserFactory,
+    VoucherFactory,
+    VoucherLineFactory,
+)
+from optica_app.models import Frame, Order
+
+
+@pytest.fixture
+def paid_orders():
+    first, second = OrderFactory(), OrderFactory()
+    for order in (first, second):
+        IdentityFactory(order=order, first_name="Ana", last_name=f"ODR{order.pk}")
+        ContactFactory(order=order, phone_number="+40722000000")
+        ProductFactory(order=order, price=Decimal("100.00"))
+    voucher = VoucherFactory()
+    voucher.orders.add(first, second)
+    VoucherLineFactory(
+        voucher=voucher,
+        amount=Decimal("150.00"),
+        payment_date=datetime.date(2024, 3, 5),
+    )
+    return first, second
+
+
+@pytest.mark.django_db
+def test_order_rows_allocate_payments_oldest_first(
+    paid_orders, django_assert_num_queries
+):
+    catalog.objects(Frame)  # product labels are served by the warm catalog cache
+    with django_assert_num_queries(2):
+        rows = [dict(zip(ORDER_HEADER, row)) for row in order_rows(Order.objects)]
+
+    assert [row["order"] for row in rows] == [str(order) for order in paid_orders]
+    assert [(row["paid"], row["rest"]) for row in rows] == [
+        (Decimal("100.00"), Decimal("0.00")),
+        (Decimal("50.00"), Decimal("50.00")),
+    ]
+    assert rows[0]["last_name"] == f"ODR{paid_orders[0].pk}"
+    assert rows[0]["products"].endswith(": 100.00")
+
+
+@pytest.mark.django_db
+def test_export_orders_admin_action_streams_csv(client, paid_orders):
+    client.force_login(UserFactory())
+
+    response = client.post(
+        "/admin/optica_app/order/",
+        {"action": "export_orders_csv", "_selected_action": [paid_orders[1].pk]},
+    )
+
+    assert response.streaming
+    assert response["Content-Disposition"] == 'attachment; filename="orders.csv"'
+    content = b"".join(response.streaming_content).decode("utf-8-sig")
+    rows = list(csv.reader(io.StringIO(content)))
+    assert rows[0] == ORDER_HEADER
+    assert [row[0] for row in rows[1:]] == [str(paid_orders[1])]
+
+
+@pytest.mark.django_db
+def test_export_payments_command(tmp_path, paid_orders):
+    VoucherLineFactory(payment_date=datetime.date(2024, 4, 1))
+    path = tmp_path / "payments.csv"
+
+    call_command(
+        "export_orders", "payments", "--until", "2024-03-31", "--output", str(path)
+    )
+
+    rows = list(csv.reader(path.open(encoding="utf-8-sig")))
+    assert len(rows) == 2
+    assert rows[1][:2] == ["2024-03-05", "150.00"]
+    assert rows[1][5] == f"{paid_orders[0]} {paid_orders[1]}"
+
+
+@pytest.mark.django_db
+def test_order_rows_quote_formulas(paid_orders):
+    IdentityFactory(first_name='=HYPERLINK("http://x")', last_name="@SUM(A1)")
+
+    rows = [dict(zip(ORDER_HEADER, row)) for row in order_rows(Order.objects)]
+
+    assert rows[0]["first_name"] == "Ana"
+    assert rows[0]["phone_number"] == "'+40722000000"
+    assert rows[-1]["first_name"] == '\'=HYPERLINK("http://x")'
+    assert rows[-1]["last_name"] == "'@SUM(A1)"
@@ -0,0 +1,150 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import csv
+import io
+import json
+from decimal import Decimal
+
+import pytest
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+
+from optica_app.factory import UserFactory
+from optica_app.importers import (
+    CSV_ORDER_COLUMNS,
+    CSV_PRODUCT_COLUMNS,
+    import_orders,
+    read_csv,
+    read_jsonl,
+)
+from optica_app.models import Order, PrescriptionDetail, Product
+
+
+@pytest.fixture(autouse=True)
+def alex(db):
+    # The user named by the records
+    return UserFactory(username="alex")
+
+
+@pytest.mark.django_db
+def test_import_jsonl(order_record):
+    lines = [json.dumps(order_record()) for _ in range(3)]
+    lines.append(json.dumps(order_record(user="nobody")))
+    lines.append(
+        json.dumps(order_record(prescription={"fare_od_spheric": "-30"}, products=[]))
+    )
+    lines.append("{not json")
+    rejects = io.StringIO()
+
+    report = import_orders(
+        read_jsonl(io.StringIO("\n".join(lines))), chunk_size=2, rejects=rejects
+    )
+
+    assert (report.records, report.orders, report.products) == (6, 3, 6)
+    assert report.rejected == 3
+    rejected = [json.loads(line) for line in rejects.getvalue().splitlines()]
+    assert [row["line"] for row in rejected] == [4, 5, 6]
+    assert "prescription.fare_od_spheric" in rejected[1]["errors"]
+    order = Order.objects.select_related("identities", "prescriptions").first()
+    assert order.total_amount == Decimal("450.50")
+    assert order.created_at.year == 2023
+    assert order.identities.last_name == "Popescu"
+    assert order.prescriptions.fare_od_spheric == Decimal("-1.25")
+    assert order.prescriptions.aproape_od_spheric is None
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "overrides, key",
+    [
+        ({"identity": "Ana"}, "identity"),
+        ({"contact": ["0722000000"]}, "contact"),
+        ({"products": "abc"}, "products"),
+        ({"products": ["x"]}, "products.0"),
+        ({"user": {"name": "alex"}}, "user"),
+        ({"prescription": {"fare_od_axis": 1e400}}, "prescription.fare_od_axis"),
+        ({"products": [{"frame": 1, "glass_type": 1, "lens": 1}]}, "products.0.price"),
+        ({"identity": {}}, "identity.first_name"),
+    ],
+)
+def test_import_rejects_malformed_records(order_record, overrides, key):
+    lines = [
+        json.dumps(order_record(**overrides)),
+        json.dumps(order_record()),
+    ]
+    rejects = io.StringIO()
+
+    report = import_orders(read_jsonl(io.StringIO("\n".join(lines))), rejects=rejects)
+
+    assert (report.orders, report.rejected) == (1, 1)
+    assert key in json.loads(rejects.getvalue())["errors"]
+
+
+@pytest.mark.django_db
+def test_import_csv_groups_product_lines(alex, catalog_references):
+    stream = io.StringIO()
+    writer = csv.DictWriter(stream, CSV_ORDER_COLUMNS + CSV_PRODUCT_COLUMNS)
+    writer.writeheader()
+    rows = (("A", "10.00"), ("A", "20.00"), ("B", "5.00"), ("", "1.00"), ("", "2.00"))
+    for ref, price in rows:
+        writer.writerow(
+            {
+                "order_ref": ref,
+                "user": alex.username,
+                "first_name": "Ana",
+                "last_name": ref or "Pop",
+                "price": price,
+                **catalog_references,
+            }
+        )
+    stream.seek(0)
+
+    report = import_orders(read_csv(stream))
+
+    # The rows without order_ref are orders of their own
+    assert (report.orders, report.products, report.rejected) == (4, 5, 0)
+    assert sorted(Order.objects.values_list("total_amount", flat=True)) == [
+        Decimal("1.00"),
+        Decimal("2.00"),
+        Decimal("5.00"),
+        Decimal("30.00"),
+    ]
+    assert not PrescriptionDetail.objects.exists()
+
+
+@pytest.mark.django_db
+def test_import_csv_reports_missing_columns(tmp_path):
+    stream = io.StringIO("order_ref,user,price,frame\nA,alex,10.00,1\n")
+
+    with pytest.raises(ValidationError, match="Missing columns: glass_type, lens."):
+        import_orders(read_csv(stream))
+
+    path = tmp_path / "orders.csv"
+    path.write_text(stream.getvalue())
+    with pytest.raises(CommandError, match="Missing columns"):
+        call_command("import_orders", str(path), stdout=io.StringIO())
+    assert not Order.objects.exists()
+
+
+@pytest.mark.django_db
+def test_import_orders_command(tmp_path, order_record):
+    path = tmp_path / "orders.jsonl"
+    path.write_text(
+        json.dumps(order_record())
+        + "\n"
+        + json.dumps(order_record(products=[{"price": "1", "frame": 0}]))
+    )
+    out = io.StringIO()
+
+    call_command("import_orders", str(path), stdout=out)
+
+    assert "Imported 1 orders (2 products)" in out.getvalue()
+    assert Product.objects.count() == 2
+    rejects = (tmp_path / "orders.jsonl.rejects.jsonl").read_text().splitlines()
+    assert json.loads(rejects[0])["errors"]["products.0.frame"] == [
+        "Unknown reference."
+    ]
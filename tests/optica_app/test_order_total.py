@@ -0,0 +1,102 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+
+from optica_app.factory import OrderFactory, ProductFactory
+from optica_app.models import Order, Product
+
+
+def stored_total(order):
+    order.refresh_from_db(fields=["total_amount"])
+    return order.total_amount
+
+
+@pytest.mark.django_db
+def test_total_follows_product_save_and_delete():
+    order = OrderFactory()
+    product = ProductFactory(order=order, price=Decimal("100.00"))
+    ProductFactory(order=order, price=Decimal("50.50"))
+    assert stored_total(order) == Decimal("150.50")
+
+    product.price = Decimal("10.00")
+    product.save()
+    assert stored_total(order) == Decimal("60.50")
+
+    product.delete()
+    assert stored_total(order) == Decimal("50.50")
+
+
+@pytest.mark.django_db
+def test_total_follows_product_moved_to_another_order():
+    source, target = OrderFactory(), OrderFactory()
+    product = ProductFactory(order=source, price=Decimal("80.00"))
+
+    product = Product.objects.get(pk=product.pk)
+    product.order = target
+    product.save()
+
+    assert stored_total(source) == Decimal("0.00")
+    assert stored_total(target) == Decimal("80.00")
+
+
+@pytest.mark.django_db
+def test_total_follows_bulk_and_queryset_writes():
+    order = OrderFactory()
+    template = ProductFactory(order=order, price=Decimal("1.00"))
+    Product.objects.bulk_create(
+        [
+            Product(
+                order=order,
+                price=Decimal("20.00"),
+                frame=template.frame,
+                glass_type=template.glass_type,
+                lens=template.lens,
+            )
+            for _ in range(3)
+        ]
+    )
+    assert stored_total(order) == Decimal("61.00")
+
+    Product.objects.filter(order=order).update(price=Decimal("5.00"))
+    assert stored_total(order) == Decimal("20.00")
+
+    other = OrderFactory()
+    other.products.set(Product.objects.filter(order=order)[:2])
+    assert stored_total(order) == Decimal("10.00")
+    assert stored_total(other) == Decimal("10.00")
+
+    Product.objects.filter(order=order).delete()
+    assert stored_total(order) == Decimal("0.00")
+
+
+@pytest.mark.django_db
+def test_saving_a_stale_order_keeps_the_total():
+    order = OrderFactory()
+    stale = Order.objects.get(pk=order.pk)
+    ProductFactory(order=order, price=Decimal("75.00"))
+    other = OrderFactory()
+
+    stale.user = other.user
+    stale.save()
+
+    assert stored_total(order) == Decimal("75.00")
+    assert Order.objects.get(pk=order.pk).user == other.user
+
+
+@pytest.mark.django_db
+def test_recompute_order_totals_repairs_drift():
+    product = ProductFactory(price=Decimal("42.00"))
+    Order.objects.update(total_amount=Decimal("1.00"))
+    assert Order.objects.drifted().count() == 1
+
+    call_command("recompute_order_totals", batch_size=1)
+
+    assert stored_total(product.order) == Decimal("42.00")
+    assert not Order.objects.drifted().exists()
@@ -0,0 +1,106 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+from decimal import Decimal
+
+import pytest
+from django.core.exceptions import ValidationError
+
+from optica_app.factory import UserFactory
+from optica_app.models import ClientSearchEntry, Order
+from optica_app.orders import create_order
+
+
+@pytest.mark.django_db
+def test_create_order_writes_everything(order_record):
+    user = UserFactory()
+
+    order = create_order(order_record(), user)
+
+    assert order.user == user
+    assert order.total_amount == Decimal("450.50")
+    assert order.identities.last_name == "Popescu"
+    assert order.contacts.phone_number == "+40722000000"
+    assert order.institutions.title == "Cămin"
+    assert order.prescriptions.fare_od_spheric == Decimal("-1.25")
+    assert order.products.count() == 2
+    assert order.customer.last_name == "Popescu"
+    assert list(ClientSearchEntry.objects.search("popescu")) == [order.pk]
+
+
+@pytest.mark.django_db
+def test_create_order_runs_a_fixed_number_of_queries(
+    order_record, django_assert_num_queries
+):
+    user = UserFactory()
+    create_order(order_record(), user)
+
+    # One INSERT per table, the total, the search entry and the customer; a
+    # created_at of the record would be written by one more UPDATE
+    for lines in (1, 5):
+        record = order_record(prices=["100.00"] * lines, created_at=None)
+        with django_assert_num_queries(20):
+            create_order(record, user)
+
+
+@pytest.mark.django_db
+def test_invalid_record_writes_nothing(order_record, catalog_references):
+    record = order_record(
+        identity={"first_name": "Ana", "last_name": "x" * 500},
+        products=[{"price": "-1", **catalog_references}, {"price": "1", "frame": 0}],
+    )
+
+    with pytest.raises(ValidationError) as error:
+        create_order(record, UserFactory())
+
+    assert {
+        "identity.last_name",
+        "products.0.price",
+        "products.1.frame",
+        "products.1.lens",
+    } <= error.value.message_dict.keys()
+    assert not Order.objects.exists()
+
+
+@pytest.mark.django_db
+def test_missing_required_fields_write_nothing(order_record, catalog_references):
+    record = order_record(identity={"first_name": "Ana"}, products=[catalog_references])
+
+    with pytest.raises(ValidationError) as error:
+        create_order(record, UserFactory())
+
+    assert error.value.message_dict == {
+        "identity.last_name": ["This field is required."],
+        "products.0.price": ["This field is required."],
+    }
+    assert not Order.objects.exists()
+
+
+@pytest.mark.django_db
+def test_tunnel_form_creates_the_order(client, catalog_references):
+    user = UserFactory()
+    data = {
+        "order-user": user.pk,
+        "identity-first_name": "Ana",
+        "identity-last_name": "Popescu",
+        "contact-phone_number": "0722000000",
+        "institution-title": "Cămin",
+        "institution-address": "Strada Mare 1",
+        "product-price": "120.00",
+        **{f"product-{name}": pk for name, pk in catalog_references.items()},
+    }
+
+    response = client.post("/tunnel/", data)
+
+    assert response.status_code == 302
+    order = Order.objects.get()
+    assert (order.user, order.total_amount) == (user, Decimal("120.00"))
+    assert order.identities.first_name == "Ana"
+
+    response = client.post("/tunnel/", dict(data, **{"product-price": "-5"}))
+    assert response.status_code == 200
+    assert "price" in response.context["product_form"].errors
+    assert Order.objects.count() == 1
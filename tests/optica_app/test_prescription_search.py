@@ -0,0 +1,149 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from optica_app.factory import (
+    IdentityFactory,
+    OrderFactory,
+    PrescriptionDetailFactory,
+    UserFactory,
+)
+from optica_app.models import Order, PrescriptionDetail
+
+
+@pytest.fixture
+def ranged_prescriptions():
+    return [
+        PrescriptionDetailFactory(
+            fare_od_spheric=Decimal(sphere),
+            fare_od_cylindric=Decimal(cylinder),
+            fare_os_cylindric=Decimal("0.00"),
+            fare_pupillary_distance=Decimal(pd),
+        )
+        for sphere, cylinder, pd in (
+            ("-3.50", "0.00", "58.0"),
+            ("-2.50", "-0.75", "62.0"),
+            ("-2.00", "0.00", "64.0"),
+            ("1.25", "0.50", "66.0"),
+        )
+    ]
+
+
+@pytest.mark.django_db
+def test_in_range(ranged_prescriptions):
+    queryset = PrescriptionDetail.objects.in_range("fare_od_spheric", "-3.00", "-2.00")
+    assert set(queryset) == set(ranged_prescriptions[1:3])
+
+    queryset = PrescriptionDetail.objects.in_range("fare_pupillary_distance", 60)
+    assert set(queryset) == set(ranged_prescriptions[1:])
+    assert "prescr_fare_pd_idx" in queryset.explain()
+
+
+@pytest.mark.django_db
+def test_with_cylinder(ranged_prescriptions):
+    assert set(PrescriptionDetail.objects.with_cylinder()) == {
+        ranged_prescriptions[1],
+        ranged_prescriptions[3],
+    }
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("ODR_000123", 123),
+        ("odr_42", 42),
+        (" 7 ", 7),
+        ("Ana", None),
+        ("", None),
+        ("²", None),
+        ("ODR_١٢", None),
+        ("9" * 30, None),
+    ],
+)
+def test_order_parse_code(value, expected):
+    assert Order.parse_code(value) == expected
+
+
+@pytest.mark.django_db
+def test_admin_range_filters_and_order_search(client, ranged_prescriptions):
+    client.force_login(UserFactory())
+    url = "/admin/optica_app/prescriptiondetail/"
+
+    response = client.get(
+        url,
+        {
+            "fare_od_spheric__gte": "-3",
+            "fare_od_spheric__lte": "-2",
+            "fare_pupillary_distance__gte": "",
+            "cylinder": "yes",
+        },
+    )
+    assert list(response.context["cl"].result_list) == [ranged_prescriptions[1]]
+
+    order = ranged_prescriptions[2].order
+    response = client.get(url, {"q": str(order)})
+    assert list(response.context["cl"].result_list) == [ranged_prescriptions[2]]
+    for term in ("²", "9" * 30):
+        response = client.get(url, {"q": term})
+        assert list(response.context["cl"].result_list) == []
+
+
+@pytest.mark.django_db
+def test_admin_range_filter_form_keeps_the_query(client, ranged_prescriptions):
+    client.force_login(UserFactory())
+    response = client.get(
+        "/admin/optica_app/prescriptiondetail/",
+        {"q": "Pop", "o": "2", "cylinder": "yes", "fare_od_spheric__gte": "-3"},
+    )
+
+    (spec,) = [
+        spec
+        for spec in response.context["cl"].filter_specs
+        if getattr(spec, "field_path", None) == "fare_od_spheric"
+    ]
+    (choice,) = spec.choices(response.context["cl"])
+    assert choice["hidden_params"] == [("q", "Pop"), ("o", "2"), ("cylinder", "yes")]
+    assert '<input type="hidden" name="q" value="Pop">' in response.content.decode()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "url, factory",
+    [
+        ("/admin/optica_app/prescriptiondetail/", PrescriptionDetailFactory),
+        ("/admin/optica_app/identity/", IdentityFactory),
+    ],
+)
+def test_admin_order_filters_do_not_list_orders(client, url, factory):
+    optician, other = UserFactory(), UserFactory()
+    client.force_login(optician)
+
+    def changelist_queries(rows):
+        for _ in range(rows):
+            factory(order=OrderFactory(user=optician))
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        assert response.status_code == 200
+        assert b"order__id__exact" not in response.content
+        return len(queries)
+
+    assert changelist_queries(2) == changelist_queries(20)
+
+    row = factory(order=OrderFactory(user=other))
+    response = client.get(
+        url,
+        {
+            "order__user__id__exact": other.pk,
+            "order__gte": row.order_id,
+            "order__created_at__year": row.order.created_at.year,
+        },
+    )
+    assert list(response.context["cl"].result_list) == [row]
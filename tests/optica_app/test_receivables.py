@@ -0,0 +1,126 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+
+from optica_app.factory import (
+    OrderFactory,
+    ProductFactory,
+    VoucherFactory,
+    VoucherLineFactory,
+)
+from optica_app.models import Order, Product, VoucherBalance, VoucherLine
+
+
+def balance(voucher):
+    return VoucherBalance.objects.get(voucher=voucher)
+
+
+def order_of(price, days_ago=0):
+    order = OrderFactory()
+    ProductFactory(order=order, price=Decimal(price))
+    created_at = timezone.now() - datetime.timedelta(days=days_ago)
+    Order.objects.filter(pk=order.pk).update(created_at=created_at)
+    return order
+
+
+@pytest.mark.django_db
+def test_ledger_follows_orders_products_and_lines():
+    voucher = VoucherFactory()
+    assert balance(voucher).rest_amount == Decimal("0.00")
+
+    order = order_of("100.00")
+    voucher.orders.add(order)
+    assert balance(voucher).rest_amount == Decimal("100.00")
+
+    product = ProductFactory(order=order, price=Decimal("20.00"))
+    line = VoucherLineFactory(voucher=voucher, amount=Decimal("70.00"))
+    ledger = balance(voucher)
+    assert ledger.orders_total == Decimal("120.00")
+    assert ledger.paid_total == Decimal("70.00")
+    assert ledger.rest_amount == Decimal("50.00")
+    assert ledger.last_payment_date == line.payment_date
+
+    Product.objects.filter(pk=product.pk).delete()
+    VoucherLine.objects.filter(pk=line.pk).update(amount=Decimal("100.00"))
+    assert balance(voucher).rest_amount == Decimal("0.00")
+
+    order.vouchers.clear()
+    assert balance(voucher).orders_total == Decimal("0.00")
+
+
+@pytest.mark.django_db
+def test_ledger_follows_order_delete():
+    voucher = VoucherFactory()
+    order = order_of("80.00")
+    voucher.orders.add(order)
+
+    order.delete()
+
+    assert balance(voucher).rest_amount == Decimal("0.00")
+
+
+@pytest.mark.django_db
+def test_outstanding_and_total_receivables():
+    owing, settled = VoucherFactory(), VoucherFactory()
+    owing.orders.add(order_of("300.00"))
+    settled.orders.add(order_of("50.00"))
+    VoucherLineFactory(voucher=owing, amount=Decimal("100.00"))
+    VoucherLineFactory(voucher=settled, amount=Decimal("50.00"))
+
+    assert list(
+        VoucherBalance.objects.outstanding().values_list("voucher", flat=True)
+    ) == [owing.pk]
+    assert VoucherBalance.objects.total_receivables() == Decimal("200.00")
+
+
+@pytest.mark.django_db
+def test_aging_allocates_payments_to_oldest_orders():
+    today = timezone.localdate()
+    voucher = VoucherFactory()
+    voucher.orders.add(order_of("100.00", days_ago=120))
+    voucher.orders.add(order_of("100.00", days_ago=45))
+    voucher.orders.add(order_of("100.00", days_ago=5))
+    VoucherLineFactory(voucher=voucher, amount=Decimal("150.00"), payment_date=today)
+
+    assert VoucherBalance.objects.aging() == {
+        "0-30": Decimal("100.00"),
+        "31-60": Decimal("50.00"),
+        "61-90": Decimal("0.00"),
+        "90+": Decimal("0.00"),
+    }
+    # A month ago the payment was not made and the last order did not exist
+    last_month = today - datetime.timedelta(days=30)
+    assert VoucherBalance.objects.aging(as_of=last_month) == {
+        "0-30": Decimal("100.00"),
+        "31-60": Decimal("0.00"),
+        "61-90": Decimal("100.00"),
+        "90+": Decimal("0.00"),
+    }
+
+
+@pytest.mark.django_db
+def test_aging_counts_the_orders_without_date_once():
+    voucher = VoucherFactory()
+    voucher.orders.add(order_of("100.00", days_ago=5))
+    voucher.orders.add(order_of("100.00", days_ago=40))
+    undated = order_of("100.00")
+    Order.objects.filter(pk=undated.pk).update(created_at=None)
+    voucher.orders.add(undated)
+
+    aging = VoucherBalance.objects.aging()
+
+    assert aging == {
+        "0-30": Decimal("100.00"),
+        "31-60": Decimal("100.00"),
+        "61-90": Decimal("0.00"),
+        "90+": Decimal("100.00"),
+    }
+    assert sum(aging.values()) == VoucherBalance.objects.total_receivables()
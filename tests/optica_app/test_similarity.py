@@ -0,0 +1,102 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from optica_app import similarity
+from optica_app.factory import PrescriptionDetailFactory, ProductFactory, UserFactory
+
+
+@pytest.fixture(autouse=True)
+def index(monkeypatch):
+    index = similarity.PrescriptionIndex()
+    monkeypatch.setattr(similarity, "index", index)
+    return index
+
+
+def prescription(od_sph, od_cyl=0, od_axis=0, os_sph=None, **kwargs):
+    return PrescriptionDetailFactory(
+        fare_od_spheric=Decimal(od_sph),
+        fare_od_cylindric=Decimal(od_cyl),
+        fare_od_axis=od_axis,
+        fare_os_spheric=Decimal(od_sph if os_sph is None else os_sph),
+        fare_os_cylindric=Decimal(od_cyl),
+        fare_os_axis=od_axis,
+        **kwargs,
+    )
+
+
+def test_power_vectors_axis_is_circular():
+    vectors = similarity.power_vectors(
+        np.array(
+            [
+                [-1.0, -2.0, 1, -1.0, -2.0, 1],
+                [-1.0, -2.0, 179, -1.0, -2.0, 179],
+                [-1.0, -2.0, 90, -1.0, -2.0, 90],
+            ]
+        )
+    )
+    assert np.linalg.norm(vectors[0] - vectors[1]) < 0.2
+    assert np.linalg.norm(vectors[0] - vectors[2]) > 2.5
+    np.testing.assert_allclose(vectors[:, 0], -2.0)
+
+
+@pytest.mark.django_db
+def test_similar_prescriptions_nearest_first():
+    target = prescription("-2.00", "-0.50", 10)
+    near = prescription("-2.25", "-0.50", 170)
+    far = prescription("-6.00")
+    middle = prescription("-2.00", "-0.50", 90)
+    product = ProductFactory(order=near.order)
+
+    results = similarity.similar_prescriptions(target, k=2)
+
+    assert [found for found, _ in results] == [near, middle]
+    assert results[0][1] < results[1][1]
+    assert list(results[0][0].order.products.all()) == [product]
+    assert similarity.similar_prescriptions(target)[-1][0] == far
+
+
+@pytest.mark.django_db
+def test_index_follows_saves_and_deletes(index, django_capture_on_commit_callbacks):
+    target = prescription("1.00")
+    index.build()
+    assert len(index) == 1
+
+    with django_capture_on_commit_callbacks(execute=True):
+        other = prescription("1.25")
+    assert len(index) == 2
+    vector = similarity.prescription_vector(target)
+    assert index.query(vector, k=1, exclude={target.pk}) == [
+        (other.pk, pytest.approx(0.25 * 2**0.5))
+    ]
+
+    with django_capture_on_commit_callbacks(execute=True):
+        other.fare_od_spheric = other.fare_os_spheric = Decimal("-8.00")
+        other.save()
+        prescription("0.75")
+    nearest = similarity.similar_prescriptions(target, k=1)[0][0]
+    assert nearest.fare_od_spheric == Decimal("0.75")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        nearest.delete()
+    assert len(index) == 2
+    assert similarity.similar_prescriptions(target, k=1)[0][0] == other
+
+
+@pytest.mark.django_db
+def test_admin_similar_page(client):
+    target = prescription("1.00")
+    prescription("1.25")
+    client.force_login(UserFactory())
+
+    response = client.get(f"/admin/optica_app/prescriptiondetail/{target.pk}/similar/")
+
+    assert response.status_code == 200
+    assert len(response.context["neighbours"]) == 1
@@ -0,0 +1,161 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth.models import Permission
+from django.db import OperationalError, connection
+from django.db.models import QuerySet
+
+from optica_app.factory import ProductFactory, UserFactory
+from optica_app.models import Product, SlowQuery, VoucherLine
+from optica_app.slowqueries import SlowQueryRecorder, explain, fingerprint, normalize
+
+
+def test_normalize():
+    assert (
+        normalize(
+            "SELECT *  FROM \"t\" WHERE \"a\" IN (%s, %s) AND b = 'it''s' LIMIT 21"
+        )
+        == 'SELECT * FROM "t" WHERE "a" IN (...) AND b = %s LIMIT %s'
+    )
+    assert fingerprint('SELECT 1 FROM "t" WHERE "a" IN (%s)') == fingerprint(
+        'SELECT 2 FROM "t" WHERE "a" IN (%s, %s, %s)'
+    )
+
+
+def record(recorder, *querysets):
+    with connection.execute_wrapper(recorder):
+        for queryset in querysets:
+            list(queryset.all())
+    recorder.flush()
+
+
+@pytest.mark.django_db
+def test_recorder():
+    recorder = SlowQueryRecorder(threshold_ms=0)
+    record(
+        recorder,
+        Product.objects.filter(price__gt=Decimal("10")),
+        Product.objects.filter(price__gt=Decimal("20")),
+    )
+    [slow_query] = SlowQuery.objects.all()
+    assert slow_query.calls == 2
+    assert slow_query.sql.endswith('WHERE "optica_app_product"."price" > %s')
+    assert slow_query.sample_params == ["20"]
+
+    record(recorder, Product.objects.filter(price__gt=Decimal("30")))
+    slow_query.refresh_from_db()
+    assert slow_query.calls == 3
+    assert slow_query.max_time >= slow_query.mean_time() > 0
+    assert slow_query.sample_params == ["30"]
+
+    record(SlowQueryRecorder(threshold_ms=10_000), Product.objects.all())
+    assert SlowQuery.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_concurrent_first_flushes(monkeypatch):
+    ours, theirs = SlowQueryRecorder(threshold_ms=0), SlowQueryRecorder(threshold_ms=0)
+    queryset = Product.objects.filter(price__gt=Decimal("10"))
+    for recorder in (ours, theirs):
+        with connection.execute_wrapper(recorder):
+            list(queryset.all())
+    update = QuerySet.update
+
+    def racing_update(self, **kwargs):
+        # The other process creates the row between our update and create
+        monkeypatch.setattr(QuerySet, "update", update)
+        theirs.flush()
+        return 0
+
+    monkeypatch.setattr(QuerySet, "update", racing_update)
+    ours.flush()
+
+    [slow_query] = SlowQuery.objects.all()
+    assert slow_query.calls == 2
+
+
+@pytest.mark.django_db
+def test_flush_drops_what_it_cannot_write(monkeypatch):
+    recorder = SlowQueryRecorder(threshold_ms=0)
+
+    def locked(*args):
+        raise OperationalError("database is locked")
+
+    monkeypatch.setattr(recorder, "write", locked)
+    record(recorder, Product.objects.all())
+
+    assert not recorder.pending
+    assert not SlowQuery.objects.exists()
+
+
+@pytest.mark.django_db
+def test_explain():
+    ProductFactory.create_batch(2)
+    recorder = SlowQueryRecorder(threshold_ms=0)
+    record(
+        recorder,
+        Product.objects.filter(price__gt=Decimal("10")),
+        Product.objects.filter(order__pk=1),
+    )
+    by_price = SlowQuery.objects.get(sql__contains='"price" >')
+    explain(by_price)
+    assert by_price.full_scans == ["optica_app_product"]
+    assert by_price.suggested_indexes == ["optica_app_product (price)"]
+    assert "SCAN optica_app_product" in by_price.plan
+
+    # The join on the voucher is not a filter of the lines
+    record(
+        recorder,
+        VoucherLine.objects.filter(amount__gte=Decimal("5")).select_related("voucher"),
+    )
+    by_amount = SlowQuery.objects.get(sql__contains='"amount" >=')
+    explain(by_amount)
+    assert by_amount.full_scans == ["optica_app_voucherline"]
+    assert by_amount.suggested_indexes == ["optica_app_voucherline (amount)"]
+
+    # Searched through the index of the foreign key
+    by_order = SlowQuery.objects.get(sql__contains='"order_id" =')
+    explain(by_order)
+    assert (by_order.full_scans, by_order.suggested_indexes) == ([], [])
+
+
+@pytest.mark.django_db
+def test_admin(client):
+    client.force_login(UserFactory())
+    record(SlowQueryRecorder(threshold_ms=0), Product.objects.filter(price=1))
+    slow_query = SlowQuery.objects.get()
+    url = "/admin/optica_app/slowquery/"
+    response = client.post(
+        url, {"action": "explain_queries", "_selected_action": [slow_query.pk]}
+    )
+    assert response.status_code == 302
+    response = client.get(url)
+    assert response.status_code == 200
+    assert b"optica_app_product (price)" in response.content
+
+
+@pytest.mark.django_db
+def test_admin_explain_needs_its_permission(client):
+    viewer = UserFactory(is_superuser=False)
+    viewer.user_permissions.add(Permission.objects.get(codename="view_slowquery"))
+    client.force_login(viewer)
+    record(SlowQueryRecorder(threshold_ms=0), Product.objects.filter(price=1))
+    slow_query = SlowQuery.objects.get()
+    url = "/admin/optica_app/slowquery/"
+    data = {"action": "explain_queries", "_selected_action": [slow_query.pk]}
+
+    assert b"explain_queries" not in client.get(url).content
+    client.post(url, data)
+    slow_query.refresh_from_db()
+    assert slow_query.explained_at is None
+
+    viewer.user_permissions.add(Permission.objects.get(codename="explain_slowquery"))
+    client.post(url, data)
+    slow_query.refresh_from_db()
+    assert slow_query.explained_at is not None
@@ -0,0 +1,225 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+import datetime
+import gzip
+import json
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.db.models.functions import Now
+
+from optica_app import sync
+from optica_app.factory import (
+    FrameFactory,
+    GlassTypeFactory,
+    IdentityFactory,
+    LensFactory,
+    PrescriptionDetailFactory,
+    ProductFactory,
+    UserFactory,
+)
+from optica_app.models import Order
+
+
+@pytest.fixture
+def optician():
+    return UserFactory(is_staff=False, is_superuser=False)
+
+
+@pytest.fixture
+def device(client, monkeypatch, optician):
+    monkeypatch.setattr(sync, "SETTLE_DELAY", datetime.timedelta(seconds=-1))
+    client.force_login(optician)
+    return client
+
+
+def pull_all(client, cursor=None, limit=None):
+    """Pull until there is no more change; return the merged changes."""
+    merged = {"orders": [], "deleted": [], "catalog": None, "pulls": 0}
+    while True:
+        params = {key: value for key, value in (("cursor", cursor), ("limit", limit))}
+        response = client.get("/sync/pull/", {k: v for k, v in params.items() if v})
+        assert response.status_code == 200, response.content
+        data = response.json()
+        merged["orders"] += data["orders"]
+        merged["deleted"] += data["deleted"]
+        merged["catalog"] = data["catalog"] or merged["catalog"]
+        merged["pulls"] += 1
+        cursor = merged["cursor"] = data["cursor"]
+        if not data["more"]:
+            return merged
+
+
+def full_order(user):
+    order = IdentityFactory(last_name="Popescu", order__user=user).order
+    PrescriptionDetailFactory(order=order)
+    ProductFactory(order=order)
+    return order
+
+
+@pytest.mark.django_db
+def test_pull_everything_then_only_the_changes(device, optician):
+    orders = [full_order(optician) for _ in range(5)]
+
+    changes = pull_all(device, limit=2)
+    assert changes["pulls"] == 3
+    assert [record["id"] for record in changes["orders"]] == [o.pk for o in orders]
+    record = changes["orders"][0]
+    assert record["uuid"] == str(orders[0].uuid)
+    assert record["identity"]["last_name"] == "Popescu"
+    assert record["contact"] is None
+    assert record["prescription"]["fare_od_spheric"] is not None
+    assert [product["id"] for product in record["products"]] == [
+        orders[0].products.get().pk
+    ]
+    assert {"frames", "glass_types", "lenses"} <= changes["catalog"].keys()
+
+    changes = pull_all(device, changes["cursor"])
+    assert (changes["orders"], changes["deleted"], changes["catalog"]) == ([], [], None)
+
+    prescription = orders[2].prescriptions
+    prescription.fare_od_spheric = Decimal("-3.00")
+    prescription.save()
+    deleted = orders[3].pk
+    orders[3].delete()
+    FrameFactory()
+
+    changes = pull_all(device, changes["cursor"])
+    assert [record["id"] for record in changes["orders"]] == [orders[2].pk]
+    assert changes["orders"][0]["prescription"]["fare_od_spheric"] == "-3.00"
+    assert [row["id"] for row in changes["deleted"]] == [deleted]
+    assert changes["catalog"] is not None
+
+
+@pytest.mark.django_db
+def test_pull_only_the_orders_of_the_optician(device, optician):
+    own = full_order(optician)
+    other = full_order(UserFactory(is_staff=False, is_superuser=False))
+    cursor = pull_all(device)["cursor"]
+    assert [record["id"] for record in pull_all(device)["orders"]] == [own.pk]
+
+    deleted = own.pk
+    own.delete()
+    other.delete()
+
+    assert [row["id"] for row in pull_all(device, cursor)["deleted"]] == [deleted]
+
+
+@pytest.mark.django_db
+def test_pull_takes_a_constant_number_of_queries(
+    device, optician, django_assert_num_queries
+):
+    for _ in range(6):
+        full_order(optician)
+    device.get("/sync/pull/")
+
+    # The user, the orders, their products, the tombstones, the catalog version
+    for limit in (1, 6):
+        with django_assert_num_queries(5):
+            device.get("/sync/pull/", {"limit": limit})
+
+    cursor = device.get("/sync/pull/").json()["cursor"]
+    Order.objects.update(updated_at=Now())
+    with django_assert_num_queries(5):
+        assert len(device.get("/sync/pull/", {"cursor": cursor}).json()["orders"]) == 6
+
+
+@pytest.mark.django_db
+def test_recent_changes_wait_for_the_next_pull(device, optician, monkeypatch):
+    monkeypatch.setattr(sync, "SETTLE_DELAY", datetime.timedelta(minutes=1))
+    full_order(optician)
+
+    assert device.get("/sync/pull/").json()["orders"] == []
+
+
+@pytest.mark.django_db
+def test_pull_is_compressed(device, optician):
+    for _ in range(3):
+        full_order(optician)
+
+    response = device.get("/sync/pull/", HTTP_ACCEPT_ENCODING="gzip")
+
+    assert response["Content-Encoding"] == "gzip"
+    assert len(json.loads(gzip.decompress(response.content))["orders"]) == 3
+
+
+def pushed_order(**overrides):
+    record = {
+        "uuid": str(uuid.uuid4()),
+        "created_at": "2024-03-01T09:30:00+00:00",
+        "identity": {"first_name": "Ana", "last_name": "Popescu"},
+        "contact": {"phone_number": "0722000000"},
+        "products": [
+            {
+                "price": "80.00",
+                "frame": FrameFactory().pk,
+                "glass_type": GlassTypeFactory().pk,
+                "lens": LensFactory().pk,
+            }
+        ],
+    }
+    record.update(overrides)
+    return record
+
+
+def push(client, records, compress=False):
+    body = json.dumps({"orders": records}).encode()
+    headers = {}
+    if compress:
+        body = gzip.compress(body)
+        headers["HTTP_CONTENT_ENCODING"] = "gzip"
+    return client.post("/sync/push/", body, content_type="application/json", **headers)
+
+
+@pytest.mark.django_db
+def test_push_is_idempotent(device):
+    records = [pushed_order(), pushed_order()]
+
+    response = push(device, records, compress=True)
+    assert response.status_code == 200, response.content
+    results = response.json()["orders"]
+    assert [result["created"] for result in results] == [True, True]
+
+    # The answer was lost: the device sends the batch again, with a new order
+    again = push(device, records + [pushed_order()]).json()["orders"]
+    assert [result["created"] for result in again] == [False, False, True]
+    assert [result["id"] for result in again[:2]] == [r["id"] for r in results]
+    assert Order.objects.count() == 3
+
+    order = Order.objects.get(uuid=records[0]["uuid"])
+    assert order.created_at.date() == datetime.date(2024, 3, 1)
+    assert order.total_amount == Decimal("80.00")
+    assert order.customer is not None
+    assert order.identities.last_name == "Popescu"
+
+
+@pytest.mark.django_db
+def test_push_rejects_the_whole_invalid_batch(device):
+    records = [
+        pushed_order(),
+        pushed_order(uuid=None),
+        pushed_order(products=[{}]),
+        pushed_order(identity="Ana"),
+        pushed_order(products=["x"]),
+        pushed_order(products="abc"),
+        pushed_order(contact=[]),
+    ]
+
+    response = push(device, records)
+
+    assert response.status_code == 400
+    errors = response.json()["errors"]
+    assert "1.uuid" in errors
+    assert "2.products.0.frame" in errors
+    assert errors["3.identity"] == ["Expected an object."]
+    assert errors["4.products.0"] == ["Expected an object."]
+    assert errors["5.products"] == ["Expected a list."]
+    assert errors["6.contact"] == ["Expected an object."]
+    assert not Order.objects.exists()
+    assert push(device, "nope").status_code == 400
+    assert device.get("/sync/push/").status_code == 405
@@ -0,0 +1,61 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+from decimal import Decimal
+
+import pytest
+
+from optica_app.factory import (
+    OrderFactory,
+    ProductFactory,
+    VoucherFactory,
+    VoucherLineFactory,
+)
+from optica_app.models import Voucher
+
+
+@pytest.fixture
+def voucher():
+    voucher = VoucherFactory()
+    for _ in range(2):
+        order = OrderFactory()
+        ProductFactory(order=order, price=Decimal("100.00"))
+        ProductFactory(order=order, price=Decimal("25.00"))
+        voucher.orders.add(order)
+    for amount in ("50.00", "30.00", "20.00"):
+        VoucherLineFactory(voucher=voucher, amount=Decimal(amount))
+    return voucher
+
+
+@pytest.mark.django_db
+def test_with_balances_does_not_fan_out(voucher):
+    annotated = Voucher.objects.with_balances().get(pk=voucher.pk)
+
+    assert annotated.orders_total == Decimal("250.00")
+    assert annotated.lines_total == Decimal("100.00")
+    assert annotated.rest_total == Decimal("150.00")
+
+
+@pytest.mark.django_db
+def test_balance_methods_use_annotations(voucher, django_assert_num_queries):
+    VoucherFactory()
+    with django_assert_num_queries(1):
+        vouchers = list(Voucher.objects.with_balances().order_by("pk"))
+        assert [v.rest_amount() for v in vouchers] == [
+            Decimal("150.00"),
+            Decimal("0.00"),
+        ]
+        assert vouchers[0].orders_total_price() == Decimal("250.00")
+        assert vouchers[0].voucher_lines_total_amount() == Decimal("100.00")
+
+
+@pytest.mark.django_db
+def test_balance_methods_without_annotations(voucher):
+    voucher = Voucher.objects.get(pk=voucher.pk)
+
+    assert voucher.orders_total_price() == Decimal("250.00")
+    assert voucher.voucher_lines_total_amount() == Decimal("100.00")
+    assert voucher.rest_amount() == Decimal("150.00")
@@ -0,0 +1,116 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+# Copyright © Simon ANDRÉ <simon@emencia.com>
+# project: AlexandruOpticaApp
+# github: https://github.com/boot-sandre/alexandru-optica-app/
+from decimal import Decimal
+
+import pytest
+
+from optica_app.factory import FrameFactory, GlassTypeFactory, LensFactory, UserFactory
+from optica_app.models import Order, WizardState
+
+MANAGEMENT = "tunnel_wizard-current_step"
+
+
+@pytest.fixture
+def optician(client):
+    user = UserFactory()
+    client.force_login(user)
+    return user
+
+
+def steps():
+    references = {
+        "frame": FrameFactory().pk,
+        "glass_type": GlassTypeFactory().pk,
+        "lens": LensFactory().pk,
+    }
+    return [
+        ("identity", {"first_name": "Ana", "last_name": "Popescu"}),
+        ("contact", {"phone_number": "0722000000"}),
+        ("institution", {"title": "Cămin", "address": "Strada Mare 1"}),
+        ("prescription", {}),
+        (
+            "products",
+            {
+                "TOTAL_FORMS": "3",
+                "INITIAL_FORMS": "0",
+                **{f"0-{name}": pk for name, pk in references.items()},
+                "0-price": "120.00",
+            },
+        ),
+    ]
+
+
+def step_data(step, values):
+    return {MANAGEMENT: step, **{f"{step}-{key}": v for key, v in values.items()}}
+
+
+@pytest.mark.django_db
+def test_wizard_creates_the_order(client, optician):
+    response = client.get("/wizard/")
+    assert response.status_code == 200
+    assert response.context["wizard"]["steps"].current == "identity"
+
+    for step, values in steps():
+        response = client.post("/wizard/", step_data(step, values))
+        if step != "products":
+            assert response.status_code == 200
+            assert not response.context["wizard"]["form"].errors
+            # The browser only holds the token of the stored steps
+            assert len(client.cookies["wizard_tunnel_wizard"].value) < 64
+            stored = WizardState.objects.get().data["step_data"]
+            assert set(stored[step]) == {f"{step}-{key}" for key in values}
+
+    assert response.status_code == 302
+    order = Order.objects.get()
+    assert (order.user, order.total_amount) == (optician, Decimal("120.00"))
+    assert order.identities.last_name == "Popescu"
+    assert order.contacts.phone_number == "0722000000"
+    assert order.products.count() == 1
+    assert not WizardState.objects.exists()
+
+
+@pytest.mark.django_db
+def test_wizard_keeps_the_invalid_step(client, optician):
+    client.get("/wizard/")
+
+    response = client.post("/wizard/", step_data("identity", {"first_name": "Ana"}))
+
+    assert response.context["wizard"]["steps"].current == "identity"
+    assert "last_name" in response.context["wizard"]["form"].errors
+
+
+@pytest.mark.django_db
+def test_wizard_requires_login(client):
+    response = client.get("/wizard/")
+
+    assert response.status_code == 302
+    assert response["Location"].startswith("/admin/login/")
+
+
+@pytest.mark.django_db
+def test_validate_step_answers_only_errors(client, optician):
+    response = client.post(
+        "/wizard/validate/identity/", step_data("identity", {"first_name": "Ana"})
+    )
+    assert response.status_code == 400
+    assert response.json() == {
+        "errors": {"identity-last_name": ["This field is required."]}
+    }
+
+    response = client.post(
+        "/wizard/validate/products/",
+        step_data("products", {"TOTAL_FORMS": "1", "INITIAL_FORMS": "0"}),
+    )
+    assert response.status_code == 400
+    assert response.json()["errors"]["__all__"] == ["Please submit at least 1 form."]
+
+    _, values = steps()[-1]
+    response = client.post("/wizard/validate/products/", step_data("products", values))
+    assert response.json() == {"errors": {}}
+
+    assert client.post("/wizard/validate/unknown/").status_code == 404
+    assert client.get("/wizard/validate/identity/").status_code == 405